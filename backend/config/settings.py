@@ -54,6 +54,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.tenancy.TenantMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -91,6 +92,16 @@ DATABASES = {
     }
 }
 
+# Optional read replica for reporting queries (core.reporting).
+if os.environ.get('POSTGRES_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.environ['POSTGRES_REPLICA_HOST'],
+        'PORT': os.environ.get('POSTGRES_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+REPORTING_DATABASE = 'replica' if 'replica' in DATABASES else 'default'
+
 # Custom User Model
 AUTH_USER_MODEL = 'core.User'
 
@@ -111,6 +122,74 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Cache
+# Shared across workers when REDIS_URL is set; permission sets and other
+# generation-stamped entries rely on it for cross-process invalidation.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Seconds a compiled permission set stays cached (core.rbac).
+RBAC_CACHE_TIMEOUT = int(os.environ.get('RBAC_CACHE_TIMEOUT', 3600))
+
+# Seconds a resolved effective routine stays cached (core.routines).
+ROUTINE_CACHE_TIMEOUT = int(os.environ.get('ROUTINE_CACHE_TIMEOUT', 3600))
+
+# Seconds ticket board counts stay cached (core.boards).
+BOARD_CACHE_TIMEOUT = int(os.environ.get('BOARD_CACHE_TIMEOUT', 30))
+
+# Real-time events (core.events). Redis relays events between workers.
+EVENT_BROKER = 'core.events.RedisBroker' if os.environ.get('REDIS_URL') else 'core.events.InMemoryBroker'
+EVENT_REDIS_URL = os.environ.get('REDIS_URL')
+EVENTS_HEARTBEAT_SECONDS = int(os.environ.get('EVENTS_HEARTBEAT_SECONDS', 15))
+
+# Email. SES or SendGrid plug in through their Django email backends.
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 25))
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', '') == '1'
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'Workaholic <no-reply@localhost>')
+
+# Notification delivery channels, worked off by `manage.py dispatch_notifications`
+# (core.dispatch). RATE_PER_SECOND applies per worker process.
+NOTIFICATION_CHANNELS = {
+    'EMAIL': {
+        'BACKEND': 'core.dispatch.EmailProvider',
+        'BATCH_SIZE': int(os.environ.get('NOTIFICATION_EMAIL_BATCH_SIZE', 50)),
+        'RATE_PER_SECOND': float(os.environ.get('NOTIFICATION_EMAIL_RATE', 10)),
+    },
+}
+if os.environ.get('NOTIFICATION_PUSH_BACKEND'):
+    NOTIFICATION_CHANNELS['PUSH'] = {
+        'BACKEND': os.environ['NOTIFICATION_PUSH_BACKEND'],
+        'BATCH_SIZE': int(os.environ.get('NOTIFICATION_PUSH_BATCH_SIZE', 100)),
+        'RATE_PER_SECOND': float(os.environ.get('NOTIFICATION_PUSH_RATE', 50)),
+    }
+NOTIFICATION_MAX_ATTEMPTS = int(os.environ.get('NOTIFICATION_MAX_ATTEMPTS', 5))
+NOTIFICATION_RETRY_BASE_SECONDS = 30
+NOTIFICATION_RETRY_MAX_SECONDS = 3600
+NOTIFICATION_DELIVERY_LEASE_SECONDS = 300
+
+# Read notifications older than this move to the archive table (core.retention).
+NOTIFICATION_RETENTION_DAYS = int(os.environ.get('NOTIFICATION_RETENTION_DAYS', 90))
+NOTIFICATION_ARCHIVE_CHUNK_SIZE = 1000
+
+# Processes hashing passwords in import and upgrade commands (core.passwords); 0 or 1
+# hashes inline. Defaults to one per CPU.
+PASSWORD_HASH_WORKERS = int(os.environ['PASSWORD_HASH_WORKERS']) if os.environ.get('PASSWORD_HASH_WORKERS') else None
+
 INTERNAL_IPS = [
     "127.0.0.1",
 ]
@@ -120,6 +199,19 @@ INTERNAL_IPS = [
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
+# The first hasher is used for new passwords; any other is replaced on the next
+# login. Legacy MD5 hashes from migrated accounts are wrapped in PBKDF2 by
+# `manage.py upgrade_password_hashes` (core.passwords).
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+    'core.passwords.PBKDF2WrappedMD5PasswordHasher',
+    'django.contrib.auth.hashers.MD5PasswordHasher',
+]
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -153,6 +245,31 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Uploaded files
+MEDIA_URL = 'media/'
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', str(BASE_DIR / 'media'))
+# Files that must never be served, such as queued user imports (core.storage).
+# Keep it outside MEDIA_ROOT.
+PRIVATE_ROOT = os.environ.get('PRIVATE_ROOT', str(BASE_DIR / 'private'))
+
+# Resumable uploads (core.uploads): part files live here until complete.
+UPLOAD_TEMP_DIR = os.environ.get('UPLOAD_TEMP_DIR', os.path.join(PRIVATE_ROOT, 'uploads'))
+UPLOAD_MAX_SIZE = int(os.environ.get('UPLOAD_MAX_SIZE', 512 * 1024 * 1024))
+UPLOAD_MAX_CHUNK_SIZE = int(os.environ.get('UPLOAD_MAX_CHUNK_SIZE', 8 * 1024 * 1024))
+
+# Downloads (core.files): '' streams from the app, 'nginx' hands off with
+# X-Accel-Redirect under DOWNLOAD_ACCEL_PREFIX, 'sendfile' with X-Sendfile.
+DOWNLOAD_SENDFILE_BACKEND = os.environ.get('DOWNLOAD_SENDFILE_BACKEND', '')
+DOWNLOAD_ACCEL_PREFIX = os.environ.get('DOWNLOAD_ACCEL_PREFIX', '/protected-media/')
+
+# Threads for after-commit work such as thumbnails (core.background); 0 runs inline.
+BACKGROUND_WORKERS = int(os.environ.get('BACKGROUND_WORKERS', 2))
+
+# Seconds a RUNNING user import may go without progress before another
+# worker re-claims it (core.user_io).
+USER_IMPORT_STALE_AFTER = int(os.environ.get('USER_IMPORT_STALE_AFTER', 15 * 60))
+THUMBNAIL_SIZE = (256, 256)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -0,0 +1,194 @@
+"""
+Attendance services that work on sets of users and days at once.
+"""
+from django.db import transaction
+from django.db.models import BooleanField, Case, Exists, F, IntegerField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, ExtractHour, ExtractMinute, ExtractSecond, Greatest, NullIf
+from django.db.models.lookups import GreaterThan, LessThan
+from django.utils import timezone
+
+from . import events
+from .models import Attendance, AttendanceCloseout, LeaveRequest, TimeLog, User
+from .reporting import mark_dirty
+from .routines import routine_value
+from .serializers import PunchSerializer
+
+TIMELOG_BATCH_SIZE = 1000
+CLOSEOUT_CHUNK_SIZE = 1000
+
+
+def ingest_punches(punches, company=None):
+    """
+    Store a batch of punches with a constant number of queries: validate every
+    row, upsert the (user, date) Attendance rows, bulk insert the TimeLogs and
+    recompute each touched day once. Invalid rows are reported by index and
+    skipped; the rest of the batch is still stored.
+
+    Returns {'received', 'created', 'errors'}.
+    """
+    errors = []
+    valid = []
+    for index, row in enumerate(punches):
+        serializer = PunchSerializer(data=row)
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            errors.append({'index': index, 'errors': serializer.errors})
+
+    users = User.objects.filter(pk__in={data['user_id'] for _, data in valid})
+    if company is not None:
+        users = users.filter(company=company)
+    known = set(users.values_list('pk', flat=True))
+    punches_by_day = []
+    for index, data in valid:
+        if data['user_id'] not in known:
+            errors.append({'index': index, 'errors': {'user_id': ['Unknown user.']}})
+            continue
+        punches_by_day.append(((data['user_id'], timezone.localdate(data['check_in'])), data))
+
+    created = 0
+    if punches_by_day:
+        days = {key for key, _ in punches_by_day}
+        with transaction.atomic():
+            Attendance.objects.bulk_create(
+                [Attendance(user_id=user_id, date=date) for user_id, date in days],
+                ignore_conflicts=True,
+            )
+            attendance_ids = {
+                (user_id, date): pk
+                for pk, user_id, date in Attendance.objects.filter(
+                    user_id__in={user_id for user_id, _ in days},
+                    date__in={date for _, date in days},
+                ).values_list('pk', 'user_id', 'date')
+            }
+            logs = TimeLog.objects.bulk_create([
+                TimeLog(
+                    attendance_id=attendance_ids[key],
+                    check_in=data['check_in'],
+                    check_out=data.get('check_out'),
+                    check_in_reason=data['check_in_reason'],
+                    check_out_reason=data['check_out_reason'],
+                )
+                for key, data in punches_by_day
+            ], batch_size=TIMELOG_BATCH_SIZE)
+            Attendance.recompute_summaries({attendance_ids[key] for key in days})
+            # bulk_create skips post_save, so each user gets one event for the batch.
+            punches_by_user = {}
+            for ((user_id, _), _), log in zip(punches_by_day, logs):
+                punches_by_user.setdefault(user_id, []).append({
+                    'attendance_id': log.attendance_id, 'timelog_id': log.pk,
+                    'check_in': log.check_in, 'check_out': log.check_out,
+                })
+            for user_id, user_punches in punches_by_user.items():
+                events.publish([user_id], 'attendance.punches', {'punches': user_punches})
+        created = len(logs)
+
+    errors.sort(key=lambda error: error['index'])
+    return {'received': len(punches), 'created': created, 'errors': errors}
+
+
+# --- Nightly close-out -------------------------------------------------------
+
+def _seconds_of_day(expression, tzinfo=None):
+    return (
+        ExtractHour(expression, tzinfo=tzinfo) * 3600
+        + ExtractMinute(expression, tzinfo=tzinfo) * 60
+        + ExtractSecond(expression, tzinfo=tzinfo)
+    )
+
+
+def closeout_updates(date):
+    """
+    UPDATE assignments deriving lateness, absence, half days, leave and
+    overtime for every Attendance row of `date` from its TimeLogs, the
+    effective routine and approved leave, entirely in SQL.
+    """
+    tzinfo = timezone.get_current_timezone()
+    first_check_in = Subquery(
+        TimeLog.objects.filter(attendance_id=OuterRef('pk')).order_by('check_in').values('check_in')[:1]
+    )
+    has_logs = Exists(TimeLog.objects.filter(attendance_id=OuterRef('pk')))
+    on_leave = Exists(LeaveRequest.objects.filter(
+        user_id=OuterRef('user_id'),
+        status=LeaveRequest.STATUS_APPROVED,
+        start_date__lte=date,
+        end_date__gte=date,
+    ))
+    def routine(field):
+        return routine_value(field, date, user_ref='user_id')
+
+    late_after = _seconds_of_day(routine('start_time')) + routine('late_grace_period_seconds')
+    minimum = NullIf(routine('minimum_work_hours_seconds'), Value(0))
+    overtime_after = Coalesce(
+        NullIf(routine('maximum_work_hours_seconds'), Value(0)),
+        Value(Attendance.STANDARD_WORK_SECONDS),
+    )
+    worked = F('total_worked_seconds')
+    return {
+        'is_late': Case(
+            When(Q(has_logs) & GreaterThan(_seconds_of_day(first_check_in, tzinfo), late_after), then=Value(True)),
+            default=Value(False),
+            output_field=BooleanField(),
+        ),
+        'is_absent': Case(
+            When(on_leave, then=Value(False)),
+            When(~has_logs, then=Value(True)),
+            default=Value(False),
+            output_field=BooleanField(),
+        ),
+        'overtime_seconds': Case(
+            When(on_leave, then=Value(0)),
+            default=Greatest(worked - overtime_after, Value(0)),
+            output_field=IntegerField(),
+        ),
+        'status': Case(
+            When(on_leave, then=Value(Attendance.STATUS_LEAVE)),
+            When(~has_logs, then=Value(Attendance.STATUS_ABSENT)),
+            When(LessThan(worked, minimum), then=Value(Attendance.STATUS_HALF_DAY)),
+            When(GreaterThan(worked, overtime_after), then=Value(Attendance.STATUS_OVERTIME)),
+            default=Value(Attendance.STATUS_PRESENT),
+        ),
+    }
+
+
+def close_attendance_chunk(user_ids, date):
+    """Create missing Attendance rows for `date` and close them out with one UPDATE."""
+    Attendance.objects.bulk_create(
+        [Attendance(user_id=user_id, date=date) for user_id in user_ids],
+        ignore_conflicts=True,
+    )
+    updated = Attendance.objects.filter(user_id__in=user_ids, date=date).update(**closeout_updates(date))
+    mark_dirty((user_id, date) for user_id in user_ids)
+    return updated
+
+
+def close_attendance_day(company, date, chunk_size=CLOSEOUT_CHUNK_SIZE, restart=False):
+    """
+    Close out `date` for every active employee of `company`, `chunk_size`
+    users per transaction. Progress is committed with each chunk, so a rerun
+    after an interruption resumes from the last finished chunk; completed
+    runs are skipped unless `restart` is set.
+    """
+    run, _ = AttendanceCloseout.objects.get_or_create(company=company, date=date)
+    if restart:
+        run.last_user_id, run.processed, run.completed_at = 0, 0, None
+        run.save(update_fields=['last_user_id', 'processed', 'completed_at'])
+    if run.completed_at:
+        return run
+
+    employees = User.all_objects.filter(
+        company=company, is_active=True, is_deleted=False, employee__isnull=False,
+    ).order_by('pk')
+    while True:
+        user_ids = list(employees.filter(pk__gt=run.last_user_id).values_list('pk', flat=True)[:chunk_size])
+        if not user_ids:
+            break
+        with transaction.atomic():
+            close_attendance_chunk(user_ids, date)
+            run.last_user_id = user_ids[-1]
+            run.processed += len(user_ids)
+            run.save(update_fields=['last_user_id', 'processed'])
+
+    run.completed_at = timezone.now()
+    run.save(update_fields=['completed_at'])
+    return run
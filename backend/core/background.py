@@ -0,0 +1,46 @@
+"""
+After-commit background work.
+
+`defer()` hands a callable to a small thread pool once the current transaction
+commits, so slow follow-up work (image resizing and the like) never runs on the
+request thread. BACKGROUND_WORKERS=0 runs the callable inline instead, which is
+what tests and management commands want.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.BACKGROUND_WORKERS, thread_name_prefix='background')
+    return _executor
+
+
+def _run(func, args):
+    close_old_connections()
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Background task %s failed', getattr(func, '__name__', func))
+    finally:
+        close_old_connections()
+
+
+def run_in_background(func, *args):
+    if getattr(settings, 'BACKGROUND_WORKERS', 0) <= 0:
+        func(*args)
+        return
+    _pool().submit(_run, func, args)
+
+
+def defer(func, *args):
+    """Run `func(*args)` in the background after the current transaction commits."""
+    transaction.on_commit(lambda: run_in_background(func, *args))
@@ -0,0 +1,97 @@
+"""
+Reference counting and garbage collection for attachment blobs.
+
+Every TicketAttachement with a content hash holds one reference on the
+AttachmentBlob of that hash from the moment its row is inserted until it is
+hard-deleted. Soft-deleted attachments keep their reference until
+`collect_garbage` purges them after the retention period; blobs left with no
+references are then deleted from storage.
+"""
+import datetime
+import re
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import AttachmentBlob, TicketAttachement
+from .storage import BLOB_PREFIX
+
+BLOB_NAME_RE = re.compile(rf'^{BLOB_PREFIX}/[0-9a-f]{{2}}/[0-9a-f]{{2}}/([0-9a-f]{{64}})$')
+
+GC_CHUNK_SIZE = 500
+# Unreferenced blobs younger than this may belong to an upload in flight.
+GC_GRACE = datetime.timedelta(hours=1)
+
+
+def acquire(sha256, name, size=None):
+    """Take one reference on the blob, creating its row on first use."""
+    updated = AttachmentBlob.objects.filter(pk=sha256).update(refcount=F('refcount') + 1, updated_at=timezone.now())
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            AttachmentBlob.objects.create(sha256=sha256, name=name, size=size, refcount=1)
+    except IntegrityError:
+        AttachmentBlob.objects.filter(pk=sha256).update(refcount=F('refcount') + 1, updated_at=timezone.now())
+
+
+def hold(sha256):
+    """Keep an existing blob out of collection for GC_GRACE while an upload stores and references it."""
+    AttachmentBlob.objects.filter(pk=sha256).update(updated_at=timezone.now())
+
+
+def release(sha256):
+    AttachmentBlob.objects.filter(pk=sha256).update(refcount=F('refcount') - 1, updated_at=timezone.now())
+
+
+def record_attachment(attachment):
+    """Reference the blob of a new attachment, deriving its hash from a blob name if unset."""
+    digest = attachment.content_hash
+    if not digest:
+        match = BLOB_NAME_RE.match(attachment.attachement.name or '')
+        if match is None:
+            return
+        digest = match.group(1)
+        TicketAttachement.all_objects.filter(pk=attachment.pk).update(content_hash=digest)
+        attachment.content_hash = digest
+    acquire(digest, attachment.attachement.name, attachment.size)
+
+
+def purge_deleted_attachments(retention, chunk_size=GC_CHUNK_SIZE):
+    """Hard-delete attachments soft-deleted more than `retention` ago; their references go with them."""
+    cutoff = timezone.now() - retention
+    doomed = TicketAttachement.all_objects.filter(is_deleted=True, updated_at__lt=cutoff).order_by('pk')
+    purged = 0
+    while True:
+        chunk = list(doomed.values_list('pk', flat=True)[:chunk_size])
+        if not chunk:
+            return purged
+        with transaction.atomic():
+            TicketAttachement.all_objects.filter(pk__in=chunk).delete()
+        purged += len(chunk)
+
+
+def collect_garbage(retention, grace=GC_GRACE, chunk_size=GC_CHUNK_SIZE):
+    """
+    Purge expired soft-deleted attachments, then delete unreferenced blobs.
+    Returns (attachments purged, blobs deleted).
+    """
+    storage = TicketAttachement._meta.get_field('attachement').storage
+    purged = purge_deleted_attachments(retention, chunk_size)
+    cutoff = timezone.now() - grace
+    candidates = AttachmentBlob.objects.filter(refcount__lte=0, updated_at__lt=cutoff).values_list('pk', flat=True)
+    deleted = 0
+    for sha256 in list(candidates.iterator(chunk_size=chunk_size)):
+        with transaction.atomic():
+            # Locked and re-checked: a concurrent upload holds this row before
+            # storing its bytes and takes its reference through it after.
+            blob = AttachmentBlob.objects.select_for_update().filter(
+                pk=sha256, refcount__lte=0, updated_at__lt=cutoff,
+            ).first()
+            if blob is None:
+                continue
+            storage.delete(blob.name)
+            blob.delete()
+            deleted += 1
+    return purged, deleted
@@ -0,0 +1,78 @@
+"""
+Ticket board facets: counts by status, priority and assignee.
+
+All facets come from one UNION ALL of grouped queries over the
+(project, status, priority) index, cached for BOARD_CACHE_TIMEOUT seconds under
+keys stamped with each project's board generation. Ticket and assignee writes
+bump the generation; bulk `update()`s that skip signals are bounded by the TTL.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import CharField, Count, F, Value
+from django.db.models.functions import Cast
+
+from . import rbac
+from .caching import bump_generations, get_generations
+from .models import Project, Ticket, TicketAssignee
+
+BOARD_PERMISSION = 'project.view'
+FACET_TOTAL = 'total'
+FACETS = ('status', 'priority', 'assignee')
+
+
+def _facet(queryset, name, value):
+    return queryset.order_by().annotate(
+        facet=Value(name, output_field=CharField()), value=value,
+    ).values('facet', 'value').annotate(count=Count('pk'))
+
+
+def count_facets(project_ids):
+    """{'total': n, 'status': {...}, 'priority': {...}, 'assignee': {user_id: n}} in one query."""
+    tickets = Ticket.all_objects.filter(project_id__in=project_ids, is_deleted=False)
+    assignments = TicketAssignee.objects.filter(
+        ticket__project_id__in=project_ids, ticket__is_deleted=False, is_active=True, is_deleted=False,
+    )
+    rows = _facet(tickets, FACET_TOTAL, Value('', output_field=CharField())).union(
+        _facet(tickets, 'status', F('status')),
+        _facet(tickets, 'priority', F('priority')),
+        _facet(assignments, 'assignee', Cast('user_id', CharField())),
+        all=True,
+    )
+    counts = {FACET_TOTAL: 0, **{facet: {} for facet in FACETS}}
+    for row in rows:
+        if row['facet'] == FACET_TOTAL:
+            counts[FACET_TOTAL] = row['count']
+        elif row['facet'] == 'assignee':
+            counts['assignee'][int(row['value'])] = row['count']
+        else:
+            counts[row['facet']][row['value']] = row['count']
+    return counts
+
+
+def _cache_key(project_ids):
+    generations = get_generations(*[('board', pk) for pk in project_ids])
+    stamp = ','.join(f'{pk}:{generation}' for pk, generation in zip(project_ids, generations))
+    return f'board:{hashlib.sha1(stamp.encode()).hexdigest()}'
+
+
+def board_counts(project_ids):
+    """Cached `count_facets` for a set of project ids."""
+    project_ids = sorted(set(project_ids))
+    if not project_ids:
+        return count_facets([])
+    key = _cache_key(project_ids)
+    counts = cache.get(key)
+    if counts is None:
+        counts = count_facets(project_ids)
+        cache.set(key, counts, getattr(settings, 'BOARD_CACHE_TIMEOUT', 30))
+    return counts
+
+
+def visible_project_ids(user):
+    return list(rbac.filter_permitted(Project.objects.all(), user, BOARD_PERMISSION).values_list('pk', flat=True))
+
+
+def invalidate(project_ids):
+    bump_generations(('board', pk) for pk in project_ids if pk is not None)
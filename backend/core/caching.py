@@ -0,0 +1,44 @@
+"""
+Generation counters for version-stamped cache keys.
+
+Cached values embed the current generation of every object they depend on.
+Bumping a generation makes those keys unreachable, so entries go stale on their
+own and expire through the cache's normal eviction instead of a global flush.
+"""
+import time
+
+from django.core.cache import cache
+
+
+def generation_key(namespace, pk):
+    return f'gen:{namespace}:{pk}'
+
+
+def _seed():
+    # A missing counter (never set, or evicted) restarts from a value that no
+    # previously issued key can contain.
+    return int(time.time() * 1000000)
+
+
+def get_generations(*keys):
+    """Current generation for each (namespace, pk) pair, in order."""
+    names = [generation_key(namespace, pk) for namespace, pk in keys]
+    found = cache.get_many(names)
+    result = []
+    for name in names:
+        value = found.get(name)
+        if value is None:
+            cache.add(name, _seed(), timeout=None)
+            value = cache.get(name)
+        result.append(value)
+    return tuple(result)
+
+
+def bump_generations(keys):
+    """Advance the generation of every (namespace, pk) pair in `keys`."""
+    for namespace, pk in set(keys):
+        name = generation_key(namespace, pk)
+        try:
+            cache.incr(name)
+        except ValueError:
+            cache.add(name, _seed(), timeout=None)
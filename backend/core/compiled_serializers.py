@@ -0,0 +1,158 @@
+"""
+Precompiled read paths for DRF serializers on hot list endpoints.
+
+`Serializer.to_representation` re-walks its bound fields for every object,
+resolving each through `get_attribute` with its try/except and PKOnlyObject
+handling, and nested serializers repeat that per relation. `compile_fields()`
+does that introspection once per response: every readable field becomes a
+(name, getter, convert) step, where plain model columns are read with
+`operator.attrgetter` and converted without DRF's generic checks for the
+common column types, foreign keys rendered as primary keys read the `_id`
+column straight off the row, and nested serializers compile recursively.
+Anything else (method fields, custom fields, serializers overriding
+`to_representation`) keeps DRF's own code path, so output is identical to the
+serializer's; core.tests holds the parity suite and
+`manage.py benchmark_serializers` measures the gain.
+"""
+import datetime
+from operator import attrgetter
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from rest_framework import ISO_8601, fields, serializers
+from rest_framework.fields import SkipField
+from rest_framework.relations import PKOnlyObject, PrimaryKeyRelatedField
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+
+def _model_field(serializer, source):
+    model = getattr(getattr(serializer, 'Meta', None), 'model', None)
+    if model is None:
+        return None
+    try:
+        return model._meta.get_field(source)
+    except FieldDoesNotExist:
+        return None
+
+
+def _drf_step(field):
+    """DRF's own per-field logic from Serializer.to_representation."""
+    def render(instance):
+        attribute = field.get_attribute(instance)
+        check_for_none = attribute.pk if isinstance(attribute, PKOnlyObject) else attribute
+        return None if check_for_none is None else field.to_representation(attribute)
+    return render
+
+
+def _converter(field):
+    """`field.to_representation`, short-circuited for the column types DRF renders trivially."""
+    represent = type(field).to_representation
+    if represent is fields.CharField.to_representation:
+        return str
+    if represent is fields.IntegerField.to_representation:
+        return int
+    if represent is fields.BooleanField.to_representation:
+        return lambda value: value if value.__class__ is bool else field.to_representation(value)
+    if represent is fields.DateTimeField.to_representation:
+        output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+        zone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+        if output_format is None or output_format.lower() != ISO_8601 or zone is None:
+            return field.to_representation
+
+        def iso_datetime(value):
+            if value.__class__ is not datetime.datetime or value.utcoffset() is None:
+                return field.to_representation(value)
+            text = value.astimezone(zone).isoformat()
+            return text[:-6] + 'Z' if text.endswith('+00:00') else text
+        return iso_datetime
+    return field.to_representation
+
+
+def _step(serializer, field):
+    source = field.source_attrs[0] if len(field.source_attrs) == 1 else None
+    model_field = _model_field(serializer, source) if source else None
+
+    if isinstance(field, serializers.ListSerializer):
+        child = compile_fields(field.child)
+        if source is None or model_field is None:
+            return _drf_step(field)
+        getter = attrgetter(source)
+
+        def render_many(instance):
+            related = getter(instance)
+            if related is None:
+                return None
+            iterable = related.all() if isinstance(related, models.manager.BaseManager) else related
+            return [child(item) for item in iterable]
+        return render_many
+
+    if isinstance(field, serializers.BaseSerializer):
+        child = compile_fields(field)
+        # Forward relations only: a missing reverse one-to-one raises, which DRF maps to None.
+        if source is None or model_field is None or not (model_field.is_relation and model_field.concrete):
+            return _drf_step(field)
+        getter = attrgetter(source)
+
+        def render_nested(instance):
+            related = getter(instance)
+            return None if related is None else child(related)
+        return render_nested
+
+    if model_field is None or not model_field.concrete:
+        return _drf_step(field)
+
+    if isinstance(field, PrimaryKeyRelatedField):
+        if field.pk_field is not None or not field.use_pk_only_optimization() or not model_field.many_to_one:
+            return _drf_step(field)
+        return attrgetter(model_field.attname)
+
+    if model_field.is_relation:
+        return _drf_step(field)
+    getter = attrgetter(source)
+    convert = _converter(field)
+
+    def render_value(instance):
+        value = getter(instance)
+        return None if value is None else convert(value)
+    return render_value
+
+
+def compile_fields(serializer):
+    """A function rendering one instance exactly as `serializer.to_representation` would."""
+    if type(serializer).to_representation is not serializers.Serializer.to_representation:
+        return serializer.to_representation
+    steps = [(field.field_name, _step(serializer, field)) for field in serializer._readable_fields]
+
+    def render(instance):
+        row = {}
+        for name, step in steps:
+            try:
+                row[name] = step(instance)
+            except SkipField:
+                continue
+        return row
+    return render
+
+
+def serialize_list(root):
+    """The `.data` of the ListSerializer `root` (over a list), compiled."""
+    render = compile_fields(root.child)
+    return [render(instance) for instance in root.instance]
+
+
+def serialize_many(serializer_class, instances, context=None):
+    """The `.data` of `serializer_class(instances, many=True, context=context)`, compiled."""
+    return serialize_list(serializer_class(list(instances), many=True, context=context or {}))
+
+
+class CompiledListMixin:
+    """
+    Renders `list` pages through the compiled path instead of the serializer's.
+    The serializer still comes from `get_serializer`, so views may adjust its fields.
+    """
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        rows = serialize_list(self.get_serializer(list(queryset) if page is None else page, many=True))
+        return Response(rows) if page is None else self.get_paginated_response(rows)
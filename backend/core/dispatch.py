@@ -0,0 +1,217 @@
+"""
+Background delivery of notifications over email and push.
+
+Creating a Notification only inserts NotificationDelivery rows, one per
+configured channel, in the same transaction; the request never waits on a
+provider. The `dispatch_notifications` worker claims due rows in batches of
+the channel's BATCH_SIZE (skipping rows other workers hold), sends each batch
+through the channel's provider within RATE_PER_SECOND, and reschedules
+failures with exponential backoff. After NOTIFICATION_MAX_ATTEMPTS a delivery
+moves to the DeadLetterDelivery table.
+
+Channels are configured in settings.NOTIFICATION_CHANNELS. EmailProvider sends
+through Django's email backend, so SMTP, SES or SendGrid is a matter of
+EMAIL_BACKEND, and tests get the locmem outbox; StubProvider records messages
+in memory.
+"""
+import abc
+import datetime
+import logging
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core import mail
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import DeadLetterDelivery, NotificationDelivery
+
+logger = logging.getLogger(__name__)
+
+ENQUEUE_BATCH_SIZE = 1000
+
+Message = namedtuple('Message', 'delivery_id user_id address title body type')
+
+
+class RateLimiter:
+    """Spaces out sends so a provider sees at most `rate` messages per second."""
+    def __init__(self, rate=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.clock = clock
+        self.sleep = sleep
+        self._next = 0.0
+
+    def acquire(self, count):
+        if not self.rate:
+            return
+        now = self.clock()
+        if self._next > now:
+            self.sleep(self._next - now)
+            now = self._next
+        self._next = now + count / self.rate
+
+
+class Provider(abc.ABC):
+    """Sends batches of Messages for one channel."""
+    def __init__(self, batch_size=50, rate_per_second=None):
+        self.batch_size = batch_size
+        self.limiter = RateLimiter(rate_per_second)
+
+    def address(self, user):
+        """Where to reach `user`, or '' to skip them."""
+        return str(user.pk) if user.is_active else ''
+
+    @abc.abstractmethod
+    def send_batch(self, messages):
+        """Send `messages`; return one error string (or None on success) per message."""
+
+
+class EmailProvider(Provider):
+    def address(self, user):
+        return user.email if user.is_active else ''
+
+    def send_batch(self, messages):
+        errors = []
+        # One connection per batch rather than per message.
+        with mail.get_connection() as connection:
+            for message in messages:
+                try:
+                    mail.EmailMessage(message.title, message.body, to=[message.address], connection=connection).send()
+                    errors.append(None)
+                except Exception as exc:
+                    errors.append(str(exc) or exc.__class__.__name__)
+        return errors
+
+
+class StubProvider(Provider):
+    """Keeps messages in `outbox`; addresses listed in `failing` fail. For tests and development."""
+    outbox = []
+    failing = set()
+
+    def send_batch(self, messages):
+        errors = []
+        for message in messages:
+            if message.address in self.failing:
+                errors.append('Stub delivery failed')
+            else:
+                self.outbox.append(message)
+                errors.append(None)
+        return errors
+
+
+_providers = {}
+
+
+def get_provider(channel):
+    if channel not in _providers:
+        config = settings.NOTIFICATION_CHANNELS[channel]
+        _providers[channel] = import_string(config['BACKEND'])(
+            batch_size=config.get('BATCH_SIZE', 50), rate_per_second=config.get('RATE_PER_SECOND'),
+        )
+    return _providers[channel]
+
+
+def enqueue(notifications):
+    """Queue `notifications` on every configured channel. One INSERT per batch."""
+    channels = list(getattr(settings, 'NOTIFICATION_CHANNELS', {}))
+    deliveries = [
+        NotificationDelivery(notification_id=notification.pk, channel=channel)
+        for notification in notifications if notification.pk is not None
+        for channel in channels
+    ]
+    if deliveries:
+        NotificationDelivery.objects.bulk_create(deliveries, batch_size=ENQUEUE_BATCH_SIZE, ignore_conflicts=True)
+
+
+def backoff(attempts):
+    """Delay before retry number `attempts` + 1."""
+    delay = settings.NOTIFICATION_RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0)
+    return datetime.timedelta(seconds=min(delay, settings.NOTIFICATION_RETRY_MAX_SECONDS))
+
+
+def claim(channel, limit, now=None):
+    """Lease up to `limit` due deliveries for `channel` and count the attempt."""
+    now = now or timezone.now()
+    with transaction.atomic():
+        ids = list(
+            NotificationDelivery.objects.select_for_update(skip_locked=True).filter(
+                channel=channel, status=NotificationDelivery.STATUS_PENDING, next_attempt_at__lte=now,
+            ).order_by('next_attempt_at', 'pk').values_list('pk', flat=True)[:limit]
+        )
+        NotificationDelivery.objects.filter(pk__in=ids).update(
+            attempts=F('attempts') + 1,
+            next_attempt_at=now + datetime.timedelta(seconds=settings.NOTIFICATION_DELIVERY_LEASE_SECONDS),
+        )
+    return list(NotificationDelivery.objects.filter(pk__in=ids).select_related('notification__user').order_by('pk'))
+
+
+def _message(provider, delivery):
+    notification = delivery.notification
+    return Message(
+        delivery.pk, notification.user_id, provider.address(notification.user),
+        notification.title, notification.message, notification.type,
+    )
+
+
+def dispatch_batch(channel, provider=None, now=None):
+    """Claim and send one batch for `channel`. Returns the number of deliveries claimed."""
+    provider = provider or get_provider(channel)
+    deliveries = claim(channel, provider.batch_size, now)
+    if not deliveries:
+        return 0
+    messages = [_message(provider, delivery) for delivery in deliveries]
+    skipped = [message.delivery_id for message in messages if not message.address]
+    sendable = [message for message in messages if message.address]
+    errors = []
+    if sendable:
+        provider.limiter.acquire(len(sendable))
+        try:
+            errors = provider.send_batch(sendable)
+        except Exception as exc:
+            logger.exception('%s provider failed a batch of %d', channel, len(sendable))
+            errors = [str(exc) or exc.__class__.__name__] * len(sendable)
+    _record(deliveries, skipped, list(zip(sendable, errors)), now or timezone.now())
+    return len(deliveries)
+
+
+def _record(deliveries, skipped, results, now):
+    by_id = {delivery.pk: delivery for delivery in deliveries}
+    sent = [message.delivery_id for message, error in results if error is None]
+    failed = [(by_id[message.delivery_id], message, error) for message, error in results if error is not None]
+    dead = [item for item in failed if item[0].attempts >= settings.NOTIFICATION_MAX_ATTEMPTS]
+    with transaction.atomic():
+        NotificationDelivery.objects.filter(pk__in=sent).update(
+            status=NotificationDelivery.STATUS_SENT, sent_at=now, last_error='',
+        )
+        NotificationDelivery.objects.filter(pk__in=skipped).update(status=NotificationDelivery.STATUS_SKIPPED)
+        for delivery, message, error in failed:
+            if delivery.attempts < settings.NOTIFICATION_MAX_ATTEMPTS:
+                NotificationDelivery.objects.filter(pk=delivery.pk).update(
+                    next_attempt_at=now + backoff(delivery.attempts), last_error=error,
+                )
+        if dead:
+            DeadLetterDelivery.objects.bulk_create([
+                DeadLetterDelivery(
+                    notification_id=delivery.notification_id, user_id=message.user_id, channel=delivery.channel,
+                    payload={'address': message.address, 'title': message.title, 'message': message.body, 'type': message.type},
+                    attempts=delivery.attempts, error=error,
+                )
+                for delivery, message, error in dead
+            ])
+            NotificationDelivery.objects.filter(pk__in=[delivery.pk for delivery, _, _ in dead]).delete()
+
+
+def dispatch_pending(channels=None):
+    """Send everything due now on `channels` (default all). Returns the number of deliveries handled."""
+    handled = 0
+    for channel in channels or settings.NOTIFICATION_CHANNELS:
+        provider = get_provider(channel)
+        while True:
+            claimed = dispatch_batch(channel, provider)
+            handled += claimed
+            if claimed < provider.batch_size:
+                break
+    return handled
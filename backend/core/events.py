@@ -0,0 +1,169 @@
+"""
+Real-time events for connected clients.
+
+Server code publishes small JSON events to user ids with `publish()` (after
+the current transaction commits); the SSE endpoint in core.views subscribes
+one bounded asyncio queue per open connection. An idle connection costs a
+queue and a periodic heartbeat, not a request every few seconds.
+
+The broker is pluggable through settings.EVENT_BROKER. InMemoryBroker delivers
+within one process; RedisBroker relays through Redis pub/sub so events reach
+connections held by any worker; its relay thread reconnects with backoff when
+the Redis connection drops (events published meanwhile are lost).
+"""
+import asyncio
+import itertools
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = 100
+
+
+class Subscription:
+    """Queue of events for one connection, fed from any thread."""
+    def __init__(self, user_id, loop, maxsize=QUEUE_SIZE):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def _put(self, event):
+        if self.queue.full():
+            # A slow client loses its oldest events rather than stalling others.
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    def deliver(self, event):
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    async def get(self, timeout):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class InMemoryBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+        self._ids = itertools.count(1)
+
+    def subscribe(self, user_id, loop=None):
+        subscription = Subscription(user_id, loop or asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def connection_count(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def deliver(self, user_ids, event):
+        """Hand `event` to this process's connections for `user_ids`."""
+        with self._lock:
+            targets = [s for user_id in user_ids for s in self._subscriptions.get(user_id, ())]
+        for subscription in targets:
+            try:
+                subscription.deliver(event)
+            except RuntimeError:
+                # The connection's event loop has closed.
+                self.unsubscribe(subscription)
+
+    def publish(self, user_ids, event):
+        self.deliver(user_ids, {'id': next(self._ids), **event})
+
+
+class RedisBroker(InMemoryBroker):
+    """Publishes through a Redis channel; every process relays it to its own connections."""
+    channel = 'workaholic:events'
+    reconnect_delay = 0.5
+    max_reconnect_delay = 30
+
+    def __init__(self, url=None):
+        super().__init__()
+        import redis
+        self._redis = redis.Redis.from_url(url or settings.EVENT_REDIS_URL)
+        self._listener = None
+
+    def _listen(self):
+        delay = self.reconnect_delay
+        while True:
+            pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(self.channel)
+                delay = self.reconnect_delay
+                for message in pubsub.listen():
+                    self._relay(message)
+            except Exception:
+                logger.warning('Event relay lost Redis, reconnecting in %.1fs', delay, exc_info=True)
+            finally:
+                pubsub.close()
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    def _relay(self, message):
+        try:
+            payload = json.loads(message['data'])
+            self.deliver(payload['users'], payload['event'])
+        except (KeyError, TypeError, ValueError):
+            logger.warning('Dropped malformed event message')
+
+    def subscribe(self, user_id, loop=None):
+        if self._listener is None:
+            with self._lock:
+                if self._listener is None:
+                    self._listener = threading.Thread(target=self._listen, name='event-relay', daemon=True)
+                    self._listener.start()
+        return super().subscribe(user_id, loop)
+
+    def publish(self, user_ids, event):
+        event = {'id': next(self._ids), **event}
+        self._redis.publish(self.channel, json.dumps({'users': list(user_ids), 'event': event}, default=str))
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(getattr(settings, 'EVENT_BROKER', 'core.events.InMemoryBroker'))()
+    return _broker
+
+
+def publish(user_ids, event_type, data):
+    """Send `data` as an `event_type` event to `user_ids` once the transaction commits."""
+    user_ids = sorted({getattr(user, 'pk', user) for user in user_ids if user is not None})
+    if not user_ids:
+        return
+    event = {'type': event_type, 'data': data}
+    transaction.on_commit(lambda: _send(user_ids, event))
+
+
+def _send(user_ids, event):
+    # Delivery is best effort and must never fail the request that committed.
+    try:
+        get_broker().publish(user_ids, event)
+    except Exception:
+        logger.exception('Could not publish %s event', event['type'])
+
+
+def format_sse(event):
+    data = json.dumps(event['data'], default=str)
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n"
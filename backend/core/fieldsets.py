@@ -0,0 +1,175 @@
+"""
+Sparse fieldsets and expandable relations for API resources.
+
+`?fields=id,name` limits the rendered fields (the primary key is always
+kept) and `?expand=client` names the relations to embed; dotted paths reach
+into embedded relations (`?fields=id,project.name&expand=project`). Without
+either parameter responses are unchanged. With one, every nested relation
+not expanded renders as its primary key (a list of them for many-valued
+ones), so `?fields=id,name` or `?expand=` returns a flat resource.
+
+The pruned serializer also decides the query: `.only()` the columns it reads
+(plus what pagination needs), `select_related` for expanded forward
+relations and prefetches only for the many-valued ones it renders. A level
+rendering something other than model fields (a property, `source='*'`) keeps
+all its columns; views list the queryset methods such fields need in
+`sparse_prefetches`, e.g. {'assigned_to': 'with_assignees'}.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.relations import PrimaryKeyRelatedField
+
+SPARSE_ACTIONS = ('list', 'retrieve')
+
+
+def parse_paths(value):
+    """'a,b.c,b.d' -> {'a': {}, 'b': {'c': {}, 'd': {}}}"""
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for part in filter(None, (part.strip() for part in path.split('.'))):
+            node = node.setdefault(part, {})
+    return tree
+
+
+def _unwrap(field):
+    return field.child if isinstance(field, serializers.ListSerializer) else field
+
+
+def _pk_name(serializer):
+    model = getattr(getattr(serializer, 'Meta', None), 'model', None)
+    return model._meta.pk.name if model is not None else None
+
+
+def prune(serializer, fields, expand, path=''):
+    """
+    Drop the readable fields of `serializer` not in `fields` (None keeps all)
+    and collapse nested serializers not in `expand` to primary keys.
+    """
+    readable = {name for name, field in serializer.fields.items() if not field.write_only}
+    unknown = sorted(set(fields or ()) - readable)
+    if unknown:
+        raise ValidationError({'fields': [f'Unknown field: {path}{name}.' for name in unknown]})
+    not_nested = sorted(name for name in expand if name not in readable or not isinstance(
+        _unwrap(serializer.fields[name]), serializers.BaseSerializer,
+    ))
+    if not_nested:
+        raise ValidationError({'expand': [f'Cannot expand {path}{name}.' for name in not_nested]})
+
+    pk_name = _pk_name(serializer)
+    for name in readable:
+        field = serializer.fields[name]
+        if fields and name not in fields and name != pk_name:
+            del serializer.fields[name]
+            continue
+        nested = _unwrap(field)
+        if not isinstance(nested, serializers.BaseSerializer):
+            continue
+        selected = (fields or {}).get(name)
+        if name in expand or selected:
+            prune(nested, selected or None, expand.get(name, {}), f'{path}{name}.')
+        else:
+            source = {} if field.source == name else {'source': field.source}
+            many = isinstance(field, serializers.ListSerializer)
+            serializer.fields[name] = PrimaryKeyRelatedField(read_only=True, many=many, **source)
+
+
+class QueryPlan:
+    def __init__(self):
+        self.only = []
+        self.select_related = set()
+        self.prefetch_related = set()
+        self.methods = []
+        self.restricted = True
+
+
+def _plan(serializer, model, plan, prefix='', extras=None):
+    """Add what rendering `serializer` over `model` rows needs to `plan`."""
+    columns = [model._meta.pk.name]
+    known = True
+    for field in serializer._readable_fields:
+        if extras and field.field_name in extras:
+            if extras[field.field_name] not in plan.methods:
+                plan.methods.append(extras[field.field_name])
+            continue
+        if field.source == '*' or len(field.source_attrs) != 1:
+            known = False
+            continue
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            known = False
+            continue
+        if not model_field.is_relation:
+            columns.append(field.source)
+            continue
+        path = prefix + field.source
+        if model_field.many_to_many or model_field.one_to_many:
+            plan.prefetch_related.add(path)
+            continue
+        if model_field.concrete:
+            columns.append(field.source)
+        nested = _unwrap(field)
+        if isinstance(nested, serializers.BaseSerializer):
+            plan.select_related.add(path)
+            _plan(nested, model_field.related_model, plan, f'{path}__')
+        elif not model_field.concrete:
+            # Reverse one-to-one, read through the related row.
+            plan.select_related.add(path)
+    if known:
+        plan.only += [prefix + column for column in columns]
+    elif not prefix:
+        plan.restricted = False
+    return plan
+
+
+class SparseFieldsMixin:
+    """
+    For viewsets: `?fields=` and `?expand=` on list and retrieve (see the
+    module docstring). Applied in `filter_queryset`, after the view's own
+    `get_queryset`, whose joins and prefetches it replaces.
+    """
+    fields_query_param = 'fields'
+    expand_query_param = 'expand'
+    sparse_prefetches = {}
+
+    def sparse_params(self):
+        """(fields tree or None, expand tree), or None when neither parameter is given."""
+        if not hasattr(self, '_sparse_params'):
+            params = self.request.query_params
+            self._sparse_params = None
+            if self.action in SPARSE_ACTIONS and (
+                self.fields_query_param in params or self.expand_query_param in params
+            ):
+                fields = parse_paths(params.get(self.fields_query_param, ''))
+                self._sparse_params = fields or None, parse_paths(params.get(self.expand_query_param, ''))
+        return self._sparse_params
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        params = self.sparse_params()
+        if params is not None:
+            prune(_unwrap(serializer), *params)
+        return serializer
+
+    def sparse_queryset(self, queryset):
+        serializer = self.get_serializer()
+        plan = _plan(serializer, queryset.model, QueryPlan(), extras=self.sparse_prefetches)
+        queryset = queryset.select_related(None).prefetch_related(None)
+        if plan.select_related:
+            queryset = queryset.select_related(*sorted(plan.select_related))
+        if plan.prefetch_related:
+            queryset = queryset.prefetch_related(*sorted(plan.prefetch_related))
+        for method in plan.methods:
+            queryset = getattr(queryset, method)()
+        if not plan.restricted:
+            return queryset
+        ordering = getattr(self.paginator, 'timestamp_field', None)
+        return queryset.only(*plan.only, *([ordering] if ordering else []))
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.sparse_params() is None:
+            return queryset
+        return self.sparse_queryset(queryset)
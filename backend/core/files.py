@@ -0,0 +1,95 @@
+"""
+File downloads.
+
+With DOWNLOAD_SENDFILE_BACKEND set, the app only authorizes the request and
+hands the transfer to the web server (`X-Accel-Redirect` for nginx,
+`X-Sendfile` for Apache/lighttpd). Otherwise the file is streamed in blocks
+with single-range `Range` support, so resumed and partial downloads work and no
+worker holds a whole file in memory.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.http import content_disposition_header
+
+from .streaming import StreamingResponse
+
+STREAM_BLOCK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    """(start, end) inclusive for a single-range `Range` header, or None to send everything."""
+    match = RANGE_RE.match((header or '').strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+def iter_range(handle, start, length):
+    try:
+        handle.seek(start)
+        remaining = length
+        while remaining > 0:
+            block = handle.read(min(STREAM_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+    finally:
+        handle.close()
+
+
+def serve_file(request, field_file, filename=None, as_attachment=True):
+    """Response delivering `field_file` (a FieldFile) to the client."""
+    name = field_file.name
+    filename = filename or os.path.basename(name)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    backend = getattr(settings, 'DOWNLOAD_SENDFILE_BACKEND', '')
+
+    if backend == 'nginx':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.DOWNLOAD_ACCEL_PREFIX.rstrip('/') + '/' + quote(name)
+    elif backend == 'sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = field_file.path
+    else:
+        size = field_file.size
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        start, end = byte_range or (0, size - 1)
+        length = max(0, end - start + 1)
+        handle = field_file.storage.open(name, 'rb')
+        response = StreamingResponse(iter_range(handle, start, length), content_type=content_type)
+        response['Content-Length'] = str(length)
+        response['Accept-Ranges'] = 'bytes'
+        if byte_range is not None:
+            response.status_code = 206
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+    return response
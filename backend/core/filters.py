@@ -0,0 +1,16 @@
+from rest_framework.filters import BaseFilterBackend
+
+from . import rbac
+
+
+class ProjectPermissionFilter(BaseFilterBackend):
+    """
+    Limits list querysets to rows whose project grants
+    `view.required_project_permission` to the requesting user. Views over
+    project-owned rows set `project_field` to the foreign key (e.g. 'project').
+    """
+    def filter_queryset(self, request, queryset, view):
+        code = getattr(view, 'required_project_permission', None)
+        if code is None:
+            return queryset
+        return rbac.filter_permitted(queryset, request.user, code, getattr(view, 'project_field', 'pk'))
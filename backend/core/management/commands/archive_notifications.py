@@ -0,0 +1,25 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.retention import archive_notifications
+
+
+class Command(BaseCommand):
+    help = 'Move read notifications past retention into the archive table, in chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.NOTIFICATION_RETENTION_DAYS)
+        parser.add_argument('--chunk-size', type=int, default=settings.NOTIFICATION_ARCHIVE_CHUNK_SIZE)
+        parser.add_argument('--max-chunks', type=int, default=None)
+        parser.add_argument('--sleep', type=float, default=0.1, help='Seconds to pause between chunks.')
+
+    def handle(self, *args, **options):
+        archived = archive_notifications(
+            datetime.timedelta(days=options['days']),
+            chunk_size=options['chunk_size'],
+            max_chunks=options['max_chunks'],
+            pause=options['sleep'],
+        )
+        self.stdout.write(f'Archived {archived} notifications.')
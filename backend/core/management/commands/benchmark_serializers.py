@@ -0,0 +1,74 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.compiled_serializers import serialize_many
+from core.models import Client, Company, Notification, Project, Ticket, TicketAssignee, User
+from core.serializers import NotificationSerializer, TicketSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare DRF and compiled serializer throughput on generated rows (rolled back afterwards).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=500)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['rows'], options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, rows):
+        company = Company.all_objects.create(name='Benchmark', email='bench@example.com', phone='0', domain='bench.invalid')
+        users = [
+            User.all_objects.create(email=f'bench{i}@bench.invalid', username=f'bench-{i}', company=company)
+            for i in range(5)
+        ]
+        client = Client.all_objects.create(name='Client', email='client@bench.invalid', phone='0', attached_to_company=company)
+        project = Project.all_objects.create(name='Project', client=client, attached_to_company=company)
+        tickets = Ticket.all_objects.bulk_create([
+            Ticket(name=f'Ticket {i}', description='Benchmark ticket', project=project, status='OPEN',
+                   priority='LOW', created_by=users[i % 5])
+            for i in range(rows)
+        ])
+        TicketAssignee.objects.bulk_create([
+            TicketAssignee(ticket=ticket, user=users[(i + 1) % 5]) for i, ticket in enumerate(tickets)
+        ])
+        Notification.objects.bulk_create([
+            Notification(user=users[0], title=f'Note {i}', message='Benchmark', type=Notification.TYPE_GENERAL)
+            for i in range(rows)
+        ])
+        return project, users[0]
+
+    def time(self, render, repeat):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            data = render()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, data
+
+    def run(self, rows, repeat):
+        project, user = self.seed(rows)
+        cases = [
+            ('TicketSerializer', TicketSerializer, list(Ticket.objects.filter(project=project).for_list())),
+            ('NotificationSerializer', NotificationSerializer, list(Notification.objects.filter(user=user))),
+        ]
+        for name, serializer_class, instances in cases:
+            drf, expected = self.time(lambda: serializer_class(instances, many=True).data, repeat)
+            compiled, data = self.time(lambda: serialize_many(serializer_class, instances), repeat)
+            same = 'identical' if data == expected else 'DIFFERENT'
+            self.stdout.write(
+                f'{name}: {len(instances)} rows, DRF {len(instances) / drf:,.0f} rows/s, '
+                f'compiled {len(instances) / compiled:,.0f} rows/s ({drf / compiled:.1f}x, output {same})'
+            )
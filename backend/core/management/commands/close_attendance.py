@@ -0,0 +1,34 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.attendance import CLOSEOUT_CHUNK_SIZE, close_attendance_day
+from core.models import Company
+
+
+class Command(BaseCommand):
+    help = 'Mark absences, lateness, half days, leave and overtime for a finished day.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Day to close (YYYY-MM-DD). Defaults to yesterday.')
+        parser.add_argument('--company', type=int, action='append', help='Company id; repeatable. Defaults to all.')
+        parser.add_argument('--chunk-size', type=int, default=CLOSEOUT_CHUNK_SIZE)
+        parser.add_argument('--restart', action='store_true', help='Reprocess a day that already completed.')
+
+    def handle(self, *args, **options):
+        if options['date']:
+            try:
+                date = datetime.date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError('--date must be YYYY-MM-DD.')
+        else:
+            date = timezone.localdate() - datetime.timedelta(days=1)
+
+        companies = Company.all_objects.filter(is_deleted=False).order_by('pk')
+        if options['company']:
+            companies = companies.filter(pk__in=options['company'])
+
+        for company in companies:
+            run = close_attendance_day(company, date, chunk_size=options['chunk_size'], restart=options['restart'])
+            self.stdout.write(f'{company.name}: closed {date} for {run.processed} employees.')
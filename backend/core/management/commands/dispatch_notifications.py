@@ -0,0 +1,27 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.dispatch import dispatch_pending
+
+
+class Command(BaseCommand):
+    help = 'Send queued notification emails and pushes, retrying failures with backoff.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--channel', action='append', choices=list(settings.NOTIFICATION_CHANNELS),
+                            help='Only work this channel (repeatable). Default: all.')
+        parser.add_argument('--once', action='store_true', help='Send what is due now and exit.')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds to sleep when idle.')
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            handled = dispatch_pending(options['channel'])
+            if options['once']:
+                self.stdout.write(f'Dispatched {handled} deliveries.')
+                return
+            if not handled:
+                time.sleep(options['poll_interval'])
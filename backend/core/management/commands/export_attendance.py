@@ -0,0 +1,42 @@
+import datetime
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.exports import EXPORT_CHUNK_SIZE, FORMATS, ExportError, export_attendance
+from core.models import Company
+
+
+def month(value):
+    return datetime.date.fromisoformat(f'{value}-01')
+
+
+class Command(BaseCommand):
+    help = "Stream a company's attendance and time logs for the given months to a file or stdout."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, required=True, help='Company id.')
+        parser.add_argument('--from', dest='start', type=month, required=True, help='First month, YYYY-MM.')
+        parser.add_argument('--to', dest='end', type=month, help='Last month, YYYY-MM (default: --from).')
+        parser.add_argument('--as', dest='export_format', choices=list(FORMATS), default='csv')
+        parser.add_argument('--output', '-o', help='File to write (default: stdout).')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        company = Company.all_objects.filter(pk=options['company']).first()
+        if company is None:
+            raise CommandError(f"Company {options['company']} does not exist.")
+        try:
+            chunks = export_attendance(
+                company, options['start'], options['end'] or options['start'],
+                options['export_format'], chunk_size=options['chunk_size'],
+            )
+        except ExportError as exc:
+            raise CommandError(str(exc))
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+        finally:
+            if options['output']:
+                output.close()
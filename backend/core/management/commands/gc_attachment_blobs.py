@@ -0,0 +1,22 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from core.blobs import GC_CHUNK_SIZE, GC_GRACE, collect_garbage
+
+
+class Command(BaseCommand):
+    help = 'Purge attachments soft-deleted past retention and delete unreferenced blobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, default=30, help='Keep soft-deleted attachments this long.')
+        parser.add_argument('--grace-minutes', type=int, default=int(GC_GRACE.total_seconds() // 60))
+        parser.add_argument('--chunk-size', type=int, default=GC_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        purged, deleted = collect_garbage(
+            datetime.timedelta(days=options['retention_days']),
+            grace=datetime.timedelta(minutes=options['grace_minutes']),
+            chunk_size=options['chunk_size'],
+        )
+        self.stdout.write(f'Purged {purged} attachments, deleted {deleted} blobs.')
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from core.models import Profile
+from core.uploads import generate_thumbnail
+
+
+class Command(BaseCommand):
+    help = 'Render missing profile picture thumbnails (e.g. after a crash or for old uploads).'
+
+    def handle(self, *args, **options):
+        pending = Profile.objects.exclude(profile_picture='').filter(profile_picture_thumbnail='')
+        done = 0
+        for pk, picture in pending.values_list('pk', 'profile_picture').iterator():
+            try:
+                done += generate_thumbnail(pk, picture)
+            except (OSError, ValueError) as exc:
+                self.stderr.write(f'Profile {pk}: {exc}')
+        self.stdout.write(f'Generated {done} thumbnails.')
@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from core.models import Company
+from core.passwords import hashing_pool
+from core.user_io import IMPORT_CHUNK_SIZE, ImportFormatError, import_users, read_rows, run_queued_import
+
+
+class Command(BaseCommand):
+    help = 'Create users for a company from a CSV or XLSX file, in chunks, or run imports queued through the API.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?')
+        parser.add_argument('--company', type=int, help='Company id.')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+        parser.add_argument('--queued', action='store_true', help='Work the queue of API uploads instead of a file.')
+        parser.add_argument('--once', action='store_true', help='With --queued: run what is pending and exit.')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds to sleep when idle.')
+
+    def handle(self, *args, **options):
+        with hashing_pool():
+            if options['queued']:
+                self.work_queue(options)
+            else:
+                self.import_file(options)
+
+    def work_queue(self, options):
+        while True:
+            close_old_connections()
+            job = run_queued_import()
+            if job is not None:
+                self.stdout.write(f'Import {job.pk}: {job.status}, created {job.created} users.')
+            elif options['once']:
+                return
+            else:
+                time.sleep(options['poll_interval'])
+
+    def import_file(self, options):
+        if not options['path'] or options['company'] is None:
+            raise CommandError('Give a path and --company, or --queued.')
+        company = Company.all_objects.filter(pk=options['company']).first()
+        if company is None:
+            raise CommandError(f"Company {options['company']} does not exist.")
+        with open(options['path'], 'rb') as handle:
+            try:
+                result = import_users(read_rows(handle, options['path']), company, chunk_size=options['chunk_size'])
+            except ImportFormatError as exc:
+                raise CommandError(str(exc))
+        for error in result.errors:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        self.stdout.write(f'Created {result.created} users, linked {result.managers_linked} managers.')
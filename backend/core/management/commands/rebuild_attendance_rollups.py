@@ -0,0 +1,37 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Company
+from core.reporting import REBUILD_CHUNK_SIZE, rebuild_rollups
+
+
+def _month(value):
+    try:
+        return datetime.date.fromisoformat(f'{value}-01')
+    except ValueError:
+        raise CommandError(f'Expected a month as YYYY-MM, got {value!r}.')
+
+
+class Command(BaseCommand):
+    help = 'Backfill monthly attendance rollups from Attendance rows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, help='Company id. Defaults to all.')
+        parser.add_argument('--from', dest='start', help='First month (YYYY-MM).')
+        parser.add_argument('--to', dest='end', help='Last month (YYYY-MM).')
+        parser.add_argument('--chunk-size', type=int, default=REBUILD_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        company = None
+        if options['company']:
+            company = Company.all_objects.filter(pk=options['company']).first()
+            if company is None:
+                raise CommandError(f'Company {options["company"]} does not exist.')
+        count = rebuild_rollups(
+            company=company,
+            start=_month(options['start']) if options['start'] else None,
+            end=_month(options['end']) if options['end'] else None,
+            chunk_size=options['chunk_size'],
+        )
+        self.stdout.write(f'Rebuilt {count} monthly rollups.')
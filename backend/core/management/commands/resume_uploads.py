@@ -0,0 +1,16 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from core.uploads import STALLED_AFTER, resume_stalled_uploads
+
+
+class Command(BaseCommand):
+    help = 'Finish uploads left PROCESSING by a process that stopped before storing them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stalled-minutes', type=int, default=int(STALLED_AFTER.total_seconds() // 60))
+
+    def handle(self, *args, **options):
+        resumed = resume_stalled_uploads(datetime.timedelta(minutes=options['stalled_minutes']))
+        self.stdout.write(f'Resumed {resumed} uploads.')
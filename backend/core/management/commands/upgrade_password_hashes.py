@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from core.passwords import BULK_BATCH_SIZE, hashing_pool, upgrade_legacy_hashes
+
+
+class Command(BaseCommand):
+    help = 'Wrap legacy MD5 password hashes in PBKDF2; users get a plain current hash at their next login.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BULK_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        with hashing_pool():
+            upgraded = upgrade_legacy_hashes(batch_size=options['batch_size'])
+        self.stdout.write(f'Wrapped {upgraded} legacy password hashes.')
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:58
+
+import core.tenancy
+import django.contrib.auth.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core', '0003_companymembership_companypermissionassignment_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='user',
+            managers=[
+                ('objects', core.tenancy.TenantUserManager('company')),
+                ('all_objects', django.contrib.auth.models.UserManager()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['attached_to_company', 'name'], name='idx_client_company_name'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['attached_to_company', 'is_deleted'], name='idx_project_company_deleted'),
+        ),
+        migrations.AddIndex(
+            model_name='ticketcomment',
+            index=models.Index(fields=['attached_to_company', 'ticket'], name='idx_tcomment_company_ticket'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['company', 'is_deleted'], name='idx_user_company_deleted'),
+        ),
+    ]
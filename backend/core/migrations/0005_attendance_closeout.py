@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_tenant_managers_and_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceCloseout',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('last_user_id', models.BigIntegerField(default=0)),
+                ('processed', models.IntegerField(default=0)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='leaverequest',
+            index=models.Index(fields=['user', 'status', 'start_date'], name='idx_leave_user_status_start'),
+        ),
+        migrations.AddIndex(
+            model_name='timelog',
+            index=models.Index(fields=['attendance', 'check_in'], name='idx_timelog_attendance_in'),
+        ),
+        migrations.AddField(
+            model_name='attendancecloseout',
+            name='company',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance_closeouts', to='core.company'),
+        ),
+        migrations.AddConstraint(
+            model_name='attendancecloseout',
+            constraint=models.UniqueConstraint(fields=('company', 'date'), name='uniq_closeout_company_date'),
+        ),
+    ]
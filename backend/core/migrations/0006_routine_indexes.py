@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_attendance_closeout'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='employeeroutinetimings',
+            index=models.Index(fields=['user', 'created_at'], name='idx_routine_user_created'),
+        ),
+        migrations.AddIndex(
+            model_name='routinetemplate',
+            index=models.Index(fields=['for_designation', 'is_active', 'updated_at'], name='idx_rtemplate_desig_active'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_routine_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyAttendanceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('worked_seconds', models.BigIntegerField(default=0)),
+                ('overtime_seconds', models.BigIntegerField(default=0)),
+                ('present_days', models.IntegerField(default=0)),
+                ('late_days', models.IntegerField(default=0)),
+                ('absent_days', models.IntegerField(default=0)),
+                ('half_days', models.IntegerField(default=0)),
+                ('leave_days', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('company', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='attendance_rollups', to='core.company')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['company', 'month'], name='idx_rollup_company_month')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'month'), name='uniq_rollup_user_month')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_monthly_attendance_rollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['-updated_at', '-id'], name='idx_ticket_updated_id'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['project', '-updated_at', '-id'], name='idx_ticket_project_updated'),
+        ),
+    ]
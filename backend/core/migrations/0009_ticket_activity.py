@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:09
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+BACKFILL_CHUNK_SIZE = 2000
+
+
+def backfill_activity(apps, schema_editor):
+    """Project existing live updates, comments and attachments into the timeline."""
+    TicketActivity = apps.get_model('core', 'TicketActivity')
+    sources = [
+        ('TicketUpdate', 'UPDATE', lambda row: {'text': row.update or '', 'status': row.status, 'priority': row.priority}),
+        ('TicketComment', 'COMMENT', lambda row: {'text': row.comment or '', 'update_id': row.for_ticket_update_id}),
+        ('TicketAttachement', 'ATTACHMENT', lambda row: {'name': row.attachement.name, 'update_id': row.for_ticket_update_id}),
+    ]
+    for model_name, kind, payload in sources:
+        rows = apps.get_model('core', model_name)._base_manager.filter(is_deleted=False).select_related(
+            'created_by', 'ticket__project',
+        ).order_by('pk')
+        batch = []
+        for row in rows.iterator(chunk_size=BACKFILL_CHUNK_SIZE):
+            user = row.created_by
+            batch.append(TicketActivity(
+                ticket_id=row.ticket_id,
+                company_id=row.ticket.project.attached_to_company_id,
+                kind=kind,
+                source_id=row.pk,
+                actor_id=row.created_by_id,
+                actor_name=' '.join(filter(None, [user.first_name, user.last_name])) or user.username,
+                data=payload(row),
+                created_at=row.created_at,
+            ))
+            if len(batch) == BACKFILL_CHUNK_SIZE:
+                TicketActivity.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        TicketActivity.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_ticket_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('UPDATE', 'Update'), ('COMMENT', 'Comment'), ('ATTACHMENT', 'Attachment')], max_length=10)),
+                ('source_id', models.BigIntegerField()),
+                ('actor_name', models.CharField(blank=True, max_length=150)),
+                ('data', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('actor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('company', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.company')),
+                ('ticket', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity', to='core.ticket')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ticket', '-created_at', '-id'], name='idx_tactivity_ticket_created')],
+                'constraints': [models.UniqueConstraint(fields=('kind', 'source_id'), name='uniq_tactivity_source')],
+            },
+        ),
+        migrations.RunPython(backfill_activity, migrations.RunPython.noop),
+    ]
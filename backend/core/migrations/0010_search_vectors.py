@@ -0,0 +1,80 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:11
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# table -> [(column, weight)]
+SEARCH_TABLES = {
+    'core_project': [('name', 'A'), ('description', 'B')],
+    'core_ticket': [('name', 'A'), ('description', 'B')],
+    'core_ticketupdate': [('update', 'A')],
+    'core_ticketcomment': [('comment', 'A')],
+}
+
+
+def create_search_triggers(apps, schema_editor):
+    """Triggers, backfill and GIN indexes; PostgreSQL only."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, columns in SEARCH_TABLES.items():
+        vector = ' || '.join(
+            f"setweight(to_tsvector('english', coalesce(NEW.\"{column}\", '')), '{weight}')"
+            for column, weight in columns
+        )
+        column_list = ', '.join(f'"{column}"' for column, _ in columns)
+        schema_editor.execute(f"""
+            CREATE OR REPLACE FUNCTION {table}_search_vector() RETURNS trigger AS $$
+            BEGIN
+                NEW.search_vector := {vector};
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+        """)
+        schema_editor.execute(f"""
+            CREATE TRIGGER {table}_search_vector_update
+            BEFORE INSERT OR UPDATE OF {column_list} ON {table}
+            FOR EACH ROW EXECUTE FUNCTION {table}_search_vector()
+        """)
+        first = columns[0][0]
+        schema_editor.execute(f'UPDATE {table} SET "{first}" = "{first}"')
+        schema_editor.execute(f'CREATE INDEX {table}_search_gin ON {table} USING gin (search_vector)')
+
+
+def drop_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in SEARCH_TABLES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {table}_search_gin')
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {table}_search_vector_update ON {table}')
+        schema_editor.execute(f'DROP FUNCTION IF EXISTS {table}_search_vector()')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_ticket_activity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='ticketcomment',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='ticketupdate',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_triggers, drop_search_triggers),
+    ]
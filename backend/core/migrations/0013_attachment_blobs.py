@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:17
+
+import core.storage
+from django.db import migrations, models
+from django.db.models import Count, Max, Min
+
+
+def backfill_blobs(apps, schema_editor):
+    """Reference counts for attachments already stored with a content hash."""
+    TicketAttachement = apps.get_model('core', 'TicketAttachement')
+    AttachmentBlob = apps.get_model('core', 'AttachmentBlob')
+    rows = TicketAttachement.objects.exclude(content_hash='').values('content_hash').annotate(
+        refs=Count('pk'), first_name=Min('attachement'), blob_size=Max('size'),
+    ).order_by()
+    AttachmentBlob.objects.bulk_create([
+        AttachmentBlob(sha256=row['content_hash'], name=row['first_name'], size=row['blob_size'], refcount=row['refs'])
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticketattachement',
+            name='filename',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='ticketattachement',
+            name='attachement',
+            field=models.FileField(storage=core.storage.attachment_storage, upload_to='ticket_attachements/'),
+        ),
+        migrations.CreateModel(
+            name='AttachmentBlob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField(blank=True, null=True)),
+                ('refcount', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['refcount', 'updated_at'], name='idx_blob_refcount_updated')],
+            },
+        ),
+        migrations.RunPython(backfill_blobs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:13
+
+import core.models
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_upload_processing_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userimport',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AlterField(
+            model_name='userimport',
+            name='file',
+            field=models.FileField(blank=True, storage=core.storage.private_storage, upload_to=core.models.user_import_path),
+        ),
+    ]
@@ -1,9 +1,34 @@
-from django.contrib.auth.models import AbstractUser
+import uuid
+
+from django.contrib.auth.models import AbstractUser, UserManager
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 from django.core.validators import FileExtensionValidator
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Case, F, Prefetch, Q, Sum, Value, When
+from django.db.models.functions import Greatest
+from django.db.models.lookups import GreaterThan
+
+from .storage import attachment_storage, private_storage
+from .tenancy import TenantManager, TenantUserManager
+
+class PermissionStateQuerySet(models.QuerySet):
+    """
+    QuerySet for tables that feed permission resolution. Bulk `update()` and
+    `bulk_create()` skip model signals, so the touched rows are reported to
+    core.rbac for cache invalidation and auditing. Deletes still send signals.
+    """
+    def update(self, **kwargs):
+        from .rbac import track_update
+        return track_update(self, super().update, kwargs)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        from .rbac import track_bulk_create
+        objs = super().bulk_create(objs, *args, **kwargs)
+        track_bulk_create(self.model, objs)
+        return objs
 
 class User(AbstractUser):
     email = models.EmailField(unique=True)
@@ -20,9 +45,17 @@ class User(AbstractUser):
     last_login_ip = models.GenericIPAddressField(null=True, blank=True)
     last_login_timer = models.DateTimeField(null=True, blank=True)
 
+    objects = TenantUserManager('company')
+    all_objects = UserManager()
+
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['company', 'is_deleted'], name='idx_user_company_deleted'),
+        ]
+
     def __str__(self):
         return self.email
 
@@ -37,6 +70,9 @@ class Company(models.Model):
     updated_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='updated_companies')
     is_deleted = models.BooleanField(default=False)
 
+    objects = TenantManager('pk')
+    all_objects = models.Manager()
+
     def __str__(self):
         return self.name
 
@@ -55,6 +91,8 @@ class CompanyMembership(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = PermissionStateQuerySet.as_manager()
+
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=['user', 'company'], name='uniq_membership_user_company'),
@@ -70,6 +108,8 @@ class Profile(models.Model):
     address = models.CharField(max_length=255, blank=True)
     personal_email = models.EmailField(blank=True)
     profile_picture = models.ImageField(upload_to='profile_pictures/', blank=True)
+    # Generated off-request after the picture changes (core.uploads).
+    profile_picture_thumbnail = models.ImageField(upload_to='profile_pictures/thumbnails/', blank=True)
     emergency_contact_name = models.CharField(max_length=150, blank=True, verbose_name="emergency contact name")
     emergency_contact_phone = models.CharField(max_length=20, blank=True, verbose_name="emergency contact phone")
     alternate_email = models.EmailField(blank=True, verbose_name="alternate email")
@@ -138,25 +178,91 @@ class Attendance(models.Model):
     class Meta:
         unique_together = ['user', 'date']
 
+    STATUS_PENDING = 'PENDING'
+    STATUS_PRESENT = 'PRESENT'
+    STATUS_OVERTIME = 'OVERTIME'
+    STATUS_ABSENT = 'ABSENT'
+    STATUS_HALF_DAY = 'HALF_DAY'
+    STATUS_LEAVE = 'LEAVE'
+    WORKED_STATUSES = [STATUS_PRESENT, STATUS_OVERTIME]
+
+    # Simple Overtime Logic (Standard 8 hours = 28800 seconds)
+    STANDARD_WORK_SECONDS = 8 * 3600
+
+    @classmethod
+    def summarize(cls, total_seconds, status):
+        """(overtime_seconds, status) for a day with `total_seconds` worked."""
+        overtime = max(total_seconds - cls.STANDARD_WORK_SECONDS, 0)
+        if total_seconds > cls.STANDARD_WORK_SECONDS:
+            status = cls.STATUS_OVERTIME
+        elif total_seconds > 0:
+            status = cls.STATUS_PRESENT
+        elif status in cls.WORKED_STATUSES:
+            status = cls.STATUS_PENDING
+        return overtime, status
+
+    @classmethod
+    def apply_worked_delta(cls, attendance_id, delta_seconds):
+        """
+        Add `delta_seconds` to a day's total in one atomic UPDATE, deriving
+        overtime and status from the new total in SQL (the same rules as
+        `summarize`). No row is read, so concurrent punches cannot lose updates.
+        """
+        if not delta_seconds:
+            return 0
+        from .reporting import mark_attendance_dirty
+        total = F('total_worked_seconds') + delta_seconds
+        updated = cls.objects.filter(pk=attendance_id).update(
+            total_worked_seconds=total,
+            overtime_seconds=Greatest(total - cls.STANDARD_WORK_SECONDS, Value(0)),
+            status=Case(
+                When(GreaterThan(total, cls.STANDARD_WORK_SECONDS), then=Value(cls.STATUS_OVERTIME)),
+                When(GreaterThan(total, 0), then=Value(cls.STATUS_PRESENT)),
+                When(status__in=cls.WORKED_STATUSES, then=Value(cls.STATUS_PENDING)),
+                default=F('status'),
+            ),
+        )
+        if updated:
+            mark_attendance_dirty([attendance_id])
+        return updated
+
+    @classmethod
+    def recompute_summaries(cls, attendance_ids):
+        """
+        Full recompute for many days at once: one grouped SUM() over their
+        closed TimeLogs and one bulk UPDATE of the locked summary rows.
+        """
+        from .reporting import mark_attendance_dirty
+        totals = dict(
+            TimeLog.objects.filter(attendance_id__in=attendance_ids, check_out__isnull=False)
+            .values('attendance_id')
+            .annotate(total=Sum(F('check_out') - F('check_in')))
+            .values_list('attendance_id', 'total')
+        )
+        with transaction.atomic():
+            days = list(cls.objects.select_for_update().filter(pk__in=attendance_ids).only('id', 'status'))
+            for day in days:
+                worked = totals.get(day.pk)
+                day.total_worked_seconds = int(worked.total_seconds()) if worked else 0
+                day.overtime_seconds, day.status = cls.summarize(day.total_worked_seconds, day.status)
+            cls.objects.bulk_update(days, ['total_worked_seconds', 'overtime_seconds', 'status'], batch_size=500)
+        mark_attendance_dirty([day.pk for day in days])
+        return len(days)
+
     def update_summary(self):
-        """Recalculate totals based on TimeLogs."""
-        logs = self.timelogs.filter(check_out__isnull=False)
-        total_seconds = 0
-        for log in logs:
-            duration = (log.check_out - log.check_in).total_seconds()
-            total_seconds += duration
-        
-        self.total_worked_seconds = int(total_seconds)
-        
-        # Simple Overtime Logic (Standard 8 hours = 28800 seconds)
-        STANDARD_WORK_SECONDS = 8 * 3600
-        if self.total_worked_seconds > STANDARD_WORK_SECONDS:
-            self.overtime_seconds = self.total_worked_seconds - STANDARD_WORK_SECONDS
-            self.status = 'OVERTIME'
-        elif self.total_worked_seconds > 0:
-            self.status = 'PRESENT'
-        
-        self.save()
+        """Recalculate totals from the closed TimeLogs with a single SUM()."""
+        from .reporting import mark_attendance_dirty
+        worked = self.timelogs.filter(check_out__isnull=False).aggregate(
+            total=Sum(F('check_out') - F('check_in'))
+        )['total']
+        self.total_worked_seconds = int(worked.total_seconds()) if worked else 0
+        self.overtime_seconds, self.status = self.summarize(self.total_worked_seconds, self.status)
+        Attendance.objects.filter(pk=self.pk).update(
+            total_worked_seconds=self.total_worked_seconds,
+            overtime_seconds=self.overtime_seconds,
+            status=self.status,
+        )
+        mark_attendance_dirty([self.pk])
 
     def __str__(self):
         return f"{self.user.email} - {self.date}"
@@ -176,14 +282,48 @@ class TimeLog(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['attendance', 'check_in'], name='idx_timelog_attendance_in'),
+        ]
+
     def clean(self):
         if self.check_out and self.check_in and self.check_out <= self.check_in:
             raise ValidationError("Check-out time must be after check-in time.")
 
+    SUMMARY_FIELDS = ['total_worked_seconds', 'overtime_seconds', 'status']
+
+    @staticmethod
+    def worked_seconds(check_in, check_out):
+        if check_in is None or check_out is None:
+            return 0
+        return int((check_out - check_in).total_seconds())
+
     def save(self, *args, **kwargs):
+        """
+        Save the log and apply only its change in worked time to the day's
+        summary. Edits read the stored row under a lock so the delta is exact.
+        """
         self.clean()
-        super().save(*args, **kwargs)
-        self.attendance.update_summary()
+        with transaction.atomic():
+            previous = None
+            if not self._state.adding and self.pk is not None:
+                previous = TimeLog.objects.select_for_update().filter(pk=self.pk).values(
+                    'attendance_id', 'check_in', 'check_out'
+                ).first()
+            super().save(*args, **kwargs)
+            seconds = self.worked_seconds(self.check_in, self.check_out)
+            if previous is None:
+                Attendance.apply_worked_delta(self.attendance_id, seconds)
+            else:
+                before = self.worked_seconds(previous['check_in'], previous['check_out'])
+                if previous['attendance_id'] == self.attendance_id:
+                    Attendance.apply_worked_delta(self.attendance_id, seconds - before)
+                else:
+                    Attendance.apply_worked_delta(previous['attendance_id'], -before)
+                    Attendance.apply_worked_delta(self.attendance_id, seconds)
+        if TimeLog.attendance.is_cached(self):
+            self.attendance.refresh_from_db(fields=self.SUMMARY_FIELDS)
 
 class Break(models.Model):
     attendance = models.ForeignKey(Attendance, on_delete=models.CASCADE)
@@ -196,6 +336,49 @@ class Overtime(models.Model):
     overtime_seconds = models.IntegerField(default=0)
     overtime = models.BooleanField(default=False)
 
+class AttendanceCloseout(models.Model):
+    """
+    Progress of the nightly close-out for one company and day. Users are
+    processed in primary-key order; `last_user_id` lets an interrupted run
+    resume where it stopped.
+    """
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='attendance_closeouts')
+    date = models.DateField()
+    last_user_id = models.BigIntegerField(default=0)
+    processed = models.IntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['company', 'date'], name='uniq_closeout_company_date'),
+        ]
+
+class MonthlyAttendanceRollup(models.Model):
+    """
+    Per-user monthly attendance totals for reporting, recomputed by
+    core.reporting whenever one of the month's Attendance rows changes.
+    """
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, null=True, blank=True, related_name='attendance_rollups')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='attendance_rollups')
+    month = models.DateField(help_text="First day of the month")
+    worked_seconds = models.BigIntegerField(default=0)
+    overtime_seconds = models.BigIntegerField(default=0)
+    present_days = models.IntegerField(default=0)
+    late_days = models.IntegerField(default=0)
+    absent_days = models.IntegerField(default=0)
+    half_days = models.IntegerField(default=0)
+    leave_days = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'month'], name='uniq_rollup_user_month'),
+        ]
+        indexes = [
+            models.Index(fields=['company', 'month'], name='idx_rollup_company_month'),
+        ]
+
 class EmployeeRoutineTimings(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     start_time = models.TimeField()
@@ -207,6 +390,11 @@ class EmployeeRoutineTimings(models.Model):
     approved_break_duration_seconds = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='idx_routine_user_created'),
+        ]
+
 class RoutineTemplate(models.Model):
     start_time = models.TimeField()
     end_time = models.TimeField()
@@ -220,6 +408,11 @@ class RoutineTemplate(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['for_designation', 'is_active', 'updated_at'], name='idx_rtemplate_desig_active'),
+        ]
+
 class LeaveType(models.Model):
     name = models.CharField(max_length=100)
     description = models.CharField(max_length=4000)
@@ -228,6 +421,10 @@ class LeaveType(models.Model):
     is_active = models.BooleanField(default=True)
 
 class LeaveRequest(models.Model):
+    STATUS_PENDING = 'PENDING'
+    STATUS_APPROVED = 'APPROVED'
+    STATUS_REJECTED = 'REJECTED'
+
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='leave_requests')
     leave_type = models.ForeignKey(LeaveType, on_delete=models.CASCADE)
     start_date = models.DateField()
@@ -238,24 +435,130 @@ class LeaveRequest(models.Model):
     approved_at = models.DateTimeField(null=True, blank=True)
     approved_by = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='approved_leaves')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'status', 'start_date'], name='idx_leave_user_status_start'),
+        ]
+
 # --- Notification System ---
 
 class Notification(models.Model):
+    TYPE_ATTENDANCE_ALERT = 'ATTENDANCE_ALERT'
+    TYPE_LEAVE_UPDATE = 'LEAVE_UPDATE'
+    TYPE_TICKET_UPDATE = 'TICKET_UPDATE'
+    TYPE_GENERAL = 'GENERAL'
+
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
     title = models.CharField(max_length=255)
     message = models.TextField()
     type = models.CharField(max_length=50, choices=[
-        ('ATTENDANCE_ALERT', 'Attendance Alert'),
-        ('LEAVE_UPDATE', 'Leave Update'),
-        ('TICKET_UPDATE', 'Ticket Update'),
-        ('GENERAL', 'General')
+        (TYPE_ATTENDANCE_ALERT, 'Attendance Alert'),
+        (TYPE_LEAVE_UPDATE, 'Leave Update'),
+        (TYPE_TICKET_UPDATE, 'Ticket Update'),
+        (TYPE_GENERAL, 'General')
     ])
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
-    
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'is_read', 'created_at'], name='idx_notification_user_read'),
+            # Retention scans for old read rows (core.retention).
+            models.Index(fields=['is_read', 'created_at'], name='idx_notification_read_created'),
+        ]
+
     def __str__(self):
         return f"{self.title} - {self.user.email}"
 
+class ArchivedNotification(models.Model):
+    """
+    A read notification moved out of the hot table by core.retention once it
+    passed NOTIFICATION_RETENTION_DAYS. Keeps the original id and timestamps.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_notifications', db_index=False)
+    title = models.CharField(max_length=255)
+    message = models.TextField()
+    type = models.CharField(max_length=50, choices=Notification._meta.get_field('type').choices)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='idx_archived_notif_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.title} (archived)"
+
+class NotificationCounter(models.Model):
+    """
+    Unread notification count per user, kept in step with Notification by
+    core.notifications so the header badge is a primary-key lookup.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='notification_counter')
+    unread = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.unread} unread for user {self.user_id}"
+
+class NotificationDelivery(models.Model):
+    """
+    One notification to send over one channel, worked off by the dispatch
+    queue (core.dispatch) so providers never run on the request thread.
+    """
+    CHANNEL_EMAIL = 'EMAIL'
+    CHANNEL_PUSH = 'PUSH'
+    CHANNEL_CHOICES = [
+        (CHANNEL_EMAIL, 'Email'),
+        (CHANNEL_PUSH, 'Push'),
+    ]
+
+    STATUS_PENDING = 'PENDING'
+    STATUS_SENT = 'SENT'
+    STATUS_SKIPPED = 'SKIPPED'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_SKIPPED, 'Skipped'),
+    ]
+
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='deliveries')
+    channel = models.CharField(max_length=10, choices=CHANNEL_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.IntegerField(default=0)
+    # Due time while pending; claiming a row pushes it out by the lease so a
+    # crashed worker's batch is retried rather than lost.
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['notification', 'channel'], name='uniq_delivery_notification_channel'),
+        ]
+        indexes = [
+            models.Index(fields=['channel', 'status', 'next_attempt_at'], name='idx_delivery_due'),
+        ]
+
+    def __str__(self):
+        return f"{self.channel} {self.status} for notification {self.notification_id}"
+
+class DeadLetterDelivery(models.Model):
+    """A delivery that exhausted its retries, kept with its payload for inspection or replay."""
+    notification = models.ForeignKey(Notification, on_delete=models.SET_NULL, null=True, blank=True, related_name='dead_letters')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='dead_letter_deliveries')
+    channel = models.CharField(max_length=10, choices=NotificationDelivery.CHANNEL_CHOICES)
+    payload = models.JSONField(default=dict)
+    attempts = models.IntegerField()
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.channel} dead letter for user {self.user_id}"
+
 class Client(models.Model):
     name = models.CharField(max_length=100)
     email = models.EmailField()
@@ -265,9 +568,13 @@ class Client(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
 
+    objects = TenantManager('attached_to_company', soft_delete=False)
+    all_objects = models.Manager()
+
     class Meta:
         indexes = [
             models.Index(fields=['email'], name='idx_client_email'),
+            models.Index(fields=['attached_to_company', 'name'], name='idx_client_company_name'),
         ]
 
 class Project(models.Model):
@@ -279,6 +586,16 @@ class Project(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
     is_deleted = models.BooleanField(default=False)
+    # Maintained by a database trigger on PostgreSQL (see core.search).
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = TenantManager('attached_to_company')
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['attached_to_company', 'is_deleted'], name='idx_project_company_deleted'),
+        ]
 
     def __str__(self):
         return self.name
@@ -292,6 +609,8 @@ class ProjectUser(models.Model):
     is_active = models.BooleanField(default=True)
     is_deleted = models.BooleanField(default=False)
     
+    objects = PermissionStateQuerySet.as_manager()
+
     class Meta:
         unique_together = ['project', 'user']
         indexes = [
@@ -383,6 +702,8 @@ class ProjectRolePermission(models.Model):
     effect = models.CharField(max_length=5, choices=EFFECT_CHOICES, default=EFFECT_ALLOW, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = PermissionStateQuerySet.as_manager()
+
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=['role', 'permission'], name='uniq_projectrole_permission'),
@@ -408,6 +729,8 @@ class CompanyPermissionAssignment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = PermissionStateQuerySet.as_manager()
+
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=['company', 'user', 'permission'], name='uniq_company_user_permission'),
@@ -435,6 +758,8 @@ class ProjectPermissionAssignment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = PermissionStateQuerySet.as_manager()
+
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=['project', 'user', 'permission'], name='uniq_project_user_permission'),
@@ -477,6 +802,26 @@ class TicketType(models.Model):
     def __str__(self):
         return self.name
 
+class TicketQuerySet(models.QuerySet):
+    def for_list(self):
+        """
+        Everything TicketSerializer renders, in a fixed number of queries:
+        project and client joined, active assignees prefetched.
+        """
+        return self.select_related('project__client').defer(
+            'search_vector', 'project__search_vector',
+        ).with_assignees()
+
+    def with_assignees(self):
+        """Active assignees prefetched for `Ticket.assigned_to`."""
+        return self.prefetch_related(
+            Prefetch(
+                'ticketassignee_set',
+                queryset=TicketAssignee.objects.filter(is_active=True, is_deleted=False).select_related('user').order_by('pk'),
+                to_attr='active_assignments',
+            )
+        )
+
 class Ticket(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(null=True, blank=True)
@@ -488,10 +833,36 @@ class Ticket(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
     is_deleted = models.BooleanField(default=False)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = TenantManager.from_queryset(TicketQuerySet)('project__attached_to_company')
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-updated_at', '-id'], name='idx_ticket_updated_id'),
+            models.Index(fields=['project', '-updated_at', '-id'], name='idx_ticket_project_updated'),
+            models.Index(fields=['project', 'status', 'priority'], name='idx_ticket_project_status'),
+        ]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Moving a ticket changes the board counts of the project it left too (core.signals).
+        instance._loaded_project_id = instance.__dict__.get('project_id')
+        return instance
+
+    @property
+    def assigned_to(self):
+        """Users actively assigned to this ticket."""
+        assignments = getattr(self, 'active_assignments', None)
+        if assignments is None:
+            assignments = self.ticketassignee_set.filter(is_active=True, is_deleted=False).select_related('user').order_by('pk')
+        return [assignment.user for assignment in assignments]
+
 class TicketAssignee(models.Model):
     ticket = models.ForeignKey(Ticket, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -513,17 +884,27 @@ class TicketUpdate(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
     is_deleted = models.BooleanField(default=False)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = TenantManager('ticket__project__attached_to_company')
+    all_objects = models.Manager()
 
 class TicketAttachement(models.Model):
     ticket = models.ForeignKey(Ticket, on_delete=models.CASCADE)
     for_ticket_update = models.ForeignKey(TicketUpdate, on_delete=models.CASCADE)
-    attachement = models.FileField(upload_to="ticket_attachements/")
+    attachement = models.FileField(upload_to="ticket_attachements/", storage=attachment_storage)
+    filename = models.CharField(max_length=255, blank=True)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    size = models.BigIntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
     is_deleted = models.BooleanField(default=False)
 
+    objects = TenantManager('ticket__project__attached_to_company')
+    all_objects = models.Manager()
+
 class TicketComment(models.Model):
     ticket = models.ForeignKey(Ticket, on_delete=models.CASCADE)
     for_ticket_update = models.ForeignKey(TicketUpdate, on_delete=models.CASCADE)
@@ -534,3 +915,167 @@ class TicketComment(models.Model):
     is_active = models.BooleanField(default=True)
     attached_to_company = models.ForeignKey(Company, on_delete=models.CASCADE)
     is_deleted = models.BooleanField(default=False)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = TenantManager('attached_to_company')
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['attached_to_company', 'ticket'], name='idx_tcomment_company_ticket'),
+        ]
+
+class TicketActivity(models.Model):
+    """
+    Ticket timeline, one row per live update, comment or attachment, kept in
+    step with the source rows by core.timeline. Rows carry what the timeline
+    renders (actor name, text, status) so a page of it is a single range
+    scan of idx_tactivity_ticket_created.
+    """
+    KIND_UPDATE = 'UPDATE'
+    KIND_COMMENT = 'COMMENT'
+    KIND_ATTACHMENT = 'ATTACHMENT'
+    KIND_CHOICES = [
+        (KIND_UPDATE, 'Update'),
+        (KIND_COMMENT, 'Comment'),
+        (KIND_ATTACHMENT, 'Attachment'),
+    ]
+
+    ticket = models.ForeignKey(Ticket, on_delete=models.CASCADE, related_name='activity')
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, null=True, blank=True)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    source_id = models.BigIntegerField()
+    actor = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    actor_name = models.CharField(max_length=150, blank=True)
+    data = models.JSONField(default=dict)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    objects = TenantManager('company', soft_delete=False)
+    all_objects = models.Manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'source_id'], name='uniq_tactivity_source'),
+        ]
+        indexes = [
+            models.Index(fields=['ticket', '-created_at', '-id'], name='idx_tactivity_ticket_created'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} on ticket {self.ticket_id}'
+
+class AttachmentBlob(models.Model):
+    """
+    One stored attachment content, shared by every TicketAttachement with the
+    same `content_hash`. `refcount` counts those rows, soft-deleted ones
+    included, and is maintained by core.blobs; unreferenced blobs are removed
+    by the gc_attachment_blobs command.
+    """
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    name = models.CharField(max_length=255)
+    size = models.BigIntegerField(null=True, blank=True)
+    refcount = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['refcount', 'updated_at'], name='idx_blob_refcount_updated'),
+        ]
+
+    def __str__(self):
+        return f'{self.sha256} ({self.refcount} refs)'
+
+class UploadSession(models.Model):
+    """
+    A resumable upload: the client PUTs consecutive chunks at `offset` into a
+    part file under UPLOAD_TEMP_DIR; once `size` bytes have arrived the
+    session is PROCESSING until the file is committed to storage in the
+    background (core.uploads).
+    """
+    KIND_ATTACHMENT = 'ATTACHMENT'
+    KIND_PROFILE_PICTURE = 'PROFILE_PICTURE'
+    KIND_CHOICES = [
+        (KIND_ATTACHMENT, 'Ticket attachment'),
+        (KIND_PROFILE_PICTURE, 'Profile picture'),
+    ]
+
+    STATUS_PENDING = 'PENDING'
+    STATUS_PROCESSING = 'PROCESSING'
+    STATUS_COMPLETE = 'COMPLETE'
+    STATUS_FAILED = 'FAILED'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_PROCESSING, 'Processing'),
+        (STATUS_COMPLETE, 'Complete'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True)
+    ticket_update = models.ForeignKey(TicketUpdate, on_delete=models.CASCADE, null=True, blank=True)
+    attachment = models.ForeignKey(TicketAttachement, on_delete=models.SET_NULL, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    error = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'updated_at'], name='idx_upload_status_updated'),
+        ]
+
+    def __str__(self):
+        return f'{self.filename} ({self.offset}/{self.size})'
+
+def user_import_path(instance, filename):
+    # The client's filename is kept in UserImport.filename, not on disk.
+    return f'imports/users/{uuid.uuid4().hex}'
+
+
+class UserImport(models.Model):
+    """
+    A bulk user import queued by the users `import` endpoint. The uploaded
+    file waits in private storage until a worker (`manage.py import_users
+    --queued`) runs it and is deleted once the import completes or fails;
+    counts and row errors are recorded here for the client to poll. Workers
+    touch `updated_at` after every chunk, so a RUNNING job that stops moving
+    can be re-claimed.
+    """
+    STATUS_PENDING = 'PENDING'
+    STATUS_RUNNING = 'RUNNING'
+    STATUS_COMPLETE = 'COMPLETE'
+    STATUS_FAILED = 'FAILED'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_COMPLETE, 'Complete'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='user_imports')
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='user_imports')
+    file = models.FileField(upload_to=user_import_path, storage=private_storage, blank=True)
+    filename = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    created = models.IntegerField(default=0)
+    managers_linked = models.IntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    error = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='idx_userimport_status_created'),
+        ]
+
+    def __str__(self):
+        return f'{self.filename} ({self.status})'
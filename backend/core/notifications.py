@@ -0,0 +1,121 @@
+"""
+Notification fan-out and unread counters.
+
+`notify()` inserts one Notification per recipient with a single bulk INSERT
+and bumps every recipient's NotificationCounter with a single UPDATE. Marking
+notifications read subtracts exactly the rows it flipped, so reading the unread
+badge is a primary-key lookup and never counts the notifications table.
+Notifications created or deleted one at a time elsewhere are kept in step by
+the receivers in core.signals; `recount()` repairs drift. Email and push copies
+are queued for core.dispatch in the same transaction.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from . import dispatch, events
+from .models import Notification, NotificationCounter, TicketAssignee, User
+
+FANOUT_BATCH_SIZE = 1000
+
+
+def _user_ids(users):
+    return {getattr(user, 'pk', user) for user in users if user is not None}
+
+
+def adjust_unread(deltas):
+    """Apply {user_id: delta} to the unread counters, creating missing ones."""
+    deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    NotificationCounter.objects.bulk_create(
+        [NotificationCounter(user_id=user_id) for user_id in deltas], ignore_conflicts=True,
+    )
+    by_delta = {}
+    for user_id, delta in deltas.items():
+        by_delta.setdefault(delta, []).append(user_id)
+    for delta, user_ids in by_delta.items():
+        NotificationCounter.objects.filter(user_id__in=user_ids).update(
+            unread=Greatest(F('unread') + delta, 0), updated_at=timezone.now(),
+        )
+
+
+def notify(users, title, message, type=Notification.TYPE_GENERAL, exclude=None):
+    """Create one notification per recipient in bulk. Returns the created rows."""
+    recipients = _user_ids(users) - _user_ids(exclude or [])
+    if not recipients:
+        return []
+    with transaction.atomic():
+        created = Notification.objects.bulk_create(
+            [Notification(user_id=user_id, title=title, message=message, type=type) for user_id in sorted(recipients)],
+            batch_size=FANOUT_BATCH_SIZE,
+        )
+        adjust_unread({user_id: 1 for user_id in recipients})
+        dispatch.enqueue(created)
+        events.publish(recipients, 'notification', {'title': title, 'message': message, 'type': type})
+    return created
+
+
+def ticket_assignees(ticket):
+    return TicketAssignee.objects.filter(ticket=ticket, is_active=True, is_deleted=False).values_list('user_id', flat=True)
+
+
+def leave_approvers(leave_request):
+    """The requester's manager and their company's admins."""
+    requester = User.all_objects.filter(pk=leave_request.user_id).values('company_id', 'manager_id_id').first()
+    if requester is None:
+        return []
+    approvers = Q(pk=requester['manager_id_id']) if requester['manager_id_id'] else Q(pk__in=[])
+    if requester['company_id']:
+        approvers |= Q(company_id=requester['company_id'], is_admin=True)
+    return User.all_objects.filter(approvers, is_active=True, is_deleted=False).values_list('pk', flat=True)
+
+
+def notify_ticket_assignees(ticket, title, message, exclude=None):
+    return notify(ticket_assignees(ticket), title, message, Notification.TYPE_TICKET_UPDATE, exclude=exclude)
+
+
+def notify_leave_approvers(leave_request, title, message):
+    return notify(
+        leave_approvers(leave_request), title, message, Notification.TYPE_LEAVE_UPDATE,
+        exclude=[leave_request.user_id],
+    )
+
+
+def unread_count(user):
+    counter = NotificationCounter.objects.filter(user_id=getattr(user, 'pk', user)).values_list('unread', flat=True).first()
+    return counter or 0
+
+
+def mark_read(user, ids=None, first_id=None, last_id=None):
+    """
+    Mark the user's unread notifications read, by explicit `ids` and/or the
+    inclusive id range [first_id, last_id] (either end open). Returns the count.
+    """
+    user_id = getattr(user, 'pk', user)
+    unread = Notification.objects.filter(user_id=user_id, is_read=False)
+    if ids is not None:
+        unread = unread.filter(pk__in=ids)
+    if first_id is not None:
+        unread = unread.filter(pk__gte=first_id)
+    if last_id is not None:
+        unread = unread.filter(pk__lte=last_id)
+    with transaction.atomic():
+        marked = unread.update(is_read=True)
+        adjust_unread({user_id: -marked})
+    return marked
+
+
+def recount(user_ids=None):
+    """Rebuild counters from the notifications table for `user_ids` (default all users)."""
+    users = User.all_objects.all()
+    if user_ids is not None:
+        users = users.filter(pk__in=user_ids)
+    totals = users.annotate(total=Count('notifications', filter=Q(notifications__is_read=False))).values_list('pk', 'total')
+    counters = [NotificationCounter(user_id=pk, unread=total) for pk, total in totals]
+    NotificationCounter.objects.bulk_create(
+        counters, update_conflicts=True, unique_fields=['user'], update_fields=['unread', 'updated_at'],
+        batch_size=FANOUT_BATCH_SIZE,
+    )
+    return len(counters)
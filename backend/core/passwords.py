@@ -0,0 +1,204 @@
+"""
+Password hashing for bulk user creation and credential migrations.
+
+The default hasher is deliberately slow, so hashing thousands of passwords on
+one thread leaves every other core idle. Inside `hashing_pool()` hashing is
+spread over a process pool of PASSWORD_HASH_WORKERS spawned processes (it is
+CPU-bound, threads would serialise on the GIL). Only commands and worker
+processes open the pool; web processes, small batches and
+PASSWORD_HASH_WORKERS=1 hash inline. Blank passwords become unusable ones.
+
+`bulk_create_users()` hashes the next batch on the pool while the current one
+is inserted. Hashes migrated from legacy systems (salted MD5) are wrapped in
+PBKDF2 straight away by `wrap_legacy_hashes()` and `upgrade_legacy_hashes()`,
+so no weak hash sits in the table; Django replaces a wrapped hash with a plain
+current one at the user's next login, as the wrapper is not the preferred
+hasher. Rehashing is thereby staged over logins instead of a mass reset.
+"""
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.hashers import MD5PasswordHasher, PBKDF2PasswordHasher, make_password
+
+# Below this many passwords the pool's startup costs more than it saves.
+POOL_THRESHOLD = 8
+BULK_BATCH_SIZE = 1000
+
+LEGACY_PREFIX = f'{MD5PasswordHasher.algorithm}$'
+
+_executor = None
+_pool_enabled = False
+
+
+class PBKDF2WrappedMD5PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2 over a legacy `md5$salt$hash`, so it can be strengthened without the password."""
+    algorithm = 'pbkdf2_wrapped_md5'
+
+    def encode_md5_hash(self, md5_hash, salt, iterations=None):
+        return super().encode(md5_hash, salt, iterations)
+
+    def encode(self, password, salt, iterations=None):
+        _, _, md5_hash = MD5PasswordHasher().encode(password, salt).split('$', 2)
+        return self.encode_md5_hash(md5_hash, salt, iterations)
+
+
+def _init_worker():
+    # Spawned (not forked) workers start without configured settings.
+    if not apps.ready:
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+        django.setup()
+
+
+def _hash(raw_password):
+    return make_password(raw_password or None)
+
+
+def _hash_many(raw_passwords):
+    return [_hash(raw) for raw in raw_passwords]
+
+
+def wrap_legacy_hash(encoded):
+    """`encoded` wrapped in PBKDF2 if it is a legacy MD5 hash, else unchanged."""
+    algorithm, _, rest = (encoded or '').partition('$')
+    if algorithm != MD5PasswordHasher.algorithm:
+        return encoded
+    salt, _, md5_hash = rest.partition('$')
+    return PBKDF2WrappedMD5PasswordHasher().encode_md5_hash(md5_hash, salt)
+
+
+def _wrap_many(hashes):
+    return [wrap_legacy_hash(encoded) for encoded in hashes]
+
+
+def worker_count():
+    workers = getattr(settings, 'PASSWORD_HASH_WORKERS', None)
+    return workers if workers is not None else (os.cpu_count() or 1)
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        # Spawned, as forking a process that runs threads can deadlock the children.
+        _executor = ProcessPoolExecutor(
+            max_workers=worker_count(), initializer=_init_worker, mp_context=multiprocessing.get_context('spawn'),
+        )
+    return _executor
+
+
+@contextmanager
+def hashing_pool():
+    """Hash on the process pool inside the block, shutting it down after. For commands and workers."""
+    global _pool_enabled
+    _pool_enabled = True
+    try:
+        yield
+    finally:
+        _pool_enabled = False
+        shutdown()
+
+
+def _submit(func, items):
+    """Start `func` over `items` (a list); returns futures whose results concatenate in order."""
+    if not _pool_enabled or worker_count() <= 1 or len(items) < POOL_THRESHOLD:
+        future = Future()
+        future.set_result(func(items))
+        return [future]
+    size = max(1, len(items) // (worker_count() * 4))
+    return [_pool().submit(func, items[start:start + size]) for start in range(0, len(items), size)]
+
+
+def _collect(futures):
+    return [value for future in futures for value in future.result()]
+
+
+def hash_passwords(raw_passwords):
+    """Hashes for `raw_passwords`, in order."""
+    return _collect(_submit(_hash_many, list(raw_passwords)))
+
+
+def wrap_legacy_hashes(hashes):
+    """`wrap_legacy_hash` over `hashes`, in order. Only the legacy ones go to the pool."""
+    hashes = list(hashes)
+    legacy = [index for index, encoded in enumerate(hashes) if (encoded or '').startswith(LEGACY_PREFIX)]
+    if legacy:
+        wrapped = _collect(_submit(_wrap_many, [hashes[index] for index in legacy]))
+        for index, encoded in zip(legacy, wrapped):
+            hashes[index] = encoded
+    return hashes
+
+
+def bulk_create_users(users, raw_passwords, batch_size=BULK_BATCH_SIZE):
+    """
+    Insert unsaved `users` with `raw_passwords` hashed on the pool, one INSERT
+    per batch. The next batch is hashing while the current one is written.
+    Users that already carry an encoded password keep it, and their raw
+    password is not hashed. Returns the saved users.
+    """
+    from .models import User
+
+    users, raw_passwords = list(users), list(raw_passwords)
+
+    def hash_batch(start):
+        pairs = zip(users[start:start + batch_size], raw_passwords[start:start + batch_size])
+        return _submit(_hash_many, [raw for user, raw in pairs if not user.password])
+
+    pending = hash_batch(0) if users else None
+    created = []
+    for start in range(0, len(users), batch_size):
+        hashes = iter(_collect(pending))
+        following = start + batch_size
+        if following < len(users):
+            pending = hash_batch(following)
+        batch = users[start:following]
+        for user in batch:
+            if not user.password:
+                user.password = next(hashes)
+        created += User.all_objects.bulk_create(batch)
+    return created
+
+
+def bulk_set_passwords(passwords_by_user_id, batch_size=BULK_BATCH_SIZE):
+    """Set new passwords {user_id: raw} (e.g. a policy reset), one UPDATE per batch. Returns the count."""
+    from .models import User
+
+    items = list(passwords_by_user_id.items())
+    for start in range(0, len(items), batch_size):
+        batch = items[start:start + batch_size]
+        hashes = hash_passwords(raw for _, raw in batch)
+        User.all_objects.bulk_update(
+            [User(pk=user_id, password=encoded) for (user_id, _), encoded in zip(batch, hashes)], ['password'],
+        )
+    return len(items)
+
+
+def upgrade_legacy_hashes(batch_size=BULK_BATCH_SIZE):
+    """Wrap every stored legacy MD5 hash in PBKDF2, batch by batch. Returns the count."""
+    from .models import User
+
+    upgraded = 0
+    last_pk = 0
+    while True:
+        batch = list(
+            User.all_objects.filter(pk__gt=last_pk, password__startswith=LEGACY_PREFIX)
+            .order_by('pk').values_list('pk', 'password')[:batch_size]
+        )
+        if not batch:
+            return upgraded
+        wrapped = wrap_legacy_hashes(encoded for _, encoded in batch)
+        User.all_objects.bulk_update(
+            [User(pk=pk, password=encoded) for (pk, _), encoded in zip(batch, wrapped)], ['password'],
+        )
+        upgraded += len(batch)
+        last_pk = batch[-1][0]
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
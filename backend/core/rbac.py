@@ -0,0 +1,446 @@
+"""
+Effective permission resolution for the company and project RBAC tables.
+
+A user's grants for one scope object are read in a single query, compiled into a
+frozenset of effective permission codes (ALLOW minus DENY) and memoised on the
+user instance, so repeated checks inside a request are dictionary lookups.
+
+Across requests the compiled sets live in the shared cache under keys stamped
+with the generation of the user and the scope object. Every write to a table
+that feeds resolution bumps those generations and records a
+PermissionAuditEvent in the same pass (see `record_changes`).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, OuterRef, QuerySet
+
+from .caching import bump_generations, get_generations
+from .models import (
+    Permission,
+    CompanyMembership,
+    CompanyPermissionAssignment,
+    PermissionAuditEvent,
+    ProjectPermissionAssignment,
+    ProjectRole,
+    ProjectRolePermission,
+    ProjectUser,
+)
+
+SCOPE_COMPANY = Permission.SCOPE_COMPANY
+SCOPE_PROJECT = Permission.SCOPE_PROJECT
+
+EFFECT_ALLOW = 'ALLOW'
+EFFECT_DENY = 'DENY'
+
+EMPTY = frozenset()
+
+_CACHE_ATTR = '_rbac_cache'
+
+GLOBAL_GENERATION = ('rbac', 'all')
+
+_GENERATION_NAMESPACE = {
+    SCOPE_COMPANY: 'company',
+    SCOPE_PROJECT: 'project',
+}
+
+
+def compile_grants(rows):
+    """Fold (code, effect) rows into the effective set; any DENY wins."""
+    allowed = set()
+    denied = set()
+    for code, effect in rows:
+        if effect == EFFECT_DENY:
+            denied.add(code)
+        else:
+            allowed.add(code)
+    return frozenset(allowed - denied)
+
+
+def company_grants(user_id, company_ids):
+    """
+    (company_id, code, effect) rows granted directly on the companies the
+    user is an active member of.
+    """
+    return CompanyPermissionAssignment.objects.filter(
+        user_id=user_id,
+        company_id__in=company_ids,
+        company__memberships__user_id=user_id,
+        company__memberships__is_active=True,
+        permission__scope=SCOPE_COMPANY,
+        permission__is_active=True,
+    ).values_list('company_id', 'permission__code', 'effect')
+
+
+def project_grants(user_id, project_ids):
+    """
+    (project_id, code, effect) rows for the projects: direct assignments
+    UNION ALL the permissions of the user's active project role, as one
+    statement.
+    """
+    direct = ProjectPermissionAssignment.objects.filter(
+        user_id=user_id,
+        project_id__in=project_ids,
+        permission__scope=SCOPE_PROJECT,
+        permission__is_active=True,
+    ).values_list('project_id', 'permission__code', 'effect')
+    via_role = ProjectRolePermission.objects.filter(
+        role__is_active=True,
+        role__projectuser__user_id=user_id,
+        role__projectuser__project_id__in=project_ids,
+        role__projectuser__is_active=True,
+        role__projectuser__is_deleted=False,
+        permission__scope=SCOPE_PROJECT,
+        permission__is_active=True,
+    ).values_list('role__projectuser__project_id', 'permission__code', 'effect')
+    return direct.union(via_role, all=True)
+
+
+_RESOLVERS = {
+    SCOPE_COMPANY: company_grants,
+    SCOPE_PROJECT: project_grants,
+}
+
+
+def scope_id(scope, obj):
+    """
+    Primary key of the company or project governing `obj`: the object itself,
+    or its `project` / `company` / `attached_to_company` foreign key.
+    """
+    if not hasattr(obj, 'pk'):
+        return obj
+    if scope == SCOPE_PROJECT:
+        if obj._meta.model_name == 'project':
+            return obj.pk
+        return obj.project_id
+    if obj._meta.model_name == 'company':
+        return obj.pk
+    company_id = getattr(obj, 'company_id', None)
+    if company_id is None:
+        company_id = getattr(obj, 'attached_to_company_id', None)
+    return company_id
+
+
+def get_permissions(user, scope, obj):
+    """
+    Effective permission codes for `user` on the company or project `obj`
+    (an instance or a primary key). Superusers get their literal grants here;
+    the override is applied by `has_perm`.
+
+    The per-instance memo lives for the request; writes made through another
+    instance are seen by the next request or after `clear_cache(user)`.
+    """
+    return get_permissions_many(user, scope, [obj]).get(scope_id(scope, obj), EMPTY)
+
+
+def get_permissions_many(user, scope, objs):
+    """
+    Effective permission sets for many scope objects (or objects carrying a
+    project/company foreign key), keyed by scope id. Whatever is not memoised
+    yet costs one shared-cache round trip and at most one query in total.
+    """
+    ids = {scope_id(scope, obj) for obj in objs}
+    ids.discard(None)
+    if not user or not user.is_authenticated:
+        return dict.fromkeys(ids, EMPTY)
+    memo = getattr(user, _CACHE_ATTR, None)
+    if memo is None:
+        memo = {}
+        setattr(user, _CACHE_ATTR, memo)
+    missing = [pk for pk in ids if (scope, pk) not in memo]
+    if missing:
+        for pk, permissions in _load(scope, user.pk, missing).items():
+            memo[(scope, pk)] = permissions
+    return {pk: memo[(scope, pk)] for pk in ids}
+
+
+def _load(scope, user_id, obj_ids):
+    namespace = _GENERATION_NAMESPACE[scope]
+    generations = get_generations(
+        GLOBAL_GENERATION,
+        ('user', user_id),
+        *[(namespace, pk) for pk in obj_ids],
+    )
+    stamp = ':'.join(map(str, generations[:2]))
+    keys = {
+        pk: 'rbac:perms:%s:%s:%s:%s:%s' % (scope, user_id, pk, stamp, generation)
+        for pk, generation in zip(obj_ids, generations[2:])
+    }
+    cached = cache.get_many(keys.values())
+    result = {pk: cached[key] for pk, key in keys.items() if key in cached}
+    missing = [pk for pk in obj_ids if pk not in result]
+    if missing:
+        rows = {pk: [] for pk in missing}
+        for pk, code, effect in _RESOLVERS[scope](user_id, missing):
+            rows[pk].append((code, effect))
+        loaded = {pk: compile_grants(grants) for pk, grants in rows.items()}
+        cache.set_many(
+            {keys[pk]: permissions for pk, permissions in loaded.items()},
+            getattr(settings, 'RBAC_CACHE_TIMEOUT', 3600),
+        )
+        result.update(loaded)
+    return result
+
+
+def get_company_permissions(user, company):
+    return get_permissions(user, SCOPE_COMPANY, company)
+
+
+def get_project_permissions(user, project):
+    return get_permissions(user, SCOPE_PROJECT, project)
+
+
+def has_perm(user, scope, code, obj):
+    if user and user.is_authenticated and user.is_superuser:
+        return True
+    return code in get_permissions(user, scope, obj)
+
+
+def has_company_perm(user, code, company):
+    return has_perm(user, SCOPE_COMPANY, code, company)
+
+
+def has_project_perm(user, code, project):
+    return has_perm(user, SCOPE_PROJECT, code, project)
+
+
+def has_perms_many(user, codes, objects, scope=SCOPE_PROJECT):
+    """
+    Answer every (code, object) pair at once: returns {object pk: {code: bool}}.
+    Objects are scope objects or rows pointing at one (e.g. tickets for the
+    project scope); all of them are resolved with at most one query.
+    """
+    objects = list(objects)
+    if user and user.is_authenticated and user.is_superuser:
+        return {obj.pk: dict.fromkeys(codes, True) for obj in objects}
+    permissions = get_permissions_many(user, scope, objects)
+    result = {}
+    for obj in objects:
+        granted = permissions.get(scope_id(scope, obj), EMPTY)
+        result[obj.pk] = {code: code in granted for code in codes}
+    return result
+
+
+def _direct_grant(user_id, project, code, effect):
+    return Exists(ProjectPermissionAssignment.objects.filter(
+        user_id=user_id,
+        project_id=project,
+        effect=effect,
+        permission__code=code,
+        permission__scope=SCOPE_PROJECT,
+        permission__is_active=True,
+    ))
+
+
+def _role_grant(user_id, project, code, effect):
+    # One filter() call, so the role permission conditions share a join.
+    return Exists(ProjectUser.objects.filter(
+        user_id=user_id,
+        project_id=project,
+        is_active=True,
+        is_deleted=False,
+        role__is_active=True,
+        role__role_permissions__effect=effect,
+        role__role_permissions__permission__code=code,
+        role__role_permissions__permission__scope=SCOPE_PROJECT,
+        role__role_permissions__permission__is_active=True,
+    ))
+
+
+def project_permission_q(user, code, project_field='pk'):
+    """
+    Condition matching rows whose project (`project_field` on the filtered
+    model) grants `code` to `user`: an ALLOW via direct assignment or role and
+    no DENY from either. Each branch is an EXISTS probe on the user-leading
+    assignment and project-user indexes.
+    """
+    project = OuterRef(project_field)
+    allowed = _direct_grant(user.pk, project, code, EFFECT_ALLOW) | _role_grant(user.pk, project, code, EFFECT_ALLOW)
+    denied = _direct_grant(user.pk, project, code, EFFECT_DENY) | _role_grant(user.pk, project, code, EFFECT_DENY)
+    return allowed & ~denied
+
+
+def filter_permitted(queryset, user, code, project_field='pk'):
+    """Restrict `queryset` in SQL to rows whose project grants `code`."""
+    if not user or not user.is_authenticated:
+        return queryset.none()
+    if user.is_superuser:
+        return queryset
+    return queryset.filter(project_permission_q(user, code, project_field))
+
+
+def clear_cache(user):
+    """Drop the permission sets memoised on this user instance."""
+    if hasattr(user, _CACHE_ATTR):
+        delattr(user, _CACHE_ATTR)
+
+
+# --- Invalidation and audit --------------------------------------------------
+
+# model -> (audit label, audit scope, snapshot fields)
+TRACKED = {
+    CompanyPermissionAssignment: (
+        'company_permission', SCOPE_COMPANY,
+        ('id', 'company_id', 'user_id', 'permission_id', 'effect', 'granted_by_id'),
+    ),
+    ProjectPermissionAssignment: (
+        'project_permission', SCOPE_PROJECT,
+        ('id', 'project_id', 'user_id', 'permission_id', 'effect', 'granted_by_id'),
+    ),
+    ProjectRolePermission: (
+        'project_role_permission', SCOPE_PROJECT,
+        ('id', 'role_id', 'permission_id', 'effect'),
+    ),
+    ProjectUser: (
+        'project_user', SCOPE_PROJECT,
+        ('id', 'project_id', 'user_id', 'role_id', 'is_active', 'is_deleted'),
+    ),
+    CompanyMembership: (
+        'company_membership', SCOPE_COMPANY,
+        ('id', 'company_id', 'user_id', 'role', 'is_active'),
+    ),
+}
+
+
+def snapshot(instance):
+    """Audit snapshot of an in-memory instance of a tracked model."""
+    return {field: getattr(instance, field) for field in TRACKED[type(instance)][2]}
+
+
+def fetch_snapshots(model, pks):
+    fields = TRACKED[model][2]
+    return {row['id']: row for row in model._base_manager.filter(pk__in=pks).values(*fields)}
+
+
+def _role_members(role_ids):
+    return list(ProjectUser._base_manager.filter(role_id__in=role_ids).values_list('role_id', 'user_id', 'project_id'))
+
+
+def _event_type(label, before, after):
+    if before is None:
+        return f'{label}.created'
+    if after is None:
+        return f'{label}.deleted'
+    return f'{label}.updated'
+
+
+def record_changes(model, changes, audit=True):
+    """
+    Invalidate cached permission sets and write audit events for a batch of
+    (before, after) snapshots of one tracked model; either side may be None.
+    """
+    label, scope, _ = TRACKED[model]
+    changes = [(before, after) for before, after in changes if before != after]
+    if not changes:
+        return
+
+    generations = set()
+    events = []
+    if model is ProjectRolePermission:
+        role_ids = {row['role_id'] for pair in changes for row in pair if row}
+        members = _role_members(role_ids)
+        generations.update(('project', project_id) for _, _, project_id in members)
+        for before, after in changes:
+            row = after or before
+            for role_id, user_id, project_id in members:
+                if role_id == row['role_id']:
+                    events.append((before, after, user_id, None, project_id))
+    else:
+        for before, after in changes:
+            row = after or before
+            for side in (before, after):
+                if side:
+                    generations.add(('user', side['user_id']))
+                    if model is CompanyMembership:
+                        generations.add(('company', side['company_id']))
+            events.append((before, after, row['user_id'], row.get('company_id'), row.get('project_id')))
+
+    if audit and events:
+        PermissionAuditEvent.objects.bulk_create([
+            PermissionAuditEvent(
+                actor_id=(after or before).get('granted_by_id'),
+                target_user_id=user_id,
+                scope=scope,
+                company_id=company_id,
+                project_id=project_id,
+                event_type=_event_type(label, before, after),
+                before_state=before,
+                after_state=after,
+            )
+            for before, after, user_id, company_id, project_id in events
+        ])
+    invalidate(generations)
+
+
+def invalidate(generations):
+    """
+    Bump generations now, so the writing transaction reads its own changes,
+    and again on commit, so sets cached by concurrent readers from the
+    pre-commit state are dropped too.
+    """
+    generations = set(generations)
+    if not generations:
+        return
+    bump_generations(generations)
+    transaction.on_commit(lambda: bump_generations(generations))
+
+
+def track_update(queryset, update, values):
+    """Run a bulk `update()` on a tracked queryset and record its effect."""
+    before = {row['id']: row for row in queryset.values(*TRACKED[queryset.model][2])}
+    count = update(**values)
+    if before:
+        after = fetch_snapshots(queryset.model, before)
+        record_changes(queryset.model, [(row, after.get(pk)) for pk, row in before.items()])
+    return count
+
+
+def track_bulk_create(model, objs):
+    record_changes(model, [(None, snapshot(obj)) for obj in objs if obj.pk is not None])
+
+
+# Signal receivers, connected in CoreConfig.ready().
+
+def stash_snapshot(sender, instance, raw=False, **kwargs):
+    instance._rbac_before = None
+    if not raw and not instance._state.adding and instance.pk is not None:
+        instance._rbac_before = fetch_snapshots(sender, [instance.pk]).get(instance.pk)
+
+
+def record_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    record_changes(sender, [(getattr(instance, '_rbac_before', None), snapshot(instance))])
+
+
+def record_delete(sender, instance, origin=None, **kwargs):
+    # Rows removed by a cascade from their company, project or user cannot be
+    # audited against it; they are only invalidated.
+    if isinstance(origin, QuerySet):
+        direct = origin.model is sender
+    else:
+        direct = origin is None or isinstance(origin, sender)
+    record_changes(sender, [(snapshot(instance), None)], audit=direct)
+
+
+def invalidate_role(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate(('project', project_id) for _, _, project_id in _role_members([instance.pk]))
+
+
+def invalidate_all(sender, raw=False, **kwargs):
+    if not raw:
+        invalidate([GLOBAL_GENERATION])
+
+
+def connect_signals():
+    from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+
+    for model in TRACKED:
+        pre_save.connect(stash_snapshot, sender=model, dispatch_uid=f'rbac_stash_{model.__name__}')
+        post_save.connect(record_save, sender=model, dispatch_uid=f'rbac_save_{model.__name__}')
+        post_delete.connect(record_delete, sender=model, dispatch_uid=f'rbac_delete_{model.__name__}')
+    post_save.connect(invalidate_role, sender=ProjectRole, dispatch_uid='rbac_role_save')
+    pre_delete.connect(invalidate_role, sender=ProjectRole, dispatch_uid='rbac_role_delete')
+    post_save.connect(invalidate_all, sender=Permission, dispatch_uid='rbac_permission_save')
+    post_delete.connect(invalidate_all, sender=Permission, dispatch_uid='rbac_permission_delete')
@@ -0,0 +1,160 @@
+"""
+Attendance reporting over pre-aggregated monthly rollups.
+
+Every change to an Attendance row marks its (user, month) dirty; after the
+writing transaction commits, the affected MonthlyAttendanceRollup rows are
+recomputed from that month's Attendance with one grouped query and upserted.
+Reports then aggregate at most twelve rows per user per year and can be routed
+to a read replica via settings.REPORTING_DATABASE.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncMonth
+
+from .models import Attendance, MonthlyAttendanceRollup, User
+
+ROLLUP_FIELDS = [
+    'worked_seconds',
+    'overtime_seconds',
+    'present_days',
+    'late_days',
+    'absent_days',
+    'half_days',
+    'leave_days',
+]
+
+# group_by -> [(output key, lookup path)]
+GROUPINGS = {
+    'user': [('user_id', 'user_id'), ('email', 'user__email')],
+    'department': [
+        ('department_id', 'user__employee__designation__department_id'),
+        ('department', 'user__employee__designation__department__name'),
+    ],
+    'company': [('company_id', 'company_id')],
+}
+
+REBUILD_CHUNK_SIZE = 500
+
+
+def month_start(date):
+    return date.replace(day=1)
+
+
+def next_month(date):
+    return (date.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+
+
+def reporting_database():
+    alias = getattr(settings, 'REPORTING_DATABASE', 'default')
+    return alias if alias in connections.databases else 'default'
+
+
+def refresh_rollups(pairs):
+    """
+    Recompute the rollups for an iterable of (user_id, date) pairs, where
+    each date stands for its month, with one grouped query and one upsert.
+    """
+    keys = {(user_id, month_start(date)) for user_id, date in pairs}
+    if not keys:
+        return 0
+    user_ids = {user_id for user_id, _ in keys}
+    months = {month for _, month in keys}
+    totals = Attendance.objects.filter(
+        user_id__in=user_ids,
+        date__gte=min(months),
+        date__lt=next_month(max(months)),
+    ).annotate(month=TruncMonth('date')).values('user_id', 'month').annotate(
+        worked_seconds=Sum('total_worked_seconds'),
+        overtime_seconds=Sum('overtime_seconds'),
+        present_days=Count('pk', filter=Q(status__in=Attendance.WORKED_STATUSES + [Attendance.STATUS_HALF_DAY])),
+        late_days=Count('pk', filter=Q(is_late=True)),
+        absent_days=Count('pk', filter=Q(is_absent=True)),
+        half_days=Count('pk', filter=Q(status=Attendance.STATUS_HALF_DAY)),
+        leave_days=Count('pk', filter=Q(status=Attendance.STATUS_LEAVE)),
+    )
+    totals = {(row['user_id'], row['month']): row for row in totals}
+    companies = dict(User.all_objects.filter(pk__in=user_ids).values_list('pk', 'company_id'))
+
+    rollups = []
+    for user_id, month in keys:
+        if user_id not in companies:
+            continue
+        row = totals.get((user_id, month), {})
+        rollups.append(MonthlyAttendanceRollup(
+            company_id=companies[user_id],
+            user_id=user_id,
+            month=month,
+            **{field: row.get(field) or 0 for field in ROLLUP_FIELDS},
+        ))
+    MonthlyAttendanceRollup.objects.bulk_create(
+        rollups,
+        update_conflicts=True,
+        unique_fields=['user', 'month'],
+        update_fields=['company'] + ROLLUP_FIELDS + ['updated_at'],
+    )
+    return len(rollups)
+
+
+def mark_dirty(pairs):
+    """Refresh the months of these (user_id, date) pairs once the transaction commits."""
+    pairs = set(pairs)
+    if pairs:
+        transaction.on_commit(lambda: refresh_rollups(pairs))
+
+
+def mark_attendance_dirty(attendance_ids):
+    attendance_ids = set(attendance_ids)
+    if attendance_ids:
+        transaction.on_commit(lambda: refresh_rollups(
+            Attendance.objects.filter(pk__in=attendance_ids).values_list('user_id', 'date')
+        ))
+
+
+def rebuild_rollups(company=None, start=None, end=None, chunk_size=REBUILD_CHUNK_SIZE):
+    """Backfill rollups from Attendance, `chunk_size` (user, month) pairs at a time."""
+    days = Attendance.objects.all()
+    if company is not None:
+        days = days.filter(user__company=company)
+    if start is not None:
+        days = days.filter(date__gte=month_start(start))
+    if end is not None:
+        days = days.filter(date__lt=next_month(end))
+    pairs = days.annotate(month=TruncMonth('date')).values_list('user_id', 'month').distinct().order_by('user_id', 'month')
+    count = 0
+    chunk = []
+    for pair in pairs.iterator(chunk_size=chunk_size):
+        chunk.append(pair)
+        if len(chunk) == chunk_size:
+            count += refresh_rollups(chunk)
+            chunk = []
+    return count + refresh_rollups(chunk)
+
+
+def attendance_report(company, start, end, group_by='user', by_month=False):
+    """
+    Totals per user, department or company for the months from `start` to
+    `end` (inclusive), optionally broken down by month, read from the rollups.
+    """
+    if group_by not in GROUPINGS:
+        raise ValueError(f'group_by must be one of {", ".join(GROUPINGS)}.')
+    columns = list(GROUPINGS[group_by])
+    if by_month:
+        columns.append(('month', 'month'))
+    keys = [path for _, path in columns]
+    rows = MonthlyAttendanceRollup.objects.using(reporting_database()).filter(
+        company=company,
+        month__gte=month_start(start),
+        month__lte=month_start(end),
+    ).values(*keys).annotate(
+        **{f'total_{field}': Sum(field) for field in ROLLUP_FIELDS}
+    ).order_by(*keys)
+    return [
+        {
+            **{label: row[path] for label, path in columns},
+            **{field: row[f'total_{field}'] for field in ROLLUP_FIELDS},
+        }
+        for row in rows
+    ]
@@ -0,0 +1,56 @@
+"""
+Notification retention.
+
+Read notifications older than NOTIFICATION_RETENTION_DAYS are moved to
+ArchivedNotification in chunks: each chunk locks only its own rows (skipping
+any a writer holds), copies them and deletes them in one short transaction, so
+the hot table stays small and is never locked wholesale. The archive is read
+through the notifications `archive` endpoint.
+"""
+import datetime
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedNotification, Notification
+
+ARCHIVE_FIELDS = ('id', 'user_id', 'title', 'message', 'type', 'created_at')
+
+
+def archive_chunk(cutoff, chunk_size):
+    """Archive up to `chunk_size` read notifications created before `cutoff`. Returns how many moved."""
+    with transaction.atomic():
+        rows = list(
+            Notification.objects.select_for_update(skip_locked=True).filter(
+                is_read=True, created_at__lt=cutoff,
+            ).order_by('created_at', 'pk').values(*ARCHIVE_FIELDS)[:chunk_size]
+        )
+        if not rows:
+            return 0
+        ArchivedNotification.objects.bulk_create(
+            [ArchivedNotification(**row) for row in rows], ignore_conflicts=True,
+        )
+        Notification.objects.filter(pk__in=[row['id'] for row in rows], is_read=True).delete()
+    return len(rows)
+
+
+def archive_notifications(older_than=None, chunk_size=None, max_chunks=None, pause=0):
+    """
+    Archive read notifications older than `older_than` (a timedelta, default
+    NOTIFICATION_RETENTION_DAYS), `pause` seconds apart per chunk. Returns the count.
+    """
+    older_than = older_than or datetime.timedelta(days=settings.NOTIFICATION_RETENTION_DAYS)
+    chunk_size = chunk_size or settings.NOTIFICATION_ARCHIVE_CHUNK_SIZE
+    cutoff = timezone.now() - older_than
+    archived = chunks = 0
+    while max_chunks is None or chunks < max_chunks:
+        moved = archive_chunk(cutoff, chunk_size)
+        archived += moved
+        chunks += 1
+        if moved < chunk_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return archived
@@ -0,0 +1,121 @@
+"""
+Effective routine (shift) resolution.
+
+A user's routine on a date is their latest EmployeeRoutineTimings row created
+on or before that date, else the newest active RoutineTemplate for their
+designation. Single lookups are cached per (user, date) under generation-stamped
+keys that routine and designation writes invalidate; bulk lookups resolve a
+whole set of users in one query.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .caching import bump_generations, get_generations
+from .models import EmployeeRoutineTimings, RoutineTemplate, User
+
+ROUTINE_FIELDS = (
+    'start_time',
+    'end_time',
+    'late_grace_period_seconds',
+    'early_leave_grace_period_seconds',
+    'minimum_work_hours_seconds',
+    'maximum_work_hours_seconds',
+    'approved_break_duration_seconds',
+)
+
+SOURCE_EMPLOYEE = 'EMPLOYEE'
+SOURCE_TEMPLATE = 'TEMPLATE'
+
+EffectiveRoutine = namedtuple('EffectiveRoutine', ('source',) + ROUTINE_FIELDS)
+
+TEMPLATES_GENERATION = ('routine', 'templates')
+
+# Cached marker for users with no routine at all.
+_NONE = 'none'
+
+
+def _timings(user_ref, date):
+    return EmployeeRoutineTimings.objects.filter(
+        user_id=OuterRef(user_ref), created_at__date__lte=date,
+    ).order_by('-created_at', '-pk')
+
+
+def _templates(user_ref):
+    return RoutineTemplate.objects.filter(
+        for_designation__employee__user_id=OuterRef(user_ref), is_active=True,
+    ).order_by('-updated_at', '-pk')
+
+
+def routine_value(field, date, user_ref='pk'):
+    """
+    Expression for one routine field of the user referenced by `user_ref` in
+    the outer query, for use in annotations and set-based UPDATEs.
+    """
+    return Coalesce(
+        Subquery(_timings(user_ref, date).values(field)[:1]),
+        Subquery(_templates(user_ref).values(field)[:1]),
+    )
+
+
+def resolve_routines(users=None, date=None, department=None):
+    """
+    {user_id: EffectiveRoutine or None} for the given users (instances or
+    ids) or for every employee of `department`, in a single query.
+    """
+    date = date or timezone.localdate()
+    queryset = User.all_objects.all()
+    if users is not None:
+        queryset = queryset.filter(pk__in=[getattr(user, 'pk', user) for user in users])
+    if department is not None:
+        queryset = queryset.filter(employee__designation__department=department)
+    rows = queryset.annotate(
+        routine_timing_id=Subquery(_timings('pk', date).values('pk')[:1]),
+        routine_template_id=Subquery(_templates('pk').values('pk')[:1]),
+        **{f'routine_{field}': routine_value(field, date) for field in ROUTINE_FIELDS},
+    ).values('pk', 'routine_timing_id', 'routine_template_id', *[f'routine_{field}' for field in ROUTINE_FIELDS])
+
+    result = {}
+    for row in rows:
+        if row['routine_timing_id'] is not None:
+            source = SOURCE_EMPLOYEE
+        elif row['routine_template_id'] is not None:
+            source = SOURCE_TEMPLATE
+        else:
+            result[row['pk']] = None
+            continue
+        result[row['pk']] = EffectiveRoutine(source, *[row[f'routine_{field}'] for field in ROUTINE_FIELDS])
+    return result
+
+
+def _cache_keys(user_ids, date):
+    generations = get_generations(TEMPLATES_GENERATION, *[('routine_user', pk) for pk in user_ids])
+    return {
+        pk: f'routine:{pk}:{date.isoformat()}:{generations[0]}:{generation}'
+        for pk, generation in zip(user_ids, generations[1:])
+    }
+
+
+def resolve_routine(user, date=None):
+    """Cached effective routine for one user on `date` (default today)."""
+    date = date or timezone.localdate()
+    user_id = getattr(user, 'pk', user)
+    key = _cache_keys([user_id], date)[user_id]
+    cached = cache.get(key)
+    if cached is None:
+        routine = resolve_routines([user_id], date).get(user_id)
+        cache.set(key, routine or _NONE, getattr(settings, 'ROUTINE_CACHE_TIMEOUT', 3600))
+        return routine
+    return None if cached == _NONE else cached
+
+
+def invalidate_user(user_id):
+    bump_generations([('routine_user', user_id)])
+
+
+def invalidate_templates():
+    bump_generations([TEMPLATES_GENERATION])
@@ -0,0 +1,148 @@
+"""
+Keyword search over projects, tickets, ticket updates and comments.
+
+On PostgreSQL each searchable table has a `search_vector` tsvector column kept
+current by a trigger (migration 0010) and a GIN index, so a search is one
+indexed match per source ranked with ts_rank and highlighted with ts_headline.
+Other backends (the SQLite test database) fall back to icontains matching with
+ranking and highlighting done in Python. Either way results are confined to the
+current tenant by the default managers and to projects the user may view.
+"""
+import re
+from collections import namedtuple
+
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F, IntegerField, Q, TextField, Value
+from django.db.models.functions import Coalesce, Concat
+
+from . import rbac
+from .models import Project, Ticket, TicketComment, TicketUpdate
+
+SEARCH_CONFIG = 'english'
+SEARCH_PERMISSION = 'project.view'
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_STOP = '</mark>'
+SNIPPET_WORDS = 30
+
+# kind, model, weighted text fields (A first), project path, ticket path, title field
+Source = namedtuple('Source', 'kind model fields project_field ticket_field title_field')
+
+SOURCES = [
+    Source('project', Project, ('name', 'description'), 'pk', None, 'name'),
+    Source('ticket', Ticket, ('name', 'description'), 'project', 'pk', 'name'),
+    Source('update', TicketUpdate, ('update',), 'ticket__project', 'ticket', 'ticket__name'),
+    Source('comment', TicketComment, ('comment',), 'ticket__project', 'ticket', 'ticket__name'),
+]
+KINDS = [source.kind for source in SOURCES]
+
+# Fallback ranking weights, mirroring setweight() 'A' and 'B' in the triggers.
+FIELD_WEIGHTS = (1.0, 0.4)
+
+
+def use_full_text():
+    return connection.vendor == 'postgresql'
+
+
+def _terms(query):
+    return [term for term in re.findall(r'\w+', query.lower()) if term]
+
+
+def _columns(source):
+    """Common result columns, aliased clear of the models' own field names."""
+    return {
+        'result_project': F(source.project_field),
+        'result_ticket': F(source.ticket_field) if source.ticket_field else Value(None, output_field=IntegerField()),
+        'result_title': F(source.title_field),
+    }
+
+
+def _snippet_text(source):
+    if len(source.fields) == 1:
+        return F(source.fields[0])
+    parts = []
+    for field in source.fields:
+        parts += [Coalesce(field, Value('')), Value(' ')]
+    return Concat(*parts[:-1], output_field=TextField())
+
+
+def _result(source, row, rank, headline):
+    return {
+        'type': source.kind,
+        'id': row['pk'],
+        'project_id': row['result_project'],
+        'ticket_id': row['result_ticket'],
+        'title': row['result_title'],
+        'headline': headline,
+        'rank': rank,
+    }
+
+
+def _full_text(queryset, source, query, limit):
+    search = SearchQuery(query, search_type='websearch', config=SEARCH_CONFIG)
+    rows = queryset.filter(search_vector=search).annotate(
+        rank=SearchRank(F('search_vector'), search),
+        headline=SearchHeadline(
+            _snippet_text(source), search, config=SEARCH_CONFIG,
+            start_sel=HIGHLIGHT_START, stop_sel=HIGHLIGHT_STOP,
+            max_words=SNIPPET_WORDS, min_words=SNIPPET_WORDS // 2,
+        ),
+        **_columns(source),
+    ).order_by('-rank', '-pk').values('pk', 'rank', 'headline', *_columns(source))[:limit]
+    return [_result(source, row, row['rank'], row['headline']) for row in rows]
+
+
+def highlight(text, terms):
+    """Window of about SNIPPET_WORDS words around the first match, terms marked."""
+    words = (text or '').split()
+    lowered = [word.lower() for word in words]
+    first = next((i for i, word in enumerate(lowered) if any(term in word for term in terms)), 0)
+    start = max(0, first - SNIPPET_WORDS // 3)
+    window = ' '.join(words[start:start + SNIPPET_WORDS])
+    if not terms:
+        return window
+    pattern = re.compile('|'.join(re.escape(term) for term in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+    return pattern.sub(lambda match: f'{HIGHLIGHT_START}{match.group(0)}{HIGHLIGHT_STOP}', window)
+
+
+def _fallback(queryset, source, query, limit):
+    terms = _terms(query)
+    if not terms:
+        return []
+    condition = Q()
+    for term in terms:
+        matches = Q()
+        for field in source.fields:
+            matches |= Q(**{f'{field}__icontains': term})
+        condition &= matches
+    rows = queryset.filter(condition).annotate(**_columns(source)).values('pk', *source.fields, *_columns(source))
+    results = []
+    for row in rows:
+        texts = [(row[field] or '').lower() for field in source.fields]
+        rank = sum(weight * text.count(term) for text, weight in zip(texts, FIELD_WEIGHTS) for term in terms)
+        text = ' '.join(row[field] or '' for field in source.fields)
+        results.append(_result(source, row, rank, highlight(text, terms)))
+    results.sort(key=lambda result: (-result['rank'], -result['id']))
+    return results[:limit]
+
+
+def search(user, query, kinds=None, limit=DEFAULT_LIMIT):
+    """
+    Ranked matches for `query` across `kinds` (default all), best first, as
+    dicts with type, id, project_id, ticket_id, title, headline and rank.
+    """
+    query = (query or '').strip()
+    if not query:
+        return []
+    limit = max(1, min(limit, MAX_LIMIT))
+    run = _full_text if use_full_text() else _fallback
+    results = []
+    for source in SOURCES:
+        if kinds and source.kind not in kinds:
+            continue
+        queryset = rbac.filter_permitted(source.model.objects.all(), user, SEARCH_PERMISSION, source.project_field)
+        results.extend(run(queryset, source, query, limit))
+    results.sort(key=lambda result: -result['rank'])
+    return results[:limit]
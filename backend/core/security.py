@@ -1,5 +1,8 @@
 from rest_framework import permissions
 
+from . import rbac
+from .models import Company, Project
+
 class IsSuperAdmin(permissions.BasePermission):
     """
     Allows access only to superusers.
@@ -38,4 +41,52 @@ class IsSameCompany(permissions.BasePermission):
         if hasattr(obj, 'attached_to_company'):
             return obj.attached_to_company == request.user.company
 
-        return False
\ No newline at end of file
+        return False
+
+class HasCompanyPermission(permissions.BasePermission):
+    """
+    Requires `view.required_company_permission` in the user's effective grants
+    for writes, and `view.required_company_read_permission` (if set) for
+    reads, on their own company and on the object's. Views without the
+    attribute are not restricted.
+    """
+    def required_code(self, request, view):
+        if request.method in permissions.SAFE_METHODS:
+            return getattr(view, 'required_company_read_permission', None)
+        return getattr(view, 'required_company_permission', None)
+
+    def has_permission(self, request, view):
+        code = self.required_code(request, view)
+        if code is None:
+            return True
+        if request.user.is_superuser:
+            return True
+        if not request.user.company_id:
+            return False
+        return rbac.has_company_perm(request.user, code, request.user.company_id)
+
+    def has_object_permission(self, request, view, obj):
+        code = self.required_code(request, view)
+        if code is None:
+            return True
+        if isinstance(obj, Company):
+            company_id = obj.pk
+        else:
+            company_id = getattr(obj, 'company_id', None) or getattr(obj, 'attached_to_company_id', None)
+        if company_id is None:
+            return request.user.is_superuser
+        return rbac.has_company_perm(request.user, code, company_id)
+
+class HasProjectPermission(permissions.BasePermission):
+    """
+    Object-level check of `view.required_project_permission` against the
+    project RBAC tables. The project is the object itself or its `project`.
+    """
+    def has_object_permission(self, request, view, obj):
+        code = getattr(view, 'required_project_permission', None)
+        if code is None:
+            return True
+        project_id = obj.pk if isinstance(obj, Project) else getattr(obj, 'project_id', None)
+        if project_id is None:
+            return request.user.is_superuser
+        return rbac.has_project_perm(request.user, code, project_id)
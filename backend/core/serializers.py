@@ -1,15 +1,56 @@
 from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
+from . import rbac
 from .models import (
     User, Company, Profile, Department, Designation, Employee,
     Attendance, TimeLog, LeaveRequest, LeaveType,
-    Project, Client, Ticket, TicketType, TicketUpdate, TicketComment, TicketAttachement,
-    Notification
+    Project, Client, Ticket, TicketType, TicketUpdate, TicketComment, TicketAttachement, TicketActivity,
+    ArchivedNotification, Notification, UploadSession, UserImport,
 )
 
+# Flags project and ticket rows carry, so clients can show or hide actions.
+PROJECT_PERMISSION_FLAGS = ('project.edit', 'project.delete')
+
+class PermissionFlagsField(serializers.Field):
+    """
+    Read-only {code: bool} map of the requesting user's permissions on the
+    object's project (or company). When the serializer is rendering a list,
+    the whole page is resolved with one `rbac.get_permissions_many` call
+    before the first row, so the field adds a constant number of queries.
+    """
+    def __init__(self, codes, scope=rbac.SCOPE_PROJECT, **kwargs):
+        self.codes = tuple(codes)
+        self.scope = scope
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def _user(self):
+        request = self.context.get('request')
+        return getattr(request, 'user', None)
+
+    def _prefetch(self, user):
+        root = self.root
+        if isinstance(root, serializers.ListSerializer) and not getattr(root, '_rbac_prefetched', False):
+            root._rbac_prefetched = True
+            if root.instance is not None:
+                rbac.get_permissions_many(user, self.scope, root.instance)
+
+    def to_representation(self, obj):
+        user = self._user()
+        self._prefetch(user)
+        return rbac.has_perms_many(user, self.codes, [obj], scope=self.scope)[obj.pk]
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'email', 'username', 'first_name', 'last_name', 'company', 'is_employee', 'is_admin']
+        # User.objects is tenant scoped and hides soft-deleted users, but the
+        # unique constraints span the whole table.
+        extra_kwargs = {
+            'email': {'validators': [UniqueValidator(queryset=User.all_objects.all())]},
+            'username': {'validators': [User.username_validator, UniqueValidator(queryset=User.all_objects.all())]},
+        }
 
 class CompanySerializer(serializers.ModelSerializer):
     class Meta:
@@ -45,6 +86,19 @@ class TimeLogSerializer(serializers.ModelSerializer):
         model = TimeLog
         fields = '__all__'
 
+class PunchSerializer(serializers.Serializer):
+    """One check-in/check-out event from a badge reader or kiosk batch."""
+    user_id = serializers.IntegerField()
+    check_in = serializers.DateTimeField()
+    check_out = serializers.DateTimeField(required=False, allow_null=True)
+    check_in_reason = serializers.CharField(required=False, allow_blank=True, default='')
+    check_out_reason = serializers.CharField(required=False, allow_blank=True, default='')
+
+    def validate(self, data):
+        if data.get('check_out') and data['check_out'] <= data['check_in']:
+            raise serializers.ValidationError({'check_out': 'Check-out time must be after check-in time.'})
+        return data
+
 class AttendanceSerializer(serializers.ModelSerializer):
     timelogs = TimeLogSerializer(many=True, read_only=True)
     
@@ -77,10 +131,11 @@ class ProjectSerializer(serializers.ModelSerializer):
     client_id = serializers.PrimaryKeyRelatedField(
         queryset=Client.objects.all(), source='client', write_only=True
     )
+    permissions = PermissionFlagsField(PROJECT_PERMISSION_FLAGS)
     
     class Meta:
         model = Project
-        fields = '__all__'
+        exclude = ['search_vector']
 
 class TicketTypeSerializer(serializers.ModelSerializer):
     class Meta:
@@ -93,22 +148,49 @@ class TicketSerializer(serializers.ModelSerializer):
         queryset=Project.objects.all(), source='project', write_only=True
     )
     assigned_to = UserSerializer(many=True, read_only=True)
+    permissions = PermissionFlagsField(PROJECT_PERMISSION_FLAGS)
     
     class Meta:
         model = Ticket
-        fields = '__all__'
+        exclude = ['search_vector']
 
 class TicketUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = TicketUpdate
-        fields = '__all__'
+        exclude = ['search_vector']
 
 class TicketAttachementSerializer(serializers.ModelSerializer):
     class Meta:
         model = TicketAttachement
         fields = '__all__'
 
+class TicketActivitySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TicketActivity
+        fields = ['id', 'kind', 'source_id', 'actor', 'actor_name', 'data', 'created_at']
+
 class NotificationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Notification
         fields = '__all__'
+
+class ArchivedNotificationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ArchivedNotification
+        fields = ['id', 'title', 'message', 'type', 'created_at', 'archived_at']
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$', required=False, allow_blank=True)
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'kind', 'filename', 'size', 'sha256', 'ticket_update', 'offset', 'status', 'error', 'attachment']
+        read_only_fields = ['offset', 'status', 'error', 'attachment']
+
+class UserImportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UserImport
+        fields = [
+            'id', 'filename', 'status', 'created', 'managers_linked', 'errors', 'error',
+            'created_at', 'started_at', 'finished_at',
+        ]
@@ -0,0 +1,136 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import blobs, boards, dispatch, events, notifications, reporting, routines, timeline
+from .models import (
+    Attendance, Employee, EmployeeRoutineTimings, Notification, RoutineTemplate, Ticket, TicketAssignee,
+    TicketAttachement, TicketComment, TicketUpdate, TimeLog,
+)
+
+
+@receiver(post_delete, sender=TimeLog)
+def subtract_deleted_timelog(sender, instance, **kwargs):
+    # Also covers queryset deletes; rows removed with their Attendance are a no-op.
+    Attendance.apply_worked_delta(
+        instance.attendance_id,
+        -TimeLog.worked_seconds(instance.check_in, instance.check_out),
+    )
+
+
+@receiver(post_save, sender=EmployeeRoutineTimings)
+@receiver(post_delete, sender=EmployeeRoutineTimings)
+@receiver(post_save, sender=Employee)
+@receiver(post_delete, sender=Employee)
+def invalidate_user_routine(sender, instance, raw=False, **kwargs):
+    if not raw:
+        routines.invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=RoutineTemplate)
+@receiver(post_delete, sender=RoutineTemplate)
+def invalidate_routine_templates(sender, raw=False, **kwargs):
+    if not raw:
+        routines.invalidate_templates()
+
+
+@receiver(post_save, sender=Attendance)
+@receiver(post_delete, sender=Attendance)
+def refresh_attendance_rollup(sender, instance, raw=False, **kwargs):
+    if not raw:
+        reporting.mark_dirty([(instance.user_id, instance.date)])
+
+
+@receiver(post_save, sender=TicketUpdate)
+@receiver(post_save, sender=TicketComment)
+@receiver(post_save, sender=TicketAttachement)
+def sync_ticket_activity(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created and not instance.is_deleted:
+        timeline.record(instance)
+    elif not created:
+        timeline.sync(instance)
+
+
+@receiver(post_delete, sender=TicketUpdate)
+@receiver(post_delete, sender=TicketComment)
+@receiver(post_delete, sender=TicketAttachement)
+def remove_ticket_activity(sender, instance, **kwargs):
+    timeline.forget(instance)
+
+
+@receiver(post_save, sender=Ticket)
+@receiver(post_delete, sender=Ticket)
+def invalidate_ticket_board(sender, instance, raw=False, **kwargs):
+    if not raw:
+        boards.invalidate({instance.project_id, getattr(instance, '_loaded_project_id', None)})
+        instance._loaded_project_id = instance.project_id
+
+
+@receiver(post_save, sender=TicketAssignee)
+@receiver(post_delete, sender=TicketAssignee)
+def invalidate_assignee_board(sender, instance, raw=False, **kwargs):
+    if not raw:
+        boards.invalidate(Ticket.all_objects.filter(pk=instance.ticket_id).values_list('project_id', flat=True))
+
+
+@receiver(post_save, sender=TicketAttachement)
+def reference_attachment_blob(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        blobs.record_attachment(instance)
+
+
+@receiver(post_delete, sender=TicketAttachement)
+def release_attachment_blob(sender, instance, **kwargs):
+    if instance.content_hash:
+        blobs.release(instance.content_hash)
+
+
+@receiver(post_save, sender=Notification)
+def count_created_notification(sender, instance, created, raw=False, **kwargs):
+    # bulk_create() in core.notifications counts its own rows.
+    if created and not raw and not instance.is_read:
+        notifications.adjust_unread({instance.user_id: 1})
+        dispatch.enqueue([instance])
+        events.publish([instance.user_id], 'notification', {
+            'id': instance.pk, 'title': instance.title, 'message': instance.message, 'type': instance.type,
+        })
+
+
+@receiver(post_delete, sender=Notification)
+def uncount_deleted_notification(sender, instance, **kwargs):
+    if not instance.is_read:
+        notifications.adjust_unread({instance.user_id: -1})
+
+
+@receiver(post_save, sender=TicketUpdate)
+def push_ticket_update(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        watchers = set(notifications.ticket_assignees(instance.ticket_id))
+        watchers.update(Ticket.all_objects.filter(pk=instance.ticket_id).values_list('created_by_id', flat=True))
+        events.publish(watchers, 'ticket.update', {
+            'ticket_id': instance.ticket_id, 'update_id': instance.pk,
+            'status': instance.status, 'priority': instance.priority,
+        })
+
+
+@receiver(post_save, sender=Attendance)
+def push_attendance_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        events.publish([instance.user_id], 'attendance', {
+            'attendance_id': instance.pk, 'date': instance.date, 'status': instance.status,
+            'total_worked_seconds': instance.total_worked_seconds,
+        })
+
+
+@receiver(post_save, sender=TimeLog)
+def push_punch(sender, instance, raw=False, **kwargs):
+    if not raw:
+        if TimeLog.attendance.is_cached(instance):
+            user_id = instance.attendance.user_id
+        else:
+            user_id = Attendance.objects.filter(pk=instance.attendance_id).values_list('user_id', flat=True).first()
+        events.publish([user_id], 'attendance.punch', {
+            'attendance_id': instance.attendance_id, 'timelog_id': instance.pk,
+            'check_in': instance.check_in, 'check_out': instance.check_out,
+        })
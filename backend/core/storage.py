@@ -0,0 +1,102 @@
+"""
+Content-addressed file storage for ticket attachments.
+
+Each distinct content is stored once, at blobs/<aa>/<bb>/<sha256>, whatever
+name it was uploaded under; saving bytes that are already present writes
+nothing and returns the existing name. Blobs are written to a temporary file
+and renamed into place, so a concurrent reader never sees a partial blob.
+Reference counts and garbage collection live in core.blobs.
+
+Files that must never be served (queued user imports carry passwords) go to
+PrivateStorage under PRIVATE_ROOT, outside MEDIA_ROOT, and have no URL.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+BLOB_PREFIX = 'blobs'
+HASH_BLOCK_SIZE = 64 * 1024
+
+
+def content_sha256(content):
+    """SHA-256 of a File, leaving it rewound."""
+    digest = getattr(content, 'sha256', None)
+    if digest:
+        return digest
+    hasher = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks(HASH_BLOCK_SIZE):
+        hasher.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return hasher.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def blob_name(self, sha256):
+        return f'{BLOB_PREFIX}/{sha256[:2]}/{sha256[2:4]}/{sha256}'
+
+    def save(self, name, content, max_length=None):
+        """Store `content` under its hash; `name` only matters for legacy callers."""
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.blob_name(content_sha256(content))
+        if self.exists(name):
+            return name
+        return self._save(name, content)
+
+    def _save(self, name, content):
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        if hasattr(content, 'temporary_file_path'):
+            try:
+                os.replace(content.temporary_file_path(), full_path)
+                return name
+            except OSError:
+                pass
+        fd, incoming = tempfile.mkstemp(dir=directory, prefix='.incoming-')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in content.chunks():
+                    out.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(incoming, self.file_permissions_mode)
+            # Identical bytes by construction, so replacing a blob that appeared
+            # meanwhile is harmless.
+            os.replace(incoming, full_path)
+        except BaseException:
+            if os.path.exists(incoming):
+                os.remove(incoming)
+            raise
+        return name
+
+
+class PrivateStorage(FileSystemStorage):
+    @property
+    def base_location(self):
+        return settings.PRIVATE_ROOT
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+    def url(self, name):
+        raise ValueError('Private files are not served.')
+
+
+_attachment_storage = ContentAddressedStorage()
+_private_storage = PrivateStorage()
+
+
+def attachment_storage():
+    return _attachment_storage
+
+
+def private_storage():
+    return _private_storage
@@ -0,0 +1,29 @@
+"""
+Streaming responses that stream under ASGI as well as WSGI.
+
+Given a sync iterator, Django's StreamingHttpResponse under ASGI reads it to
+the end into a list before sending the first byte, so a large export or
+download would sit in memory whole. StreamingResponse pulls one part at a
+time through `sync_to_async` instead (in the thread sync views run in, so a
+server-side cursor stays on its connection); under WSGI it iterates as usual.
+Producers should yield sizeable chunks, as each part costs a thread hop.
+"""
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+
+_DONE = object()
+
+
+class StreamingResponse(StreamingHttpResponse):
+    async def __aiter__(self):
+        if self.is_async:
+            async for part in super().__aiter__():
+                yield part
+            return
+        parts = self.streaming_content
+        next_part = sync_to_async(next)
+        while True:
+            part = await next_part(parts, _DONE)
+            if part is _DONE:
+                return
+            yield part
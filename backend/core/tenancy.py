@@ -0,0 +1,115 @@
+"""
+Tenant context and tenant-scoped managers.
+
+TenantMiddleware binds the current company for the duration of a request and
+the default managers of tenant-owned models filter on it (plus
+`is_deleted=False`), so every query is confined to one company and can use the
+company-leading indexes. Outside a request (shell, jobs, tests) nothing is
+scoped unless `tenant_context()` is used. Superusers are never scoped.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.contrib.auth.models import UserManager
+from django.db import models
+
+# Marker for authenticated users that belong to no company: they see nothing.
+NO_TENANT = object()
+
+_current = ContextVar('tenant_company', default=None)
+_resolving = ContextVar('tenant_resolving', default=False)
+
+
+def get_current_company_id():
+    """Company id in scope, NO_TENANT, or None when queries are unscoped."""
+    value = _current.get()
+    if callable(value):
+        # Resolving request.user may itself query the user table; that
+        # lookup must run unscoped rather than recurse.
+        if _resolving.get():
+            return None
+        token = _resolving.set(True)
+        try:
+            value = value()
+        finally:
+            _resolving.reset(token)
+    return value
+
+
+@contextmanager
+def tenant_context(company):
+    """Scope queries in this block to `company` (instance, id or None)."""
+    token = _current.set(getattr(company, 'pk', company))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def request_company_id(request):
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated or user.is_superuser:
+        return None
+    return user.company_id or NO_TENANT
+
+
+class TenantMiddleware:
+    """
+    Binds the tenant lazily: the company is read from `request.user` on the
+    first scoped query, which also covers users authenticated later by DRF.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _current.set(lambda: request_company_id(request))
+        try:
+            return self.get_response(request)
+        finally:
+            _current.reset(token)
+
+
+class TenantManagerMixin:
+    def __init__(self, tenant_field, soft_delete=True):
+        super().__init__()
+        self.tenant_field = tenant_field
+        self.soft_delete = soft_delete
+
+    def scope(self, queryset):
+        """Apply the current tenant filter to an existing queryset."""
+        company_id = get_current_company_id()
+        if company_id is None:
+            return queryset
+        if company_id is NO_TENANT:
+            return queryset.none()
+        return queryset.filter(**{self.tenant_field: company_id})
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.soft_delete:
+            queryset = queryset.filter(is_deleted=False)
+        return self.scope(queryset)
+
+
+class TenantManager(TenantManagerMixin, models.Manager):
+    """
+    Default manager for tenant-owned models. `tenant_field` is the lookup
+    path from the model to its company.
+    """
+
+
+class TenantUserManager(TenantManagerMixin, UserManager):
+    pass
+
+
+class TenantScopedMixin:
+    """
+    For viewsets: querysets declared at class level were built at import time,
+    outside any request, so the tenant filter is re-applied per request.
+    """
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        manager = queryset.model._default_manager
+        if isinstance(manager, TenantManagerMixin):
+            queryset = manager.scope(queryset)
+        return queryset
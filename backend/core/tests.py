@@ -1,6 +1,32 @@
-from django.db import IntegrityError
+import asyncio
+import base64
+import datetime
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import types
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import make_password
+from django.core import mail, signals
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.asgi import ASGIHandler
+from django.db import IntegrityError, close_old_connections, connection
 from django.db import transaction
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import serializers as drf_serializers
+from rest_framework.test import APIRequestFactory, APITestCase
 from .models import (
     User,
     Company,
@@ -14,7 +40,54 @@ from .models import (
     ProjectUser,
     ProjectPermissionAssignment,
     ProjectCompany,
+    PermissionAuditEvent,
+    Ticket,
+    TicketAssignee,
+    TicketActivity,
+    TicketAttachement,
+    TicketComment,
+    TicketUpdate,
+    UploadSession,
+    Attendance,
+    TimeLog,
+    AttendanceCloseout,
+    ArchivedNotification,
+    AttachmentBlob,
+    DeadLetterDelivery,
+    Department,
+    Designation,
+    Employee,
+    EmployeeRoutineTimings,
+    LeaveRequest,
+    LeaveType,
+    MonthlyAttendanceRollup,
+    Notification,
+    NotificationCounter,
+    NotificationDelivery,
+    Profile,
+    RoutineTemplate,
+    UserImport,
+)
+from . import blobs
+from . import boards
+from . import dispatch
+from . import events
+from . import exports
+from . import notifications
+from . import passwords
+from . import rbac
+from . import reporting
+from . import retention
+from . import routines
+from . import search
+from . import user_io
+from .attendance import close_attendance_day, ingest_punches
+from .compiled_serializers import serialize_many
+from .serializers import (
+    AttendanceSerializer, EmployeeSerializer, LeaveRequestSerializer, NotificationSerializer, PermissionFlagsField,
+    ProfileSerializer, ProjectSerializer, TicketActivitySerializer, TicketSerializer, UserSerializer,
 )
+from .tenancy import tenant_context
 
 class UserTestCase(TestCase):
     def test_user_creation(self):
@@ -144,3 +217,1817 @@ class AccessControlSchemaTestCase(TestCase):
         with transaction.atomic():
             with self.assertRaises(IntegrityError):
                 ProjectRolePermission.objects.create(role=role, permission=bad_perm, effect='BAD')
+
+
+class PermissionResolverTestCase(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='Acme', email='acme@example.com', phone='1', domain='acme.example')
+        self.user = User.objects.create_user(email='dev@example.com', username='dev', password='password', company=self.company)
+        client = Client.objects.create(name='Client', email='client@example.com', phone='2')
+        self.project = Project.objects.create(name='Project', client=client, attached_to_company=self.company)
+        self.view = Permission.objects.create(scope=Permission.SCOPE_PROJECT, code='project.view')
+        self.edit = Permission.objects.create(scope=Permission.SCOPE_PROJECT, code='project.edit')
+        self.manage = Permission.objects.create(scope=Permission.SCOPE_COMPANY, code='company.users.manage')
+        self.role = ProjectRole.objects.create(company=self.company, name='Developer')
+        ProjectRolePermission.objects.create(role=self.role, permission=self.view, effect='ALLOW')
+        ProjectRolePermission.objects.create(role=self.role, permission=self.edit, effect='ALLOW')
+
+    def test_role_and_direct_grants_are_combined(self):
+        ProjectUser.objects.create(project=self.project, user=self.user, role=self.role)
+        self.assertEqual(rbac.get_project_permissions(self.user, self.project), frozenset({'project.view', 'project.edit'}))
+
+    def test_direct_deny_overrides_role_allow(self):
+        ProjectUser.objects.create(project=self.project, user=self.user, role=self.role)
+        ProjectPermissionAssignment.objects.create(project=self.project, user=self.user, permission=self.edit, effect='DENY')
+        self.assertTrue(rbac.has_project_perm(self.user, 'project.view', self.project))
+        self.assertFalse(rbac.has_project_perm(self.user, 'project.edit', self.project))
+
+    def test_inactive_project_membership_grants_nothing(self):
+        ProjectUser.objects.create(project=self.project, user=self.user, role=self.role, is_active=False)
+        self.assertEqual(rbac.get_project_permissions(self.user, self.project), frozenset())
+
+    def test_company_grants(self):
+        CompanyMembership.objects.create(company=self.company, user=self.user)
+        CompanyPermissionAssignment.objects.create(company=self.company, user=self.user, permission=self.manage)
+        self.assertTrue(rbac.has_company_perm(self.user, 'company.users.manage', self.company))
+        self.assertFalse(rbac.has_company_perm(self.user, 'company.users.manage', self.company.pk + 1))
+
+    def test_company_grants_need_an_active_membership(self):
+        CompanyPermissionAssignment.objects.create(company=self.company, user=self.user, permission=self.manage)
+        self.assertEqual(rbac.get_company_permissions(self.user, self.company), frozenset())
+
+        membership = CompanyMembership.objects.create(company=self.company, user=self.user)
+        self.assertTrue(rbac.has_company_perm(User.objects.get(pk=self.user.pk), 'company.users.manage', self.company))
+        membership.is_active = False
+        membership.save()
+        self.assertFalse(rbac.has_company_perm(User.objects.get(pk=self.user.pk), 'company.users.manage', self.company))
+
+    def test_resolution_is_one_query_then_cached(self):
+        ProjectUser.objects.create(project=self.project, user=self.user, role=self.role)
+        with self.assertNumQueries(1):
+            rbac.get_project_permissions(self.user, self.project)
+        with self.assertNumQueries(0):
+            self.assertTrue(rbac.has_project_perm(self.user, 'project.view', self.project.pk))
+
+    def test_superuser_overrides(self):
+        root = User.objects.create_superuser(email='root@example.com', username='root', password='password')
+        self.assertTrue(rbac.has_project_perm(root, 'project.edit', self.project))
+
+
+class PermissionInvalidationTestCase(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='Acme', email='acme@example.com', phone='1', domain='acme.example')
+        self.user = User.objects.create_user(email='dev@example.com', username='dev', password='password', company=self.company)
+        self.admin = User.objects.create_user(email='boss@example.com', username='boss', password='password', company=self.company)
+        client = Client.objects.create(name='Client', email='client@example.com', phone='2')
+        self.project = Project.objects.create(name='Project', client=client, attached_to_company=self.company)
+        self.view = Permission.objects.create(scope=Permission.SCOPE_PROJECT, code='project.view')
+        self.role = ProjectRole.objects.create(company=self.company, name='Viewer')
+
+    def fresh_user(self):
+        return User.objects.get(pk=self.user.pk)
+
+    def test_assignment_save_invalidates_and_audits(self):
+        self.assertFalse(rbac.has_project_perm(self.fresh_user(), 'project.view', self.project))
+        grant = ProjectPermissionAssignment.objects.create(project=self.project, user=self.user, permission=self.view, granted_by=self.admin)
+        self.assertTrue(rbac.has_project_perm(self.fresh_user(), 'project.view', self.project))
+
+        event = PermissionAuditEvent.objects.get(target_user=self.user)
+        self.assertEqual(event.event_type, 'project_permission.created')
+        self.assertEqual(event.actor, self.admin)
+        self.assertIsNone(event.before_state)
+        self.assertEqual(event.after_state['effect'], 'ALLOW')
+
+        grant.delete()
+        self.assertFalse(rbac.has_project_perm(self.fresh_user(), 'project.view', self.project))
+        self.assertTrue(PermissionAuditEvent.objects.filter(event_type='project_permission.deleted').exists())
+
+    def test_bulk_update_invalidates_and_audits(self):
+        ProjectPermissionAssignment.objects.create(project=self.project, user=self.user, permission=self.view)
+        self.assertTrue(rbac.has_project_perm(self.fresh_user(), 'project.view', self.project))
+
+        ProjectPermissionAssignment.objects.filter(user=self.user).update(effect='DENY')
+        self.assertFalse(rbac.has_project_perm(self.fresh_user(), 'project.view', self.project))
+
+        event = PermissionAuditEvent.objects.get(event_type='project_permission.updated')
+        self.assertEqual(event.before_state['effect'], 'ALLOW')
+        self.assertEqual(event.after_state['effect'], 'DENY')
+
+    def test_role_permission_change_invalidates_members(self):
+        ProjectUser.objects.create(project=self.project, user=self.user, role=self.role)
+        self.assertFalse(rbac.has_project_perm(self.fresh_user(), 'project.view', self.project))
+
+        ProjectRolePermission.objects.create(role=self.role, permission=self.view)
+        self.assertTrue(rbac.has_project_perm(self.fresh_user(), 'project.view', self.project))
+        self.assertTrue(PermissionAuditEvent.objects.filter(
+            event_type='project_role_permission.created', target_user=self.user, project=self.project,
+        ).exists())
+
+        ProjectUser.objects.filter(user=self.user).update(is_active=False)
+        self.assertFalse(rbac.has_project_perm(self.fresh_user(), 'project.view', self.project))
+
+    def test_unchanged_save_is_not_audited(self):
+        membership = CompanyMembership.objects.create(user=self.user, company=self.company)
+        membership.save()
+        self.assertEqual(PermissionAuditEvent.objects.filter(event_type__startswith='company_membership').count(), 1)
+
+    def test_cascade_delete_skips_audit(self):
+        ProjectPermissionAssignment.objects.create(project=self.project, user=self.user, permission=self.view)
+        self.project.delete()
+        self.assertFalse(PermissionAuditEvent.objects.filter(event_type='project_permission.deleted').exists())
+
+
+class BatchPermissionCheckTestCase(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='Acme', email='acme@example.com', phone='1', domain='acme.example')
+        self.user = User.objects.create_user(email='dev@example.com', username='dev', password='password', company=self.company)
+        client = Client.objects.create(name='Client', email='client@example.com', phone='2')
+        self.projects = [
+            Project.objects.create(name=f'Project {i}', client=client, attached_to_company=self.company)
+            for i in range(5)
+        ]
+        edit = Permission.objects.create(scope=Permission.SCOPE_PROJECT, code='project.edit')
+        delete = Permission.objects.create(scope=Permission.SCOPE_PROJECT, code='project.delete')
+        role = ProjectRole.objects.create(company=self.company, name='Editor')
+        ProjectRolePermission.objects.create(role=role, permission=edit)
+        ProjectUser.objects.create(project=self.projects[0], user=self.user, role=role)
+        ProjectPermissionAssignment.objects.create(project=self.projects[1], user=self.user, permission=delete)
+        ProjectPermissionAssignment.objects.create(project=self.projects[0], user=self.user, permission=delete, effect='DENY')
+
+    def fresh_user(self):
+        return User.objects.get(pk=self.user.pk)
+
+    def test_answers_every_pair_in_one_query(self):
+        user = self.fresh_user()
+        with self.assertNumQueries(1):
+            flags = rbac.has_perms_many(user, ['project.edit', 'project.delete'], self.projects)
+        self.assertEqual(flags[self.projects[0].pk], {'project.edit': True, 'project.delete': False})
+        self.assertEqual(flags[self.projects[1].pk], {'project.edit': False, 'project.delete': True})
+        self.assertEqual(flags[self.projects[4].pk], {'project.edit': False, 'project.delete': False})
+        with self.assertNumQueries(0):
+            self.assertTrue(rbac.has_project_perm(user, 'project.edit', self.projects[0]))
+
+    def test_rows_resolve_through_their_project(self):
+        tickets = [
+            Ticket.objects.create(name=f'Ticket {i}', project=project, status='OPEN', priority='LOW', created_by=self.user)
+            for i, project in enumerate(self.projects[:2])
+        ]
+        flags = rbac.has_perms_many(self.fresh_user(), ['project.edit'], tickets)
+        self.assertEqual(flags, {tickets[0].pk: {'project.edit': True}, tickets[1].pk: {'project.edit': False}})
+
+    def test_serializer_field_is_flat_in_query_count(self):
+        class FlaggedProjectSerializer(drf_serializers.ModelSerializer):
+            permissions = PermissionFlagsField(['project.edit', 'project.delete'])
+
+            class Meta:
+                model = Project
+                fields = ['id', 'permissions']
+
+        request = APIRequestFactory().get('/')
+        request.user = self.fresh_user()
+        with self.assertNumQueries(1):
+            data = FlaggedProjectSerializer(self.projects, many=True, context={'request': request}).data
+        self.assertEqual(data[0]['permissions'], {'project.edit': True, 'project.delete': False})
+        self.assertEqual(len(data), 5)
+
+
+class PermissionQuerysetFilterTestCase(APITestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='Acme', email='acme@example.com', phone='1', domain='acme.example')
+        self.user = User.objects.create_user(email='dev@example.com', username='dev', password='password', company=self.company)
+        client = Client.objects.create(name='Client', email='client@example.com', phone='2')
+        self.by_role, self.direct, self.denied, self.hidden = [
+            Project.objects.create(name=name, client=client, attached_to_company=self.company)
+            for name in ('Role', 'Direct', 'Denied', 'Hidden')
+        ]
+        view = Permission.objects.create(scope=Permission.SCOPE_PROJECT, code='project.view')
+        role = ProjectRole.objects.create(company=self.company, name='Viewer')
+        ProjectRolePermission.objects.create(role=role, permission=view)
+        ProjectUser.objects.create(project=self.by_role, user=self.user, role=role)
+        ProjectUser.objects.create(project=self.denied, user=self.user, role=role)
+        ProjectPermissionAssignment.objects.create(project=self.direct, user=self.user, permission=view)
+        ProjectPermissionAssignment.objects.create(project=self.denied, user=self.user, permission=view, effect='DENY')
+
+    def test_filter_permitted_projects(self):
+        with self.assertNumQueries(1):
+            names = sorted(rbac.filter_permitted(Project.objects.all(), self.user, 'project.view').values_list('name', flat=True))
+        self.assertEqual(names, ['Direct', 'Role'])
+
+    def test_filter_through_project_foreign_key(self):
+        for project in (self.by_role, self.hidden):
+            Ticket.objects.create(name=project.name, project=project, status='OPEN', priority='LOW', created_by=self.user)
+        tickets = rbac.filter_permitted(Ticket.objects.all(), self.user, 'project.view', project_field='project')
+        self.assertEqual(list(tickets.values_list('name', flat=True)), ['Role'])
+
+    def test_project_list_endpoint(self):
+        edit = Permission.objects.create(scope=Permission.SCOPE_PROJECT, code='project.edit')
+        ProjectPermissionAssignment.objects.create(project=self.direct, user=self.user, permission=edit)
+        self.client.force_authenticate(self.user)
+        cache.clear()
+        # The projects, then every row's permission flags in one query.
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/projects/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {row['name']: row['permissions'] for row in response.data},
+            {
+                'Direct': {'project.edit': True, 'project.delete': False},
+                'Role': {'project.edit': False, 'project.delete': False},
+            },
+        )
+        self.assertEqual(self.client.get(f'/api/projects/{self.hidden.pk}/').status_code, 404)
+
+
+class TenantScopingTestCase(APITestCase):
+    def setUp(self):
+        self.acme = Company.objects.create(name='Acme', email='acme@example.com', phone='1', domain='acme.example')
+        self.globex = Company.objects.create(name='Globex', email='globex@example.com', phone='2', domain='globex.example')
+        self.alice = User.objects.create_user(email='alice@acme.example', username='alice', password='password', company=self.acme)
+        self.bob = User.objects.create_user(email='bob@globex.example', username='bob', password='password', company=self.globex)
+        User.objects.create_user(email='gone@acme.example', username='gone', password='password', company=self.acme, is_deleted=True)
+        client = Client.objects.create(name='Client', email='client@example.com', phone='3', attached_to_company=self.acme)
+        self.acme_project = Project.objects.create(name='Acme Project', client=client, attached_to_company=self.acme)
+        self.globex_project = Project.objects.create(name='Globex Project', client=client, attached_to_company=self.globex)
+        for project in (self.acme_project, self.globex_project):
+            Ticket.objects.create(name=project.name, project=project, status='OPEN', priority='LOW', created_by=self.alice)
+
+    def test_tenant_context_scopes_default_managers(self):
+        with tenant_context(self.acme):
+            self.assertEqual(list(User.objects.values_list('username', flat=True)), ['alice'])
+            self.assertEqual(list(Project.objects.values_list('name', flat=True)), ['Acme Project'])
+            self.assertEqual(list(Ticket.objects.values_list('name', flat=True)), ['Acme Project'])
+            self.assertEqual(list(Company.objects.all()), [self.acme])
+            self.assertEqual(User.all_objects.count(), 3)
+
+    def test_unscoped_outside_a_request_but_soft_deletes_hidden(self):
+        self.assertEqual(User.objects.count(), 2)
+        self.assertEqual(Project.objects.count(), 2)
+
+    def test_viewsets_only_return_own_company(self):
+        self.client.force_authenticate(self.bob)
+        users = self.client.get('/api/users/').data
+        self.assertEqual([row['email'] for row in users], ['bob@globex.example'])
+        companies = self.client.get('/api/companies/').data
+        self.assertEqual([row['name'] for row in companies], ['Globex'])
+        self.assertEqual(self.client.get(f'/api/users/{self.alice.pk}/').status_code, 404)
+
+    def grant(self, user, code):
+        CompanyMembership.objects.get_or_create(user=user, company=user.company)
+        permission, _ = Permission.objects.get_or_create(scope=Permission.SCOPE_COMPANY, code=code)
+        CompanyPermissionAssignment.objects.create(company=user.company, user=user, permission=permission)
+        # Requests normally load a fresh user; this one is reused by force_authenticate.
+        rbac.clear_cache(user)
+
+    def test_company_viewsets_require_company_permissions_to_write(self):
+        self.client.force_authenticate(self.alice)
+        self.assertEqual(self.client.get('/api/users/').status_code, 200)
+        payload = {'email': 'new@acme.example', 'username': 'new'}
+        self.assertEqual(self.client.post('/api/users/', payload, format='json').status_code, 403)
+        company_url = f'/api/companies/{self.acme.pk}/'
+        self.assertEqual(self.client.patch(company_url, {'phone': '9'}, format='json').status_code, 403)
+
+        self.grant(self.alice, 'company.users.manage')
+        self.assertEqual(self.client.post('/api/users/', payload, format='json').status_code, 201)
+        self.assertEqual(self.client.patch(company_url, {'phone': '9'}, format='json').status_code, 403)
+        self.grant(self.alice, 'company.manage')
+        self.assertEqual(self.client.patch(company_url, {'phone': '9'}, format='json').status_code, 200)
+
+    def test_user_uniqueness_spans_tenants_and_soft_deletes(self):
+        self.grant(self.alice, 'company.users.manage')
+        self.client.force_authenticate(self.alice)
+        for email, username in [('bob@globex.example', 'new1'), ('gone@acme.example', 'new2'), ('new@acme.example', 'bob')]:
+            response = self.client.post('/api/users/', {'email': email, 'username': username}, format='json')
+            self.assertEqual(response.status_code, 400, response.data)
+        response = self.client.post('/api/users/', {'email': 'new@acme.example', 'username': 'new'}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_superuser_is_not_scoped(self):
+        root = User.objects.create_superuser(email='root@example.com', username='root', password='password', company=self.acme)
+        self.client.force_authenticate(root)
+        self.assertEqual(len(self.client.get('/api/companies/').data), 2)
+
+    def test_session_authenticated_request_is_scoped(self):
+        self.client.login(email='alice@acme.example', password='password')
+        users = self.client.get('/api/users/').data
+        self.assertEqual([row['email'] for row in users], ['alice@acme.example'])
+
+
+class AttendanceSummaryTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='worker@example.com', username='worker', password='password')
+        self.attendance = Attendance.objects.create(user=self.user, date=datetime.date(2025, 3, 3))
+        self.start = timezone.make_aware(datetime.datetime(2025, 3, 3, 9, 0))
+
+    def hours(self, n):
+        return self.start + datetime.timedelta(hours=n)
+
+    def reload(self):
+        return Attendance.objects.get(pk=self.attendance.pk)
+
+    def test_check_in_and_out_apply_deltas(self):
+        log = TimeLog.objects.create(attendance=self.attendance, check_in=self.start)
+        self.assertEqual(self.reload().status, 'PENDING')
+
+        log.check_out = self.hours(4)
+        log.save()
+        attendance = self.reload()
+        self.assertEqual(attendance.total_worked_seconds, 4 * 3600)
+        self.assertEqual(attendance.status, 'PRESENT')
+        self.assertEqual(log.attendance.total_worked_seconds, 4 * 3600)
+
+    def test_edits_deletes_and_overtime_stay_consistent(self):
+        first = TimeLog.objects.create(attendance=self.attendance, check_in=self.start, check_out=self.hours(5))
+        second = TimeLog.objects.create(attendance=self.attendance, check_in=self.hours(6), check_out=self.hours(10))
+        attendance = self.reload()
+        self.assertEqual(attendance.total_worked_seconds, 9 * 3600)
+        self.assertEqual(attendance.overtime_seconds, 3600)
+        self.assertEqual(attendance.status, 'OVERTIME')
+
+        second.check_out = self.hours(7)
+        second.save()
+        attendance = self.reload()
+        self.assertEqual(attendance.total_worked_seconds, 6 * 3600)
+        self.assertEqual(attendance.overtime_seconds, 0)
+        self.assertEqual(attendance.status, 'PRESENT')
+
+        TimeLog.objects.filter(pk=second.pk).delete()
+        first.delete()
+        attendance = self.reload()
+        self.assertEqual(attendance.total_worked_seconds, 0)
+        self.assertEqual(attendance.status, 'PENDING')
+
+    def test_punch_is_constant_time(self):
+        for i in range(3):
+            TimeLog.objects.create(attendance=self.attendance, check_in=self.hours(i), check_out=self.hours(i + 0.5))
+        log = TimeLog(attendance=self.attendance, check_in=self.hours(4), check_out=self.hours(5))
+        with CaptureQueriesContext(connection) as ctx:
+            log.save()
+        statements = [q['sql'].split()[0] for q in ctx.captured_queries if 'SAVEPOINT' not in q['sql']]
+        # Insert the log, bump the summary, refresh the cached attendance.
+        self.assertEqual(statements, ['INSERT', 'UPDATE', 'SELECT'])
+
+    def test_full_recompute_matches_incremental(self):
+        TimeLog.objects.create(attendance=self.attendance, check_in=self.start, check_out=self.hours(3))
+        TimeLog.objects.create(attendance=self.attendance, check_in=self.hours(4), check_out=self.hours(6))
+        Attendance.objects.filter(pk=self.attendance.pk).update(total_worked_seconds=0, status='PENDING')
+        attendance = self.reload()
+        attendance.update_summary()
+        self.assertEqual(self.reload().total_worked_seconds, 5 * 3600)
+        self.assertEqual(attendance.status, 'PRESENT')
+
+
+class PunchIngestionTestCase(APITestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='Acme', email='acme@example.com', phone='1', domain='acme.example')
+        self.admin = User.objects.create_user(email='admin@acme.example', username='admin', password='password', company=self.company, is_admin=True)
+        self.workers = [
+            User.objects.create_user(email=f'w{i}@acme.example', username=f'w{i}', password='password', company=self.company)
+            for i in range(3)
+        ]
+        self.outsider = User.objects.create_user(email='x@other.example', username='x', password='password')
+
+    def punch(self, user, day, start, end=None):
+        check_in = timezone.make_aware(datetime.datetime(2025, 3, day, start))
+        row = {'user_id': user.pk, 'check_in': check_in.isoformat()}
+        if end is not None:
+            row['check_out'] = (check_in + datetime.timedelta(hours=end - start)).isoformat()
+        return row
+
+    def test_batch_reports_row_errors_without_aborting(self):
+        report = ingest_punches([
+            self.punch(self.workers[0], 3, 9, 12),
+            self.punch(self.workers[0], 3, 13, 17),
+            self.punch(self.workers[1], 3, 9, 8),
+            {'user_id': self.workers[1].pk},
+            self.punch(self.outsider, 3, 9, 17),
+            self.punch(self.workers[2], 4, 9),
+        ], company=self.company)
+        self.assertEqual(report['created'], 3)
+        self.assertEqual([error['index'] for error in report['errors']], [2, 3, 4])
+        day = Attendance.objects.get(user=self.workers[0], date=datetime.date(2025, 3, 3))
+        self.assertEqual(day.total_worked_seconds, 7 * 3600)
+        self.assertEqual(day.status, 'PRESENT')
+        self.assertEqual(Attendance.objects.get(user=self.workers[2]).status, 'PENDING')
+
+    def test_existing_days_are_reused_and_recomputed(self):
+        existing = Attendance.objects.create(user=self.workers[0], date=datetime.date(2025, 3, 3))
+        TimeLog.objects.create(
+            attendance=existing,
+            check_in=timezone.make_aware(datetime.datetime(2025, 3, 3, 7)),
+            check_out=timezone.make_aware(datetime.datetime(2025, 3, 3, 8)),
+        )
+        ingest_punches([self.punch(self.workers[0], 3, 9, 17)])
+        existing.refresh_from_db()
+        self.assertEqual(existing.total_worked_seconds, 9 * 3600)
+        self.assertEqual(existing.overtime_seconds, 3600)
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        def count(day, users):
+            with CaptureQueriesContext(connection) as ctx:
+                ingest_punches([self.punch(user, day, 9, 17) for user in users])
+            return len(ctx.captured_queries)
+
+        self.assertEqual(count(3, self.workers[:1]), count(4, self.workers))
+
+    def test_batch_publishes_one_event_per_user(self):
+        sent = []
+        with mock.patch.object(events, '_send', lambda user_ids, event: sent.append((user_ids, event))):
+            with self.captureOnCommitCallbacks(execute=True):
+                ingest_punches([
+                    self.punch(self.workers[0], 3, 9, 12),
+                    self.punch(self.workers[0], 3, 13, 17),
+                    self.punch(self.workers[1], 3, 9, 17),
+                ])
+        batches = {
+            tuple(user_ids): [punch['timelog_id'] for punch in event['data']['punches']]
+            for user_ids, event in sent if event['type'] == 'attendance.punches'
+        }
+        self.assertEqual(batches, {
+            (worker.pk,): list(TimeLog.objects.filter(attendance__user=worker).order_by('check_in').values_list('pk', flat=True))
+            for worker in self.workers[:2]
+        })
+
+    def test_punch_event_does_not_fetch_the_attendance(self):
+        attendance = Attendance.objects.create(user=self.workers[0], date=datetime.date(2025, 3, 3))
+        check_in = timezone.make_aware(datetime.datetime(2025, 3, 3, 9))
+        with CaptureQueriesContext(connection) as ctx:
+            TimeLog.objects.create(attendance=attendance, check_in=check_in)
+        self.assertFalse([query['sql'] for query in ctx.captured_queries if '"core_attendance"."user_id"' in query['sql']])
+
+        sent = []
+        with mock.patch.object(events, '_send', lambda user_ids, event: sent.append((user_ids, event['type']))):
+            with self.captureOnCommitCallbacks(execute=True):
+                log = TimeLog.objects.create(attendance_id=attendance.pk, check_in=check_in)
+        self.assertFalse(TimeLog.attendance.is_cached(log))
+        self.assertIn(([self.workers[0].pk], 'attendance.punch'), sent)
+
+    def test_endpoint_is_admin_only_and_company_scoped(self):
+        payload = {'punches': [self.punch(self.workers[0], 3, 9, 17), self.punch(self.outsider, 3, 9, 17)]}
+        self.client.force_authenticate(self.workers[0])
+        self.assertEqual(self.client.post('/api/attendance/punches/', payload, format='json').status_code, 403)
+
+        self.client.force_authenticate(self.admin)
+        response = self.client.post('/api/attendance/punches/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['errors'][0]['index'], 1)
+
+
+class AttendanceCloseoutTestCase(TestCase):
+    DAY = datetime.date(2025, 3, 3)
+
+    def setUp(self):
+        self.company = Company.objects.create(name='Acme', email='acme@example.com', phone='1', domain='acme.example')
+        department = Department.objects.create(name='Ops')
+        self.designation = Designation.objects.create(name='Operator', department=department)
+        RoutineTemplate.objects.create(
+            for_designation=self.designation,
+            start_time=datetime.time(9, 0),
+            end_time=datetime.time(17, 0),
+            late_grace_period_seconds=600,
+            minimum_work_hours_seconds=4 * 3600,
+            maximum_work_hours_seconds=9 * 3600,
+        )
+        self.leave_type = LeaveType.objects.create(name='Annual', description='Annual leave')
+
+    def employee(self, name, *shifts):
+        user = User.objects.create_user(email=f'{name}@acme.example', username=name, password='password', company=self.company)
+        Employee.objects.create(user=user, designation=self.designation)
+        if shifts:
+            attendance = Attendance.objects.create(user=user, date=self.DAY)
+            for start, hours in shifts:
+                check_in = timezone.make_aware(datetime.datetime.combine(self.DAY, start))
+                TimeLog.objects.create(attendance=attendance, check_in=check_in, check_out=check_in + datetime.timedelta(hours=hours))
+        return user
+
+    def day(self, user):
+        return Attendance.objects.get(user=user, date=self.DAY)
+
+    def test_statuses_are_derived_set_wise(self):
+        on_time = self.employee('ontime', (datetime.time(9, 5), 8))
+        late = self.employee('late', (datetime.time(9, 30), 10))
+        absent = self.employee('absent')
+        on_leave = self.employee('leave')
+        LeaveRequest.objects.create(
+            user=on_leave, leave_type=self.leave_type, start_date=self.DAY, end_date=self.DAY,
+            reason='Trip', status=LeaveRequest.STATUS_APPROVED,
+        )
+        short = self.employee('short', (datetime.time(9, 0), 2))
+        own_shift = self.employee('own', (datetime.time(9, 30), 6))
+        EmployeeRoutineTimings.objects.create(user=own_shift, start_time=datetime.time(10, 0), end_time=datetime.time(16, 0))
+        # Timings apply from the day they were created.
+        EmployeeRoutineTimings.objects.update(created_at=timezone.make_aware(datetime.datetime(2025, 3, 1)))
+
+        run = close_attendance_day(self.company, self.DAY, chunk_size=4)
+        self.assertEqual(run.processed, 6)
+        self.assertIsNotNone(run.completed_at)
+
+        self.assertEqual((self.day(on_time).status, self.day(on_time).is_late), ('PRESENT', False))
+        self.assertEqual((self.day(late).status, self.day(late).is_late), ('OVERTIME', True))
+        self.assertEqual(self.day(late).overtime_seconds, 3600)
+        self.assertEqual((self.day(absent).status, self.day(absent).is_absent), ('ABSENT', True))
+        self.assertEqual((self.day(on_leave).status, self.day(on_leave).is_absent), ('LEAVE', False))
+        self.assertEqual(self.day(short).status, 'HALF_DAY')
+        self.assertEqual((self.day(own_shift).status, self.day(own_shift).is_late), ('PRESENT', False))
+
+    def test_run_resumes_after_last_finished_chunk(self):
+        first = self.employee('first')
+        second = self.employee('second')
+        AttendanceCloseout.objects.create(company=self.company, date=self.DAY, last_user_id=first.pk, processed=1)
+
+        run = close_attendance_day(self.company, self.DAY, chunk_size=1)
+        self.assertEqual(run.processed, 2)
+        self.assertFalse(Attendance.objects.filter(user=first).exists())
+        self.assertEqual(self.day(second).status, 'ABSENT')
+
+        self.employee('late_joiner')
+        self.assertEqual(close_attendance_day(self.company, self.DAY).processed, 2)
+        self.assertEqual(close_attendance_day(self.company, self.DAY, restart=True).processed, 3)
+
+
+class EffectiveRoutineTestCase(TestCase):
+    DAY = datetime.date(2025, 3, 3)
+
+    def setUp(self):
+        department = Department.objects.create(name='Ops')
+        self.designation = Designation.objects.create(name='Operator', department=department)
+        self.template = RoutineTemplate.objects.create(
+            for_designation=self.designation, start_time=datetime.time(9, 0), end_time=datetime.time(17, 0),
+        )
+        self.users = []
+        for i in range(3):
+            user = User.objects.create_user(email=f'op{i}@example.com', username=f'op{i}', password='password')
+            Employee.objects.create(user=user, designation=self.designation)
+            self.users.append(user)
+        EmployeeRoutineTimings.objects.create(user=self.users[0], start_time=datetime.time(7, 0), end_time=datetime.time(15, 0))
+        EmployeeRoutineTimings.objects.update(created_at=timezone.make_aware(datetime.datetime(2025, 1, 1)))
+
+    def test_bulk_resolution_for_a_department_is_one_query(self):
+        with self.assertNumQueries(1):
+            resolved = routines.resolve_routines(department=self.designation.department, date=self.DAY)
+        self.assertEqual(set(resolved), {user.pk for user in self.users})
+        self.assertEqual(resolved[self.users[0].pk].source, routines.SOURCE_EMPLOYEE)
+        self.assertEqual(resolved[self.users[0].pk].start_time, datetime.time(7, 0))
+        self.assertEqual(resolved[self.users[1].pk].source, routines.SOURCE_TEMPLATE)
+        self.assertEqual(resolved[self.users[1].pk].start_time, datetime.time(9, 0))
+
+    def test_timings_created_later_do_not_apply_retroactively(self):
+        resolved = routines.resolve_routines([self.users[0]], date=datetime.date(2024, 12, 31))
+        self.assertEqual(resolved[self.users[0].pk].source, routines.SOURCE_TEMPLATE)
+
+    def test_single_lookup_is_cached_and_invalidated_by_writes(self):
+        user = self.users[1]
+        self.assertEqual(routines.resolve_routine(user, self.DAY).start_time, datetime.time(9, 0))
+        with self.assertNumQueries(0):
+            routines.resolve_routine(user, self.DAY)
+
+        self.template.start_time = datetime.time(8, 0)
+        self.template.save()
+        self.assertEqual(routines.resolve_routine(user, self.DAY).start_time, datetime.time(8, 0))
+
+        timing = EmployeeRoutineTimings.objects.create(user=user, start_time=datetime.time(6, 0), end_time=datetime.time(14, 0))
+        self.assertEqual(routines.resolve_routine(user).start_time, datetime.time(6, 0))
+        timing.delete()
+        self.assertEqual(routines.resolve_routine(user).start_time, datetime.time(8, 0))
+
+    def test_user_without_routine(self):
+        loner = User.objects.create_user(email='loner@example.com', username='loner', password='password')
+        self.assertIsNone(routines.resolve_routine(loner, self.DAY))
+        with self.assertNumQueries(0):
+            self.assertIsNone(routines.resolve_routine(loner, self.DAY))
+
+
+class AttendanceRollupTestCase(APITestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='Acme', email='acme@example.com', phone='1', domain='acme.example')
+        self.admin = User.objects.create_user(email='admin@acme.example', username='admin', password='password', company=self.company, is_admin=True)
+        ops = Department.objects.create(name='Ops')
+        sales = Department.objects.create(name='Sales')
+        self.ops_user = self.employee('ops', ops)
+        self.sales_user = self.employee('sales', sales)
+
+    def employee(self, name, department):
+        user = User.objects.create_user(email=f'{name}@acme.example', username=name, password='password', company=self.company)
+        Employee.objects.create(user=user, designation=Designation.objects.create(name=name, department=department))
+        return user
+
+    def day(self, user, date, hours, status=Attendance.STATUS_PRESENT, **fields):
+        return Attendance.objects.create(user=user, date=date, total_worked_seconds=hours * 3600, status=status, **fields)
+
+    def test_writes_refresh_rollup_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            attendance = self.day(self.ops_user, datetime.date(2025, 3, 3), 0)
+            check_in = timezone.make_aware(datetime.datetime(2025, 3, 3, 9))
+            TimeLog.objects.create(attendance=attendance, check_in=check_in, check_out=check_in + datetime.timedelta(hours=8))
+        rollup = MonthlyAttendanceRollup.objects.get(user=self.ops_user, month=datetime.date(2025, 3, 1))
+        self.assertEqual((rollup.company_id, rollup.worked_seconds, rollup.present_days), (self.company.pk, 8 * 3600, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            attendance.delete()
+        rollup.refresh_from_db()
+        self.assertEqual((rollup.worked_seconds, rollup.present_days), (0, 0))
+
+    def test_report_groups_by_user_department_and_month(self):
+        self.day(self.ops_user, datetime.date(2025, 3, 3), 8, is_late=True)
+        self.day(self.ops_user, datetime.date(2025, 4, 1), 4, status=Attendance.STATUS_HALF_DAY)
+        self.day(self.sales_user, datetime.date(2025, 3, 3), 0, status=Attendance.STATUS_ABSENT, is_absent=True)
+        self.day(self.sales_user, datetime.date(2025, 5, 1), 8)
+        self.assertEqual(reporting.rebuild_rollups(company=self.company, chunk_size=2), 4)
+
+        by_user = reporting.attendance_report(self.company, datetime.date(2025, 3, 1), datetime.date(2025, 4, 1))
+        self.assertEqual(
+            [(row['email'], row['worked_seconds'], row['present_days'], row['late_days'], row['half_days'], row['absent_days']) for row in by_user],
+            [('ops@acme.example', 12 * 3600, 2, 1, 1, 0), ('sales@acme.example', 0, 0, 0, 0, 1)],
+        )
+
+        by_department = reporting.attendance_report(
+            self.company, datetime.date(2025, 3, 1), datetime.date(2025, 5, 1), group_by='department', by_month=True,
+        )
+        self.assertEqual(
+            [(row['department'], row['month'], row['worked_seconds']) for row in by_department],
+            [
+                ('Ops', datetime.date(2025, 3, 1), 8 * 3600),
+                ('Ops', datetime.date(2025, 4, 1), 4 * 3600),
+                ('Sales', datetime.date(2025, 3, 1), 0),
+                ('Sales', datetime.date(2025, 5, 1), 8 * 3600),
+            ],
+        )
+
+    def test_report_endpoint(self):
+        self.day(self.ops_user, datetime.date(2025, 3, 3), 8)
+        reporting.rebuild_rollups()
+        self.client.force_authenticate(self.admin)
+        response = self.client.get('/api/reports/attendance/', {'from': '2025-03', 'to': '2025-03', 'group_by': 'company'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['worked_seconds'], 8 * 3600)
+        self.assertEqual(self.client.get('/api/reports/attendance/', {'group_by': 'team'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/reports/attendance/', {'from': 'March'}).status_code, 400)
+
+
+class TicketListTestCase(APITestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='Acme', email='acme@example.com', phone='1', domain='acme.example')
+        self.user = User.objects.create_user(email='dev@acme.example', username='dev', password='password', company=self.company)
+        client = Client.objects.create(name='Client', email='client@example.com', phone='2', attached_to_company=self.company)
+        self.visible = [
+            Project.objects.create(name=f'Project {i}', client=client, attached_to_company=self.company)
+            for i in range(2)
+        ]
+        self.hidden = Project.objects.create(name='Hidden', client=client, attached_to_company=self.company)
+        view = Permission.objects.create(scope=Permission.SCOPE_PROJECT, code='project.view')
+        for project in self.visible:
+            ProjectPermissionAssignment.objects.create(project=project, user=self.user, permission=view)
+        self.helpers = [
+            User.objects.create_user(email=f'h{i}@acme.example', username=f'h{i}', password='password', company=self.company)
+            for i in range(2)
+        ]
+        for i in range(7):
+            ticket = Ticket.objects.create(
+                name=f'T{i}', project=self.visible[i % 2], status='OPEN', priority='LOW', created_by=self.user,
+            )
+            TicketAssignee.objects.create(ticket=ticket, user=self.helpers[0])
+            TicketAssignee.objects.create(ticket=ticket, user=self.helpers[1], is_active=i % 3 != 0)
+        Ticket.objects.create(name='Secret', project=self.hidden, status='OPEN', priority='LOW', created_by=self.user)
+        # Equal timestamps: ordering and cursors must fall back to the id.
+        Ticket.objects.update(updated_at=timezone.now())
+        self.client.force_authenticate(self.user)
+
+    def get(self, url, params=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params)
+        queries = [q for q in ctx.captured_queries if 'SAVEPOINT' not in q['sql']]
+        return response, len(queries)
+
+    def test_pages_cost_a_fixed_number_of_queries(self):
+        names = []
+        counts = []
+        url, params = '/api/tickets/', {'page_size': 3}
+        while url:
+            cache.clear()
+            rbac.clear_cache(self.user)
+            response, count = self.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            names += [row['name'] for row in response.data['results']]
+            counts.append(count)
+            url, params = response.data['next'], None
+        self.assertEqual(names, [f'T{i}' for i in reversed(range(7))])
+        # Tickets with project and client, active assignees, then the
+        # permission flags of every row (and its nested project) at once.
+        self.assertEqual(counts, [3, 3, 3])
+
+    def test_row_shape(self):
+        response, _ = self.get('/api/tickets/', {'project': self.visible[0].pk, 'page_size': 1})
+        row = response.data['results'][0]
+        self.assertEqual(row['name'], 'T6')
+        self.assertEqual(row['project']['client']['name'], 'Client')
+        self.assertEqual(row['created_by'], self.user.pk)
+        self.assertEqual([user['username'] for user in row['assigned_to']], ['h0'])
+
+    def test_assigned_to_without_prefetch(self):
+        ticket = Ticket.objects.get(name='T1')
+        self.assertEqual(ticket.assigned_to, self.helpers)
+
+    def test_invalid_cursor(self):
+        response, _ = self.get('/api/tickets/', {'cursor': 'bogus'})
+        self.assertEqual(response.status_code, 404)
+
+
+class TicketTimelineTestCase(APITestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='Acme', email='acme@example.com', phone='1', domain='acme.example')
+        self.user = User.objects.create_user(
+            email='dev@acme.example', username='dev', password='password', company=self.company,
+            first_name='Dana', last_name='Dev',
+        )
+        client = Client.objects.create(name='Client', email='client@example.com', phone='2', attached_to_company=self.company)
+        self.project = Project.objects.create(name='Project', client=client, attached_to_company=self.company)
+        view = Permission.objects.create(scope=Permission.SCOPE_PROJECT, code='project.view')
+        ProjectPermissionAssignment.objects.create(project=self.project, user=self.user, permission=view)
+        self.ticket = Ticket.objects.create(name='T', project=self.project, status='OPEN', priority='LOW', created_by=self.user)
+
+    def history(self):
+        update = TicketUpdate.objects.create(ticket=self.ticket, update='Started', status='WIP', priority='LOW', created_by=self.user)
+        comment = TicketComment.objects.create(
+            ticket=self.ticket, for_ticket_update=update, comment='Looks good', created_by=self.user,
+            attached_to_company=self.company,
+        )
+        attachment = TicketAttachement.objects.create(
+            ticket=self.ticket, for_ticket_update=update, attachement='ticket_attachements/log.txt', created_by=self.user,
+        )
+        return update, comment, attachment
+
+    def test_sources_are_projected_on_create_and_removed_on_delete(self):
+        update, comment, attachment = self.history()
+        update.update = 'Edited'
+        update.save()
+        rows = list(TicketActivity.objects.order_by('pk').values_list('kind', 'source_id', 'company_id', 'actor_name', 'data'))
+        self.assertEqual(rows, [
+            ('UPDATE', update.pk, self.company.pk, 'Dana Dev', {'text': 'Edited', 'status': 'WIP', 'priority': 'LOW'}),
+            ('COMMENT', comment.pk, self.company.pk, 'Dana Dev', {'text': 'Looks good', 'update_id': update.pk}),
+            ('ATTACHMENT', attachment.pk, self.company.pk, 'Dana Dev', {'name': 'ticket_attachements/log.txt', 'update_id': update.pk}),
+        ])
+        comment.delete()
+        self.assertEqual(list(TicketActivity.objects.values_list('kind', flat=True).order_by('pk')), ['UPDATE', 'ATTACHMENT'])
+
+    def test_edits_refresh_and_soft_deletes_remove_entries(self):
+        update, comment, attachment = self.history()
+        comment.comment = 'Needs work'
+        comment.save()
+        self.assertEqual(TicketActivity.objects.get(kind='COMMENT').data['text'], 'Needs work')
+
+        comment.is_deleted = True
+        comment.save()
+        attachment.is_deleted = True
+        attachment.save()
+        self.client.force_authenticate(self.user)
+        response = self.client.get(f'/api/tickets/{self.ticket.pk}/timeline/')
+        self.assertEqual([row['kind'] for row in response.data['results']], ['UPDATE'])
+        self.assertNotIn('Needs work', json.dumps(response.data))
+
+        comment.is_deleted = False
+        comment.save()
+        self.assertEqual(TicketActivity.objects.get(kind='COMMENT').data['text'], 'Needs work')
+
+    def test_timeline_pages_newest_first_in_constant_queries(self):
+        for _ in range(2):
+            self.history()
+        self.client.force_authenticate(self.user)
+        url, params = f'/api/tickets/{self.ticket.pk}/timeline/', {'page_size': 2}
+        kinds, counts = [], []
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            kinds += [row['kind'] for row in response.data['results']]
+            counts.append(len([q for q in ctx.captured_queries if 'SAVEPOINT' not in q['sql']]))
+            url, params = response.data['next'], None
+        self.assertEqual(kinds, ['ATTACHMENT', 'COMMENT', 'UPDATE'] * 2)
+        self.assertEqual(len(set(counts[1:])), 1)
+        self.assertLessEqual(counts[-1], counts[0])
+
+    def test_backfill_migration(self):
+        import importlib
+        from django.apps import apps
+        self.history()
+        TicketActivity.objects.all().delete()
+        importlib.import_module('core.migrations.0009_ticket_activity').backfill_activity(apps, None)
+        self.assertEqual(
+            list(TicketActivity.objects.order_by('kind').values_list('kind', 'actor_name', 'company_id')),
+            [('ATTACHMENT', 'Dana Dev', self.company.pk), ('COMMENT', 'Dana Dev', self.company.pk), ('UPDATE', 'Dana Dev', self.company.pk)],
+        )
+
+
+class SearchTestCase(APITestCase):
+    def setUp(self):
+        self.acme = Company.objects.create(name='Acme', email='acme@example.com', phone='1', domain='acme.example')
+        globex = Company.objects.create(name='Globex', email='globex@example.com', phone='2', domain='globex.example')
+        self.user = User.objects.create_user(email='dev@acme.example', username='dev', password='password', company=self.acme)
+        client = Client.objects.create(name='Client', email='client@example.com', phone='3', attached_to_company=self.acme)
+        self.project = Project.objects.create(name='Billing', description='Invoice pipeline', client=client, attached_to_company=self.acme)
+        hidden = Project.objects.create(name='Hidden', client=client, attached_to_company=self.acme)
+        foreign = Project.objects.create(name='Foreign', client=client, attached_to_company=globex)
+        view = Permission.objects.create(scope=Permission.SCOPE_PROJECT, code='project.view')
+        for project in (self.project, foreign):
+            ProjectPermissionAssignment.objects.create(project=project, user=self.user, permission=view)
+
+        self.ticket = Ticket.objects.create(
+            name='Invoice totals wrong', description='Rounding error on invoice export',
+            project=self.project, status='OPEN', priority='HIGH', created_by=self.user,
+        )
+        Ticket.objects.create(name='Login page', description='Mentions an invoice once', project=self.project, status='OPEN', priority='LOW', created_by=self.user)
+        Ticket.objects.create(name='Invoice secret', project=hidden, status='OPEN', priority='LOW', created_by=self.user)
+        Ticket.objects.create(name='Invoice abroad', project=foreign, status='OPEN', priority='LOW', created_by=self.user)
+        update = TicketUpdate.objects.create(ticket=self.ticket, update='Traced the invoice rounding to tax code', status='WIP', priority='HIGH', created_by=self.user)
+        TicketComment.objects.create(
+            ticket=self.ticket, for_ticket_update=update, comment='Nothing relevant here',
+            created_by=self.user, attached_to_company=self.acme,
+        )
+
+    def test_ranked_and_permission_scoped(self):
+        with tenant_context(self.acme):
+            results = search.search(self.user, 'invoice')
+        self.assertEqual(
+            [(row['type'], row['title']) for row in results],
+            [
+                ('ticket', 'Invoice totals wrong'),
+                ('update', 'Invoice totals wrong'),
+                ('project', 'Billing'),
+                ('ticket', 'Login page'),
+            ],
+        )
+        self.assertEqual(results[1]['ticket_id'], self.ticket.pk)
+        self.assertIsNone(results[2]['ticket_id'])
+        self.assertIn('<mark>invoice</mark>', results[1]['headline'])
+
+    def test_all_terms_must_match(self):
+        with tenant_context(self.acme):
+            results = search.search(self.user, 'invoice rounding', kinds=['ticket'])
+        self.assertEqual([row['id'] for row in results], [self.ticket.pk])
+
+    def test_endpoint(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/search/', {'q': 'rounding', 'type': 'update,comment'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['type'] for row in response.data['results']], ['update'])
+        self.assertEqual(self.client.get('/api/search/', {'q': 'x', 'type': 'invoice'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/search/', {'q': ''}).data['results'], [])
+
+
+class TicketBoardTestCase(APITestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='Acme', email='acme@example.com', phone='1', domain='acme.example')
+        self.user = User.objects.create_user(email='dev@acme.example', username='dev', password='password', company=self.company)
+        self.helper = User.objects.create_user(email='h@acme.example', username='h', password='password', company=self.company)
+        client = Client.objects.create(name='Client', email='client@example.com', phone='2', attached_to_company=self.company)
+        self.first, self.second, self.hidden = [
+            Project.objects.create(name=name, client=client, attached_to_company=self.company)
+            for name in ('First', 'Second', 'Hidden')
+        ]
+        view = Permission.objects.create(scope=Permission.SCOPE_PROJECT, code='project.view')
+        for project in (self.first, self.second):
+            ProjectPermissionAssignment.objects.create(project=project, user=self.user, permission=view)
+        self.tickets = [
+            Ticket.objects.create(name=f'T{i}', project=project, status=state, priority=priority, created_by=self.user)
+            for i, (project, state, priority) in enumerate([
+                (self.first, 'OPEN', 'HIGH'),
+                (self.first, 'OPEN', 'LOW'),
+                (self.first, 'DONE', 'LOW'),
+                (self.second, 'OPEN', 'LOW'),
+                (self.hidden, 'OPEN', 'HIGH'),
+            ])
+        ]
+        TicketAssignee.objects.create(ticket=self.tickets[0], user=self.helper)
+        TicketAssignee.objects.create(ticket=self.tickets[1], user=self.helper)
+        TicketAssignee.objects.create(ticket=self.tickets[3], user=self.user)
+        TicketAssignee.objects.create(ticket=self.tickets[2], user=self.user, is_active=False)
+
+    def test_facets_in_one_query(self):
+        with self.assertNumQueries(1):
+            counts = boards.count_facets([self.first.pk])
+        self.assertEqual(counts, {
+            'total': 3,
+            'status': {'OPEN': 2, 'DONE': 1},
+            'priority': {'HIGH': 1, 'LOW': 2},
+            'assignee': {self.helper.pk: 2},
+        })
+
+    def test_cached_until_ticket_changes(self):
+        project_ids = [self.first.pk, self.second.pk]
+        self.assertEqual(boards.board_counts(project_ids)['status'], {'OPEN': 3, 'DONE': 1})
+        with self.assertNumQueries(0):
+            boards.board_counts(project_ids)
+        ticket = self.tickets[0]
+        ticket.status = 'DONE'
+        ticket.save()
+        self.assertEqual(boards.board_counts(project_ids)['status'], {'OPEN': 2, 'DONE': 2})
+        TicketAssignee.objects.filter(ticket=self.tickets[3]).delete()
+        self.assertEqual(boards.board_counts(project_ids)['assignee'], {self.helper.pk: 2})
+
+    def test_moving_a_ticket_invalidates_both_boards(self):
+        self.assertEqual(boards.board_counts([self.first.pk])['total'], 3)
+        self.assertEqual(boards.board_counts([self.second.pk])['total'], 1)
+        ticket = Ticket.objects.get(pk=self.tickets[0].pk)
+        ticket.project = self.second
+        ticket.save()
+        self.assertEqual(boards.board_counts([self.first.pk])['total'], 2)
+        self.assertEqual(boards.board_counts([self.second.pk])['total'], 2)
+        # The instance now tracks its new project, so moving it back works too.
+        ticket.project = self.first
+        ticket.save()
+        self.assertEqual(boards.board_counts([self.second.pk])['total'], 1)
+
+    def test_endpoint(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/tickets/board/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total'], 4)
+        response = self.client.get('/api/tickets/board/', {'project': self.second.pk})
+        self.assertEqual(response.data['assignee'], {self.user.pk: 1})
+        self.assertEqual(self.client.get('/api/tickets/board/', {'project': self.hidden.pk}).status_code, 404)
+
+
+class UploadDownloadTestCase(APITestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        overrides = override_settings(
+            MEDIA_ROOT=self.media, UPLOAD_TEMP_DIR=f'{self.media}/uploads', BACKGROUND_WORKERS=0,
+            DOWNLOAD_SENDFILE_BACKEND='',
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.company = Company.objects.create(name='Acme', email='acme@example.com', phone='1', domain='acme.example')
+        self.user = User.objects.create_user(email='dev@acme.example', username='dev', password='password', company=self.company)
+        client = Client.objects.create(name='Client', email='client@example.com', phone='2', attached_to_company=self.company)
+        project = Project.objects.create(name='Project', client=client, attached_to_company=self.company)
+        view = Permission.objects.create(scope=Permission.SCOPE_PROJECT, code='project.view')
+        ProjectPermissionAssignment.objects.create(project=project, user=self.user, permission=view)
+        ticket = Ticket.objects.create(name='T', project=project, status='OPEN', priority='LOW', created_by=self.user)
+        self.update = TicketUpdate.objects.create(ticket=ticket, update='', status='OPEN', priority='LOW', created_by=self.user)
+        self.client.force_authenticate(self.user)
+        self.content = bytes(range(256)) * 40
+
+    def start(self, content, **extra):
+        response = self.client.post('/api/uploads/', {
+            'kind': UploadSession.KIND_ATTACHMENT, 'filename': 'report.bin', 'size': len(content),
+            'ticket_update': self.update.pk, **extra,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data
+
+    def put(self, session_id, offset, chunk):
+        # Runs the after-commit finishing step, as the background pool would.
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.put(
+                f'/api/uploads/{session_id}/', data=chunk, content_type='application/octet-stream',
+                HTTP_UPLOAD_OFFSET=str(offset),
+            )
+
+    def upload(self, content, chunk_size=4000):
+        session = self.start(content)
+        for offset in range(0, len(content), chunk_size):
+            response = self.put(session['id'], offset, content[offset:offset + chunk_size])
+            self.assertEqual(response.status_code, 200)
+        return self.client.get(f'/api/uploads/{session["id"]}/').data
+
+    def test_chunked_upload_resumes_and_dedups(self):
+        session = self.start(self.content)
+        self.assertEqual(self.put(session['id'], 0, self.content[:4000]).data['offset'], 4000)
+        stale = self.put(session['id'], 0, self.content[:4000])
+        self.assertEqual((stale.status_code, stale.data['offset']), (409, 4000))
+        self.assertEqual(self.client.get(f'/api/uploads/{session["id"]}/').data['offset'], 4000)
+        done = self.put(session['id'], 4000, self.content[4000:])
+        self.assertEqual(done.data['status'], UploadSession.STATUS_PROCESSING)
+        done = self.client.get(f'/api/uploads/{session["id"]}/')
+        self.assertEqual(done.data['status'], UploadSession.STATUS_COMPLETE)
+
+        attachment = TicketAttachement.objects.get(pk=done.data['attachment'])
+        self.assertEqual(attachment.content_hash, hashlib.sha256(self.content).hexdigest())
+        with attachment.attachement.open('rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+
+        again = self.upload(self.content)
+        self.assertEqual(TicketAttachement.objects.get(pk=again['attachment']).attachement.name, attachment.attachement.name)
+        instant = self.start(self.content, sha256=attachment.content_hash)
+        self.assertEqual(instant['status'], UploadSession.STATUS_COMPLETE)
+        self.assertEqual(TicketAttachement.objects.get(pk=instant['attachment']).attachement.name, attachment.attachement.name)
+
+    def test_hash_mismatch_fails_the_upload(self):
+        session = self.start(self.content, sha256='0' * 64)
+        self.put(session['id'], 0, self.content)
+        response = self.client.get(f'/api/uploads/{session["id"]}/')
+        self.assertEqual(response.data['status'], UploadSession.STATUS_FAILED)
+        self.assertFalse(TicketAttachement.objects.filter(ticket_id=self.update.ticket_id).exists())
+
+    def test_last_chunk_leaves_storing_to_the_background(self):
+        session = self.start(self.content)
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.put(
+                f'/api/uploads/{session["id"]}/', data=self.content, content_type='application/octet-stream',
+                HTTP_UPLOAD_OFFSET='0',
+            )
+        self.assertEqual(response.data['status'], UploadSession.STATUS_PROCESSING)
+        self.assertFalse(TicketAttachement.objects.filter(ticket_id=self.update.ticket_id).exists())
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertEqual(UploadSession.objects.get(pk=session['id']).status, UploadSession.STATUS_COMPLETE)
+
+    def test_uploads_stalled_in_processing_are_resumed(self):
+        session = self.start(self.content)
+        # The process dies before the deferred finish runs.
+        with self.captureOnCommitCallbacks():
+            self.client.put(
+                f'/api/uploads/{session["id"]}/', data=self.content, content_type='application/octet-stream',
+                HTTP_UPLOAD_OFFSET='0',
+            )
+        out = io.StringIO()
+        call_command('resume_uploads', stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Resumed 0 uploads.')
+
+        UploadSession.objects.filter(pk=session['id']).update(updated_at=timezone.now() - datetime.timedelta(hours=1))
+        call_command('resume_uploads', stdout=out)
+        self.assertIn('Resumed 1 uploads.', out.getvalue())
+        resumed = UploadSession.objects.get(pk=session['id'])
+        self.assertEqual(resumed.status, UploadSession.STATUS_COMPLETE)
+        with resumed.attachment.attachement.open('rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+
+    def test_download_supports_ranges_and_handoff(self):
+        attachment_id = self.upload(self.content)['attachment']
+        url = f'/api/attachments/{attachment_id}/download/'
+        full = self.client.get(url)
+        self.assertEqual((full.status_code, b''.join(full.streaming_content)), (200, self.content))
+        partial = self.client.get(url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(partial['Content-Range'], f'bytes 100-199/{len(self.content)}')
+        self.assertEqual(b''.join(partial.streaming_content), self.content[100:200])
+        self.assertEqual(b''.join(self.client.get(url, HTTP_RANGE='bytes=-10').streaming_content), self.content[-10:])
+        self.assertEqual(self.client.get(url, HTTP_RANGE=f'bytes={len(self.content)}-').status_code, 416)
+        with self.settings(DOWNLOAD_SENDFILE_BACKEND='nginx'):
+            handoff = self.client.get(url)
+        self.assertTrue(handoff['X-Accel-Redirect'].startswith('/protected-media/blobs/'))
+        self.assertIn('report.bin', handoff['Content-Disposition'])
+        self.assertEqual(handoff.content, b'')
+
+    def test_profile_picture_thumbnail_after_commit(self):
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new('RGB', (800, 600), 'red').save(buffer, format='PNG')
+        picture = buffer.getvalue()
+        session = self.client.post('/api/uploads/', {
+            'kind': UploadSession.KIND_PROFILE_PICTURE, 'filename': 'me.png', 'size': len(picture),
+        }, format='json').data
+        self.put(session['id'], 0, picture)
+        self.assertEqual(self.client.get(f'/api/uploads/{session["id"]}/').data['status'], UploadSession.STATUS_COMPLETE)
+        profile = Profile.objects.get(user=self.user)
+        with profile.profile_picture_thumbnail.open('rb') as thumbnail:
+            self.assertEqual(Image.open(thumbnail).size, (256, 192))
+        response = self.client.get(f'/api/users/{self.user.pk}/picture/', {'size': 'thumbnail'})
+        self.assertEqual(response.status_code, 200)
+
+
+class AttachmentBlobTestCase(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        overrides = override_settings(MEDIA_ROOT=self.media)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        company = Company.objects.create(name='Acme', email='acme@example.com', phone='1', domain='acme.example')
+        self.user = User.objects.create_user(email='dev@acme.example', username='dev', password='password', company=company)
+        client = Client.objects.create(name='Client', email='client@example.com', phone='2', attached_to_company=company)
+        project = Project.objects.create(name='Project', client=client, attached_to_company=company)
+        ticket = Ticket.objects.create(name='T', project=project, status='OPEN', priority='LOW', created_by=self.user)
+        self.update = TicketUpdate.objects.create(ticket=ticket, update='', status='OPEN', priority='LOW', created_by=self.user)
+
+    def attach(self, content, name='shot.png'):
+        return TicketAttachement.objects.create(
+            ticket=self.update.ticket, for_ticket_update=self.update, created_by=self.user,
+            attachement=ContentFile(content, name=name),
+        )
+
+    def test_identical_content_is_stored_once(self):
+        first = self.attach(b'same bytes', 'a.png')
+        second = self.attach(b'same bytes', 'b.png')
+        other = self.attach(b'other bytes')
+        digest = hashlib.sha256(b'same bytes').hexdigest()
+        self.assertEqual(first.attachement.name, f'blobs/{digest[:2]}/{digest[2:4]}/{digest}')
+        self.assertEqual(second.attachement.name, first.attachement.name)
+        self.assertNotEqual(other.attachement.name, first.attachement.name)
+        self.assertEqual(AttachmentBlob.objects.get(pk=digest).refcount, 2)
+        self.assertEqual(TicketAttachement.objects.get(pk=second.pk).content_hash, digest)
+
+    def test_gc_purges_expired_soft_deletes_then_unreferenced_blobs(self):
+        first = self.attach(b'same bytes')
+        second = self.attach(b'same bytes')
+        storage = first.attachement.storage
+        long_ago = timezone.now() - datetime.timedelta(days=60)
+        TicketAttachement.all_objects.filter(pk=first.pk).update(is_deleted=True, updated_at=long_ago)
+
+        self.assertEqual(blobs.collect_garbage(datetime.timedelta(days=30), grace=datetime.timedelta(0)), (1, 0))
+        self.assertTrue(storage.exists(second.attachement.name))
+        self.assertEqual(AttachmentBlob.objects.get().refcount, 1)
+
+        TicketAttachement.all_objects.filter(pk=second.pk).update(is_deleted=True)
+        self.assertEqual(blobs.collect_garbage(datetime.timedelta(days=30), grace=datetime.timedelta(0)), (0, 0))
+        TicketAttachement.all_objects.filter(pk=second.pk).update(updated_at=long_ago)
+        self.assertEqual(blobs.collect_garbage(datetime.timedelta(days=30), grace=datetime.timedelta(0)), (1, 1))
+        self.assertFalse(storage.exists(second.attachement.name))
+        self.assertFalse(AttachmentBlob.objects.exists())
+
+    def test_held_blob_survives_collection(self):
+        attachment = self.attach(b'held bytes')
+        name = attachment.attachement.name
+        attachment.delete()
+        AttachmentBlob.objects.update(updated_at=timezone.now() - datetime.timedelta(days=1))
+        # An upload about to store these bytes again holds the blob first.
+        blobs.hold(hashlib.sha256(b'held bytes').hexdigest())
+        self.assertEqual(blobs.collect_garbage(datetime.timedelta(days=30)), (0, 0))
+        self.assertTrue(attachment.attachement.storage.exists(name))
+
+
+class NotificationFanoutTestCase(APITestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='Acme', email='acme@example.com', phone='1', domain='acme.example')
+        self.users = [
+            User.objects.create_user(email=f'u{i}@acme.example', username=f'u{i}', password='password', company=self.company)
+            for i in range(4)
+        ]
+
+    def test_fanout_is_bulk_and_counted(self):
+        with CaptureQueriesContext(connection) as ctx:
+            created = notifications.notify(self.users, 'Hello', 'World', exclude=[self.users[3]])
+        statements = [q['sql'].split()[0] for q in ctx.captured_queries if 'SAVEPOINT' not in q['sql']]
+        # Notifications, counters, counter bump, delivery queue rows.
+        self.assertEqual(statements, ['INSERT', 'INSERT', 'UPDATE', 'INSERT'])
+        self.assertEqual(len(created), 3)
+        with self.assertNumQueries(1):
+            self.assertEqual(notifications.unread_count(self.users[0]), 1)
+        self.assertEqual(notifications.unread_count(self.users[3]), 0)
+
+    def test_ticket_assignees_and_leave_approvers(self):
+        admin = User.objects.create_user(email='admin@acme.example', username='admin', password='password', company=self.company, is_admin=True)
+        manager, worker = self.users[0], self.users[1]
+        worker.manager_id = manager
+        worker.save()
+        client = Client.objects.create(name='Client', email='client@example.com', phone='2', attached_to_company=self.company)
+        project = Project.objects.create(name='Project', client=client, attached_to_company=self.company)
+        ticket = Ticket.objects.create(name='T', project=project, status='OPEN', priority='LOW', created_by=worker)
+        TicketAssignee.objects.create(ticket=ticket, user=self.users[2])
+        TicketAssignee.objects.create(ticket=ticket, user=self.users[3], is_active=False)
+        notifications.notify_ticket_assignees(ticket, 'Ticket moved', 'Now in review')
+        self.assertEqual(list(Notification.objects.values_list('user_id', 'type')), [(self.users[2].pk, 'TICKET_UPDATE')])
+
+        leave = LeaveRequest.objects.create(
+            user=worker, leave_type=LeaveType.objects.create(name='Annual', description=''),
+            start_date=datetime.date(2025, 3, 3), end_date=datetime.date(2025, 3, 4), reason='Trip', status='PENDING',
+        )
+        notifications.notify_leave_approvers(leave, 'Leave request', 'Please review')
+        self.assertEqual(
+            sorted(Notification.objects.filter(type='LEAVE_UPDATE').values_list('user_id', flat=True)),
+            sorted([manager.pk, admin.pk]),
+        )
+
+    def test_mark_read_by_range_and_ids(self):
+        user = self.users[0]
+        for i in range(5):
+            notifications.notify([user], f'N{i}', '')
+        ids = list(Notification.objects.filter(user=user).order_by('pk').values_list('pk', flat=True))
+        self.assertEqual(notifications.mark_read(user, first_id=ids[1], last_id=ids[2]), 2)
+        self.assertEqual(notifications.mark_read(user, first_id=ids[1], last_id=ids[2]), 0)
+        self.assertEqual(notifications.unread_count(user), 3)
+
+        self.client.force_authenticate(user)
+        response = self.client.post('/api/notifications/mark-read/', {'ids': [ids[0], ids[4]]}, format='json')
+        self.assertEqual(response.data, {'marked': 2, 'unread': 1})
+        self.assertEqual(self.client.get('/api/notifications/unread-count/').data, {'unread': 1})
+        listing = self.client.get('/api/notifications/', {'unread': '1'})
+        self.assertEqual([row['title'] for row in listing.data['results']], ['N3'])
+
+    def test_single_writes_and_recount(self):
+        user = self.users[0]
+        note = Notification.objects.create(user=user, title='One', message='', type='GENERAL')
+        self.assertEqual(notifications.unread_count(user), 1)
+        note.delete()
+        self.assertEqual(notifications.unread_count(user), 0)
+        Notification.objects.bulk_create([Notification(user=user, title='Raw', message='', type='GENERAL')])
+        notifications.recount([user.pk])
+        self.assertEqual(NotificationCounter.objects.get(user=user).unread, 1)
+
+
+class EventStreamTestCase(TestCase):
+    def setUp(self):
+        self.broker = events.InMemoryBroker()
+        self.addCleanup(setattr, events, '_broker', events._broker)
+        events._broker = self.broker
+        self.company = Company.objects.create(name='Acme', email='acme@example.com', phone='1', domain='acme.example')
+        self.user = User.objects.create_user(email='u@acme.example', username='u', password='password', company=self.company)
+
+    def test_broker_delivers_to_subscribed_user_only(self):
+        async def scenario():
+            mine = self.broker.subscribe(1)
+            other = self.broker.subscribe(2)
+            self.broker.publish([1], {'type': 'ping', 'data': {'n': 1}})
+            event = await mine.get(1)
+            self.assertTrue(other.queue.empty())
+            self.broker.unsubscribe(mine)
+            self.broker.unsubscribe(other)
+            return event
+
+        event = asyncio.run(scenario())
+        self.assertEqual((event['type'], event['data']), ('ping', {'n': 1}))
+        self.assertEqual(self.broker.connection_count(), 0)
+        self.assertEqual(events.format_sse(event), f"id: {event['id']}\nevent: ping\ndata: {{\"n\": 1}}\n\n")
+
+    def test_events_are_published_after_commit(self):
+        sent = []
+        self.broker.publish = lambda user_ids, event: sent.append((user_ids, event['type']))
+        with self.captureOnCommitCallbacks() as callbacks:
+            notifications.notify([self.user], 'Hello', 'World')
+        self.assertEqual(sent, [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(sent, [([self.user.pk], 'notification')])
+
+    def test_redis_relay_reconnects_after_a_dropped_connection(self):
+        class Stop(BaseException):
+            pass
+
+        sessions = []
+
+        class FakePubSub:
+            def __init__(self, **kwargs):
+                self.channels, self.closed = [], False
+                sessions.append(self)
+
+            def subscribe(self, channel):
+                self.channels.append(channel)
+
+            def close(self):
+                self.closed = True
+
+            def listen(self):
+                if len(sessions) == 1:
+                    raise ConnectionError('Connection reset by peer')
+                yield {'data': json.dumps({'users': [1], 'event': {'id': 1, 'type': 'ping', 'data': {}}})}
+                raise Stop
+
+        connection = types.SimpleNamespace(pubsub=FakePubSub)
+        fake_redis = types.SimpleNamespace(Redis=types.SimpleNamespace(from_url=lambda url: connection))
+        with mock.patch.dict(sys.modules, {'redis': fake_redis}):
+            broker = events.RedisBroker('redis://events')
+        broker.reconnect_delay = 0
+        delivered = []
+        broker.deliver = lambda user_ids, event: delivered.append((user_ids, event['type']))
+        with self.assertRaises(Stop), self.assertLogs('core.events', 'WARNING'):
+            broker._listen()
+        self.assertEqual(delivered, [([1], 'ping')])
+        self.assertEqual([session.channels for session in sessions], [[broker.channel], [broker.channel]])
+        self.assertTrue(all(session.closed for session in sessions))
+
+    def test_stream_requires_login(self):
+        self.assertEqual(self.client.get('/api/events/').status_code, 403)
+
+    async def test_stream_sends_user_events(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get('/api/events/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = aiter(response.streaming_content)
+        self.assertEqual(await anext(chunks), b'retry: 5000\n\n')
+        reader = asyncio.ensure_future(anext(chunks))
+        await asyncio.sleep(0)
+        self.broker.publish([self.user.pk], {'type': 'notification', 'data': {'title': 'Hi'}})
+        chunk = await asyncio.wait_for(reader, 1)
+        self.assertIn(b'event: notification\ndata: {"title": "Hi"}', chunk)
+        # A client disconnect cancels the pending read, which unsubscribes.
+        reader = asyncio.ensure_future(anext(chunks))
+        await asyncio.sleep(0)
+        reader.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await reader
+        self.assertEqual(self.broker.connection_count(), 0)
+
+
+class NotificationDispatchTestCase(TestCase):
+    def setUp(self):
+        self.addCleanup(dispatch._providers.clear)
+        self.addCleanup(dispatch.StubProvider.outbox.clear)
+        self.addCleanup(dispatch.StubProvider.failing.clear)
+        self.company = Company.objects.create(name='Acme', email='acme@example.com', phone='1', domain='acme.example')
+        self.users = [
+            User.objects.create_user(email=f'u{i}@acme.example', username=f'u{i}', password='password', company=self.company)
+            for i in range(5)
+        ]
+
+    def test_notify_queues_without_sending(self):
+        notifications.notify(self.users, 'Leave approved', 'Enjoy')
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(NotificationDelivery.objects.filter(channel='EMAIL', status='PENDING').count(), 5)
+
+        self.users[4].is_active = False
+        self.users[4].save()
+        self.assertEqual(dispatch.dispatch_pending(), 5)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), [f'u{i}@acme.example' for i in range(4)])
+        self.assertEqual(mail.outbox[0].subject, 'Leave approved')
+        self.assertEqual(NotificationDelivery.objects.filter(status='SENT').count(), 4)
+        self.assertEqual(NotificationDelivery.objects.filter(status='SKIPPED').count(), 1)
+        self.assertEqual(dispatch.dispatch_pending(), 0)
+
+    def test_provider_without_send_batch_fails_on_creation(self):
+        class Incomplete(dispatch.Provider):
+            pass
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+    @override_settings(
+        NOTIFICATION_CHANNELS={'PUSH': {'BACKEND': 'core.dispatch.StubProvider', 'BATCH_SIZE': 2}},
+        NOTIFICATION_MAX_ATTEMPTS=3,
+    )
+    def test_batches_retries_and_dead_letters(self):
+        notifications.notify(self.users, 'Ticket moved', 'In review')
+        failing = self.users[0]
+        dispatch.StubProvider.failing.add(str(failing.pk))
+        provider = dispatch.get_provider('PUSH')
+        batches = []
+        send_batch = provider.send_batch
+        provider.send_batch = lambda messages: batches.append(len(messages)) or send_batch(messages)
+
+        now = timezone.now()
+        while dispatch.dispatch_batch('PUSH', now=now):
+            pass
+        self.assertEqual(batches, [2, 2, 1])
+        self.assertEqual(len(dispatch.StubProvider.outbox), 4)
+        retry = NotificationDelivery.objects.get(status='PENDING')
+        self.assertEqual((retry.attempts, retry.next_attempt_at), (1, now + datetime.timedelta(seconds=30)))
+        self.assertEqual(dispatch.dispatch_batch('PUSH', now=now), 0)
+
+        now = retry.next_attempt_at
+        self.assertEqual(dispatch.dispatch_batch('PUSH', now=now), 1)
+        retry.refresh_from_db()
+        self.assertEqual((retry.attempts, retry.next_attempt_at), (2, now + datetime.timedelta(seconds=60)))
+        dispatch.dispatch_batch('PUSH', now=retry.next_attempt_at)
+
+        self.assertFalse(NotificationDelivery.objects.filter(status='PENDING').exists())
+        dead = DeadLetterDelivery.objects.get()
+        self.assertEqual((dead.user_id, dead.attempts, dead.payload['title']), (failing.pk, 3, 'Ticket moved'))
+        Notification.objects.filter(pk=dead.notification_id).delete()
+        dead.refresh_from_db()
+        self.assertIsNone(dead.notification_id)
+
+    def test_rate_limiter_spaces_batches(self):
+        clock = [100.0]
+        slept = []
+        limiter = dispatch.RateLimiter(10, clock=lambda: clock[0], sleep=lambda seconds: slept.append(seconds))
+        limiter.acquire(5)
+        limiter.acquire(5)
+        clock[0] += 2
+        limiter.acquire(5)
+        self.assertEqual(slept, [0.5])
+
+
+class NotificationRetentionTestCase(APITestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='Acme', email='acme@example.com', phone='1', domain='acme.example')
+        self.user = User.objects.create_user(email='u@acme.example', username='u', password='password', company=self.company)
+        self.other = User.objects.create_user(email='o@acme.example', username='o', password='password', company=self.company)
+        old = timezone.now() - datetime.timedelta(days=120)
+        for i in range(5):
+            notifications.notify([self.user], f'Old {i}', 'Seen')
+        notifications.notify([self.user], 'Old unread', '')
+        notifications.notify([self.other], 'Other old', '')
+        notifications.notify([self.user], 'Recent', '')
+        Notification.objects.exclude(title='Recent').update(created_at=old)
+        for user in (self.user, self.other):
+            notifications.mark_read(user, ids=Notification.objects.exclude(title='Old unread').values_list('pk', flat=True))
+
+    def test_archives_old_read_notifications_in_chunks(self):
+        archived_ids = list(Notification.objects.filter(is_read=True).exclude(title='Recent').values_list('pk', flat=True))
+        self.assertEqual(retention.archive_notifications(datetime.timedelta(days=90), chunk_size=2, max_chunks=1), 2)
+        self.assertEqual(retention.archive_notifications(datetime.timedelta(days=90), chunk_size=2), 4)
+        self.assertEqual(sorted(ArchivedNotification.objects.values_list('pk', flat=True)), sorted(archived_ids))
+        self.assertEqual(
+            sorted(Notification.objects.values_list('title', flat=True)), ['Old unread', 'Recent'],
+        )
+        self.assertEqual(notifications.unread_count(self.user), 1)
+        self.assertEqual(retention.archive_notifications(datetime.timedelta(days=90)), 0)
+
+    def test_archive_endpoint_pages_users_own_archive(self):
+        retention.archive_notifications(datetime.timedelta(days=90))
+        self.client.force_authenticate(self.user)
+        first = self.client.get('/api/notifications/archive/', {'page_size': 3})
+        self.assertEqual(len(first.data['results']), 3)
+        rest = self.client.get(first.data['next'])
+        titles = [row['title'] for row in first.data['results'] + rest.data['results']]
+        self.assertEqual(sorted(titles), [f'Old {i}' for i in range(5)])
+        self.assertIsNone(rest.data['next'])
+
+
+class UserImportExportTestCase(APITestCase):
+    CSV = (
+        'Email,Username,First_Name,Last_Name,Password,Manager_Email,Designation,Role,Phone\n'
+        'ann@acme.example,ann,Ann,A,secret-1,boss@acme.example,Engineer,,555\n'
+        'bad-email,,,,,,,,\n'
+        'boss@acme.example,boss,Bo,S,secret-2,,,admin,\n'
+        'ANN@acme.example,ann2,,,,,,,\n'
+        'taken@acme.example,,,,,,,,\n'
+        'cy@acme.example,cy,Cy,C,,,Astronaut,,\n'
+        'dee@acme.example,dee,Dee,D,,nobody@acme.example,,,\n'
+    )
+
+    def setUp(self):
+        self.company = Company.objects.create(name='Acme', email='acme@example.com', phone='1', domain='acme.example')
+        self.admin = User.objects.create_user(
+            email='admin@acme.example', username='admin', password='password', company=self.company, is_admin=True,
+        )
+        User.objects.create_user(email='taken@acme.example', username='taken', password='password')
+        Designation.objects.create(name='Engineer', department=Department.objects.create(name='R&D'))
+
+    def test_import_chunks_validates_and_links_managers(self):
+        rows = user_io.read_rows(io.BytesIO(self.CSV.encode()), 'people.csv')
+        result = user_io.import_users(rows, self.company, created_by=self.admin, chunk_size=2)
+        self.assertEqual(result.created, 3)
+        self.assertEqual(result.managers_linked, 1)
+        self.assertEqual([error['line'] for error in result.errors], [3, 5, 6, 7, 8])
+
+        ann = User.all_objects.get(email='ann@acme.example')
+        self.assertEqual(ann.manager_id.email, 'boss@acme.example')
+        self.assertTrue(ann.check_password('secret-1'))
+        self.assertTrue(ann.is_employee)
+        self.assertEqual(ann.employee.designation.name, 'Engineer')
+        self.assertEqual(ann.profile.phone, '555')
+        self.assertFalse(User.all_objects.get(email='dee@acme.example').has_usable_password())
+        self.assertEqual(
+            dict(CompanyMembership.objects.filter(company=self.company).values_list('user__username', 'role')),
+            {'ann': 'MEMBER', 'boss': 'ADMIN', 'dee': 'MEMBER'},
+        )
+        self.assertEqual(PermissionAuditEvent.objects.filter(event_type='company_membership.created').count(), 3)
+
+    def test_import_and_export_endpoints(self):
+        media, private = tempfile.mkdtemp(), tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, private, ignore_errors=True)
+        self.client.force_authenticate(self.admin)
+        upload = SimpleUploadedFile('people.csv', self.CSV.encode(), content_type='text/csv')
+        with override_settings(MEDIA_ROOT=media, PRIVATE_ROOT=private):
+            response = self.client.post('/api/users/import/', {'file': upload}, format='multipart')
+            # Queued, not run in the request.
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.data['status'], UserImport.STATUS_PENDING)
+            self.assertFalse(User.all_objects.filter(email='ann@acme.example').exists())
+            # Kept out of the served media tree, under a name that is not the client's.
+            stored = UserImport.objects.get().file.name
+            self.assertNotIn('people', stored)
+            self.assertTrue(os.path.exists(os.path.join(private, stored)))
+            self.assertEqual(os.listdir(media), [])
+            status_url = f"/api/users/import/{response.data['id']}/"
+            self.assertTrue(response['Location'].endswith(status_url))
+
+            call_command('import_users', '--queued', '--once', stdout=io.StringIO())
+            response = self.client.get(status_url)
+            self.assertEqual(response.data['status'], UserImport.STATUS_COMPLETE)
+            self.assertEqual((response.data['created'], response.data['managers_linked']), (3, 1))
+            self.assertEqual([error['line'] for error in response.data['errors']], [3, 5, 6, 7, 8])
+            self.assertFalse(UserImport.objects.get().file)
+            self.assertEqual(os.listdir(os.path.join(private, 'imports', 'users')), [])
+        bad = SimpleUploadedFile('people.txt', b'x', content_type='text/plain')
+        self.assertEqual(self.client.post('/api/users/import/', {'file': bad}, format='multipart').status_code, 400)
+
+        response = self.client.get('/api/users/export/')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['email', 'username', 'first_name'])
+        exported = {line.split(',')[0]: line.split(',') for line in lines[1:]}
+        self.assertEqual(sorted(exported), ['admin@acme.example', 'ann@acme.example', 'boss@acme.example', 'dee@acme.example'])
+        ann = exported['ann@acme.example']
+        self.assertEqual(ann[user_io.EXPORT_COLUMNS.index('manager_email')], 'boss@acme.example')
+        self.assertEqual(ann[user_io.EXPORT_COLUMNS.index('designation')], 'Engineer')
+
+    def test_stale_running_import_is_reclaimed(self):
+        private = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, private, ignore_errors=True)
+        with override_settings(PRIVATE_ROOT=private, USER_IMPORT_STALE_AFTER=60):
+            job = UserImport.objects.create(
+                company=self.company, created_by=self.admin, filename='people.csv', status=UserImport.STATUS_RUNNING,
+                file=SimpleUploadedFile('people.csv', self.CSV.encode()),
+            )
+            self.assertIsNone(user_io.run_queued_import())
+
+            UserImport.objects.filter(pk=job.pk).update(updated_at=timezone.now() - datetime.timedelta(minutes=5))
+            self.assertEqual(user_io.run_queued_import().pk, job.pk)
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.created), (UserImport.STATUS_COMPLETE, 3))
+            self.assertFalse(job.file)
+            self.assertIsNone(user_io.run_queued_import())
+
+    @override_settings(PASSWORD_HASH_WORKERS=2)
+    def test_pooled_hashing_matches_inline(self):
+        self.addCleanup(passwords.shutdown)
+        raw = [f'pw-{i}' for i in range(passwords.POOL_THRESHOLD)] + ['']
+        passwords.hash_passwords(raw)
+        # Outside hashing_pool() (e.g. in a web process) no pool is started.
+        self.assertIsNone(passwords._executor)
+        with passwords.hashing_pool():
+            hashes = passwords.hash_passwords(raw)
+            self.assertIsNotNone(passwords._executor)
+        self.assertIsNone(passwords._executor)
+        user = User(email='x@acme.example')
+        for raw_password, encoded in zip(raw[:-1], hashes):
+            user.password = encoded
+            self.assertTrue(user.check_password(raw_password))
+        user.password = hashes[-1]
+        self.assertFalse(user.has_usable_password())
+
+
+class BulkPasswordTestCase(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='Acme', email='acme@example.com', phone='1', domain='acme.example')
+
+    def test_bulk_create_users_in_batches(self):
+        users = [User(email=f'b{i}@acme.example', username=f'b{i}', company=self.company) for i in range(7)]
+        with CaptureQueriesContext(connection) as ctx:
+            created = passwords.bulk_create_users(users, [f'pw-{i}' for i in range(7)], batch_size=3)
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(len(created), 7)
+        self.assertTrue(User.all_objects.get(email='b6@acme.example').check_password('pw-6'))
+
+        passwords.bulk_set_passwords({created[0].pk: 'rotated'}, batch_size=3)
+        self.assertTrue(User.all_objects.get(pk=created[0].pk).check_password('rotated'))
+
+    def test_only_rows_without_an_encoded_password_are_hashed(self):
+        migrated = make_password('kept')
+        users = [
+            User(email='h1@acme.example', username='h1', company=self.company, password=migrated),
+            User(email='h2@acme.example', username='h2', company=self.company),
+        ]
+        with mock.patch.object(passwords, '_hash', wraps=passwords._hash) as hashed:
+            passwords.bulk_create_users(users, ['ignored', 'fresh'])
+        self.assertEqual([call.args for call in hashed.call_args_list], [('fresh',)])
+        self.assertTrue(User.all_objects.get(email='h1@acme.example').check_password('kept'))
+        self.assertTrue(User.all_objects.get(email='h2@acme.example').check_password('fresh'))
+
+        legacy = make_password('old-secret', salt='saltsalt', hasher='md5')
+        with mock.patch.object(passwords, '_submit', wraps=passwords._submit) as submitted:
+            self.assertEqual(passwords.wrap_legacy_hashes(['', migrated]), ['', migrated])
+            self.assertFalse(submitted.called)
+            wrapped = passwords.wrap_legacy_hashes(['', legacy])
+        self.assertEqual(submitted.call_args.args[1], [legacy])
+        self.assertEqual(wrapped[0], '')
+        self.assertTrue(wrapped[1].startswith('pbkdf2_wrapped_md5$'))
+
+    def test_legacy_hashes_are_wrapped_then_rehashed_on_login(self):
+        legacy = make_password('old-secret', salt='saltsalt', hasher='md5')
+        user = User.objects.create_user(email='legacy@acme.example', username='legacy', company=self.company)
+        User.all_objects.filter(pk=user.pk).update(password=legacy)
+
+        self.assertEqual(passwords.upgrade_legacy_hashes(), 1)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('pbkdf2_wrapped_md5$'))
+        self.assertFalse(authenticate(email='legacy@acme.example', password='wrong'))
+        self.assertEqual(authenticate(email='legacy@acme.example', password='old-secret'), user)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$'))
+        self.assertEqual(passwords.upgrade_legacy_hashes(), 0)
+
+    def test_import_takes_migrated_hashes(self):
+        legacy = make_password('old-secret', salt='saltsalt', hasher='md5')
+        rows = [
+            {'email': 'm1@acme.example', 'password_hash': legacy},
+            {'email': 'm2@acme.example', 'password_hash': 'not-a-hash'},
+        ]
+        result = user_io.import_users(rows, self.company)
+        self.assertEqual((result.created, [error['line'] for error in result.errors]), (1, [3]))
+        migrated = User.all_objects.get(email='m1@acme.example')
+        self.assertTrue(migrated.password.startswith('pbkdf2_wrapped_md5$'))
+        self.assertTrue(migrated.check_password('old-secret'))
+
+
+class AttendanceExportTestCase(APITestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='Acme', email='acme@example.com', phone='1', domain='acme.example')
+        self.admin = User.objects.create_user(
+            email='admin@acme.example', username='admin', password='password', company=self.company, is_admin=True,
+        )
+        outsider = User.objects.create_user(email='out@other.example', username='out', password='password')
+        nine = timezone.make_aware(datetime.datetime(2025, 3, 3, 9))
+        day = Attendance.objects.create(user=self.admin, date=datetime.date(2025, 3, 3))
+        TimeLog.objects.create(attendance=day, check_in=nine, check_out=nine + datetime.timedelta(hours=4))
+        TimeLog.objects.create(attendance=day, check_in=nine + datetime.timedelta(hours=5), check_out=nine + datetime.timedelta(hours=8))
+        Attendance.objects.create(user=self.admin, date=datetime.date(2025, 4, 1), status=Attendance.STATUS_ABSENT)
+        Attendance.objects.create(user=self.admin, date=datetime.date(2025, 5, 1))
+        Attendance.objects.create(user=outsider, date=datetime.date(2025, 3, 3))
+
+    def test_rows_flatten_timelogs_in_one_query(self):
+        with self.assertNumQueries(1):
+            rows = list(exports.attendance_rows(self.company, datetime.date(2025, 3, 1), datetime.date(2025, 4, 1), chunk_size=2))
+        columns = {name: index for index, name in enumerate(exports.HEADER)}
+        self.assertEqual([row[columns['date']] for row in rows], [datetime.date(2025, 3, 3)] * 2 + [datetime.date(2025, 4, 1)])
+        self.assertEqual([row[columns['log_worked_seconds']] for row in rows], [4 * 3600, 3 * 3600, 0])
+        self.assertIsNone(rows[2][columns['timelog_id']])
+        self.assertEqual(rows[0][columns['total_worked_seconds']], 7 * 3600)
+
+    def test_csv_and_jsonl_endpoint(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get('/api/exports/attendance/', {'from': '2025-03', 'to': '2025-04'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(','), exports.HEADER)
+        self.assertEqual(len(lines), 4)
+
+        response = self.client.get('/api/exports/attendance/', {'from': '2025-03', 'to': '2025-03', 'as': 'jsonl'})
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([record['check_in'][:19] for record in records], ['2025-03-03T09:00:00', '2025-03-03T14:00:00'])
+        self.assertEqual(self.client.get('/api/exports/attendance/', {'as': 'xml'}).status_code, 400)
+
+    def test_streams_chunk_by_chunk_under_asgi(self):
+        # The ASGI handler would close the test transaction's connection around the request.
+        signals.request_started.disconnect(close_old_connections)
+        signals.request_finished.disconnect(close_old_connections)
+        self.addCleanup(signals.request_started.connect, close_old_connections)
+        self.addCleanup(signals.request_finished.connect, close_old_connections)
+        produced = []
+        real_export = exports.export_attendance
+
+        def tracked_export(company, start, end, export_format):
+            for chunk in real_export(company, start, end, export_format, chunk_size=1):
+                produced.append(chunk)
+                yield chunk
+
+        sent = []
+        requested = []
+
+        async def receive():
+            if requested:
+                # No disconnect: the handler cancels this once the response is sent.
+                await asyncio.Event().wait()
+            requested.append(True)
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            if message['type'] == 'http.response.body' and message.get('body'):
+                sent.append((message['body'], len(produced)))
+            elif message['type'] == 'http.response.start':
+                self.assertEqual(message['status'], 200)
+
+        credentials = base64.b64encode(b'admin@acme.example:password')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': '/api/exports/attendance/', 'raw_path': b'/api/exports/attendance/',
+            'query_string': b'from=2025-03&to=2025-04', 'root_path': '',
+            'headers': [(b'host', b'testserver'), (b'authorization', b'Basic ' + credentials)],
+            'client': ('127.0.0.1', 1234), 'server': ('testserver', 80),
+        }
+        with mock.patch.object(exports, 'export_attendance', tracked_export):
+            async_to_sync(ASGIHandler())(scope, receive, send)
+        self.assertEqual(b''.join(body for body, _ in sent).decode().count('\n'), 4)
+        # Each chunk went out before the next was produced, not after the export was read whole.
+        self.assertEqual([count for _, count in sent], list(range(1, len(produced) + 1)))
+
+    def test_command_writes_file(self):
+        path = os.path.join(tempfile.mkdtemp(), 'may.csv')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        call_command('export_attendance', '--company', str(self.company.pk), '--from', '2025-05', '--output', path)
+        with open(path) as handle:
+            self.assertEqual(len(handle.read().splitlines()), 2)
+
+
+class CompiledSerializerParityTestCase(APITestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='Acme', email='acme@example.com', phone='1', domain='acme.example')
+        self.user = User.objects.create_user(
+            email='dev@acme.example', username='dev', password='password', company=self.company, first_name='Dé',
+        )
+        other = User.objects.create_user(email='qa@acme.example', username='qa', password='password', company=self.company)
+        client = Client.objects.create(name='Client', email='client@example.com', phone='2', attached_to_company=self.company)
+        self.project = Project.objects.create(name='Project', client=client, attached_to_company=self.company)
+        for i in range(3):
+            ticket = Ticket.objects.create(
+                name=f'T{i}', description=None if i else 'First', project=self.project, status='OPEN',
+                priority='LOW', created_by=self.user,
+            )
+            TicketAssignee.objects.create(ticket=ticket, user=other)
+            TicketUpdate.objects.create(ticket=ticket, update=f'Update {i}', status='OPEN', priority='LOW', created_by=self.user)
+        notifications.notify([self.user, other], 'Hello', 'World')
+        Profile.objects.create(user=self.user, phone='555')
+        Employee.objects.create(user=self.user, designation=Designation.objects.create(
+            name='Engineer', department=Department.objects.create(name='R&D'),
+        ))
+        check_in = timezone.make_aware(datetime.datetime(2025, 3, 3, 9))
+        day = Attendance.objects.create(user=self.user, date=datetime.date(2025, 3, 3))
+        TimeLog.objects.create(attendance=day, check_in=check_in, check_out=check_in + datetime.timedelta(hours=2))
+        TimeLog.objects.create(attendance=day, check_in=check_in + datetime.timedelta(hours=3))
+        Attendance.objects.create(user=other, date=datetime.date(2025, 3, 3))
+        LeaveRequest.objects.create(
+            user=self.user, leave_type=LeaveType.objects.create(name='Annual', description=''),
+            start_date=datetime.date(2025, 3, 3), end_date=datetime.date(2025, 3, 4), reason='Trip', status='PENDING',
+        )
+
+    def assertParity(self, serializer_class, queryset, context=None):
+        instances = list(queryset)
+        self.assertTrue(instances)
+        expected = serializer_class(instances, many=True, context=context or {}).data
+        self.assertEqual(serialize_many(serializer_class, instances, context), expected)
+
+    def test_parity_with_drf_serializers(self):
+        self.assertParity(UserSerializer, User.objects.order_by('pk'))
+        self.assertParity(TicketSerializer, Ticket.objects.for_list().order_by('pk'))
+        self.assertParity(TicketSerializer, Ticket.objects.order_by('pk'))
+        self.assertParity(ProjectSerializer, Project.objects.all())
+        self.assertParity(NotificationSerializer, Notification.objects.order_by('pk'))
+        self.assertParity(ProfileSerializer, Profile.objects.all())
+        self.assertParity(EmployeeSerializer, Employee.objects.all())
+        self.assertParity(AttendanceSerializer, Attendance.objects.order_by('pk'))
+        self.assertParity(LeaveRequestSerializer, LeaveRequest.objects.all())
+        self.assertParity(TicketActivitySerializer, TicketActivity.objects.order_by('pk'))
+
+    @override_settings(TIME_ZONE='Asia/Kolkata')
+    def test_parity_in_local_time_zone(self):
+        with timezone.override('Asia/Kolkata'):
+            self.assertParity(NotificationSerializer, Notification.objects.order_by('pk'))
+            self.assertParity(AttendanceSerializer, Attendance.objects.order_by('pk'))
+
+    def test_list_endpoint_matches_serializer(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/notifications/')
+        expected = NotificationSerializer(Notification.objects.filter(user=self.user).order_by('-created_at', '-pk'), many=True).data
+        self.assertEqual(response.data['results'], expected)
+
+
+class SparseFieldsetTestCase(APITestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='Acme', email='acme@example.com', phone='1', domain='acme.example')
+        self.user = User.objects.create_user(email='dev@acme.example', username='dev', password='password', company=self.company)
+        helper = User.objects.create_user(email='h@acme.example', username='h', password='password', company=self.company)
+        self.client_row = Client.objects.create(name='Client', email='client@example.com', phone='2', attached_to_company=self.company)
+        self.project = Project.objects.create(name='Project', client=self.client_row, attached_to_company=self.company)
+        view = Permission.objects.create(scope=Permission.SCOPE_PROJECT, code='project.view')
+        ProjectPermissionAssignment.objects.create(project=self.project, user=self.user, permission=view)
+        for i in range(3):
+            ticket = Ticket.objects.create(name=f'T{i}', project=self.project, status='OPEN', priority='LOW', created_by=self.user)
+            TicketAssignee.objects.create(ticket=ticket, user=helper)
+        self.client.force_authenticate(self.user)
+
+    def get(self, url, params=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params)
+        return response, [q['sql'] for q in ctx.captured_queries if 'SAVEPOINT' not in q['sql']]
+
+    def selected(self, sql):
+        # Tenant scoping joins the project in WHERE; only the select list shows what is loaded.
+        return sql.split(' FROM ')[0]
+
+    def test_fields_limit_output_and_columns(self):
+        response, queries = self.get('/api/tickets/', {'fields': 'id,name'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([set(row) for row in response.data['results']], [{'id', 'name'}] * 3)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(
+            self.selected(queries[0]),
+            'SELECT "core_ticket"."id", "core_ticket"."name", "core_ticket"."updated_at"',
+        )
+
+    def test_unexpanded_relations_render_as_keys(self):
+        response, queries = self.get('/api/tickets/', {'fields': 'id,project,assigned_to'})
+        row = response.data['results'][0]
+        self.assertEqual(row['project'], self.project.pk)
+        self.assertEqual(len(row['assigned_to']), 1)
+        self.assertNotIn('"core_project"', self.selected(queries[0]))
+
+    def test_expand_joins_only_expanded_relations(self):
+        response, queries = self.get('/api/tickets/', {'fields': 'id,project.name,project.client', 'expand': 'project'})
+        row = response.data['results'][0]
+        self.assertEqual(row['project'], {'id': self.project.pk, 'name': 'Project', 'client': self.client_row.pk})
+        self.assertIn('"core_project"."name"', self.selected(queries[0]))
+        self.assertNotIn('"core_project"."description"', self.selected(queries[0]))
+        self.assertNotIn('JOIN "core_client"', queries[0])
+        self.assertEqual(len(queries), 1)
+
+    def test_full_expansion_matches_default_response(self):
+        default, _ = self.get('/api/tickets/')
+        expanded, queries = self.get('/api/tickets/', {'expand': 'project.client,assigned_to'})
+        self.assertEqual(expanded.data, default.data)
+        self.assertEqual(len(queries), 2)
+
+    def test_pagination_and_retrieve(self):
+        response, queries = self.get('/api/tickets/', {'fields': 'name', 'page_size': 2})
+        following, _ = self.get(response.data['next'])
+        self.assertEqual([row['name'] for row in response.data['results'] + following.data['results']], ['T2', 'T1', 'T0'])
+        self.assertEqual(len(queries), 1)
+        ticket = Ticket.objects.get(name='T0')
+        response, _ = self.get(f'/api/tickets/{ticket.pk}/', {'fields': 'status'})
+        self.assertEqual(response.data, {'id': ticket.pk, 'status': 'OPEN'})
+
+    def test_project_client_collapses(self):
+        response, queries = self.get('/api/projects/', {'fields': 'id,name,client'})
+        self.assertEqual(response.data, [{'id': self.project.pk, 'name': 'Project', 'client': self.client_row.pk}])
+        self.assertFalse([sql for sql in queries if 'JOIN "core_client"' in sql])
+
+    def test_invalid_parameters(self):
+        response, _ = self.get('/api/tickets/', {'fields': 'id,bogus'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'fields': ['Unknown field: bogus.']})
+        response, _ = self.get('/api/tickets/', {'expand': 'name'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.get('/api/notifications/', {'fields': 'id,title'})[0].status_code, 200)
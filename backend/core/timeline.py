@@ -0,0 +1,74 @@
+"""
+Ticket activity timeline.
+
+TicketUpdate, TicketComment and TicketAttachement rows are projected into
+TicketActivity as they are saved, so rendering a ticket's history reads one
+table in (ticket, created_at) order instead of merging three tables and
+looking up each author. Edits refresh the entry's `data`; soft-deleting
+(`is_deleted=True`) or deleting the source removes the entry. Queryset
+`update()` calls bypass the signals and must call `sync()` themselves.
+"""
+from .models import Ticket, TicketActivity, TicketAttachement, TicketComment, TicketUpdate
+
+
+def _actor_name(user):
+    return (user.get_full_name() or user.username) if user is not None else ''
+
+
+def _update_data(update):
+    return {'text': update.update or '', 'status': update.status, 'priority': update.priority}
+
+
+def _comment_data(comment):
+    return {'text': comment.comment or '', 'update_id': comment.for_ticket_update_id}
+
+
+def _attachment_data(attachment):
+    return {'name': attachment.attachement.name, 'update_id': attachment.for_ticket_update_id}
+
+
+# Source model -> (kind, payload builder)
+SOURCES = {
+    TicketUpdate: (TicketActivity.KIND_UPDATE, _update_data),
+    TicketComment: (TicketActivity.KIND_COMMENT, _comment_data),
+    TicketAttachement: (TicketActivity.KIND_ATTACHMENT, _attachment_data),
+}
+
+
+def build_activity(instance, company_id=None):
+    kind, payload = SOURCES[type(instance)]
+    if company_id is None:
+        company_id = getattr(instance, 'attached_to_company_id', None) or Ticket.all_objects.filter(
+            pk=instance.ticket_id,
+        ).values_list('project__attached_to_company_id', flat=True).first()
+    return TicketActivity(
+        ticket_id=instance.ticket_id,
+        company_id=company_id,
+        kind=kind,
+        source_id=instance.pk,
+        actor_id=instance.created_by_id,
+        actor_name=_actor_name(instance.created_by),
+        data=payload(instance),
+        created_at=instance.created_at,
+    )
+
+
+def record(instance):
+    """Append the timeline entry for a newly created update, comment or attachment."""
+    TicketActivity.all_objects.bulk_create([build_activity(instance)], ignore_conflicts=True)
+
+
+def forget(instance):
+    kind, _ = SOURCES[type(instance)]
+    TicketActivity.all_objects.filter(kind=kind, source_id=instance.pk).delete()
+
+
+def sync(instance):
+    """Bring the entry for a saved update, comment or attachment in line with it."""
+    if instance.is_deleted:
+        forget(instance)
+        return
+    kind, payload = SOURCES[type(instance)]
+    # Restored rows have no entry left to update.
+    if not TicketActivity.all_objects.filter(kind=kind, source_id=instance.pk).update(data=payload(instance)):
+        record(instance)
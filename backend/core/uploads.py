@@ -0,0 +1,264 @@
+"""
+Resumable, chunked uploads for ticket attachments and profile pictures.
+
+A client opens an UploadSession with the file's name, size and (optionally)
+SHA-256, then PUTs consecutive chunks; each chunk is streamed from the request
+straight onto a part file, never buffered whole. After a dropped connection the
+client asks for the session's `offset` and continues from there. When the last
+byte arrives the session turns PROCESSING and the request returns; after
+commit, `finish_upload` (on core.background, not the request) hashes,
+verifies and moves the part file into storage outside any transaction, then
+attaches it and marks the session COMPLETE in a short one. Clients poll the
+session for the outcome; sessions a restart left PROCESSING are picked up
+again by `resume_stalled_uploads` (`manage.py resume_uploads`). Part files
+live in UPLOAD_TEMP_DIR, outside the served media. Attachments go to the content-addressed store
+(core.storage), where known content costs no write, and when the client
+sends the hash of content its company already holds the upload completes
+without any bytes. Profile picture thumbnails are rendered the same way.
+"""
+import datetime
+import hashlib
+import io
+import logging
+import os
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from . import blobs
+from .background import defer
+from .models import Profile, TicketAttachement, UploadSession
+
+logger = logging.getLogger(__name__)
+
+COPY_BLOCK_SIZE = 64 * 1024
+# PROCESSING this long means the process finishing the upload went away.
+STALLED_AFTER = datetime.timedelta(minutes=10)
+
+
+class UploadError(Exception):
+    pass
+
+
+class OffsetMismatch(UploadError):
+    """The chunk does not start where the session left off."""
+    def __init__(self, offset):
+        super().__init__(f'Expected offset {offset}.')
+        self.offset = offset
+
+
+class PartFile(File):
+    """
+    A finished part file with its known digest. Storages move it instead of
+    copying, and the content-addressed storage skips re-hashing it.
+    """
+    def __init__(self, file, sha256=None):
+        super().__init__(file)
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def part_path(session):
+    return os.path.join(settings.UPLOAD_TEMP_DIR, f'{session.pk}.part')
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(COPY_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def attachment_storage():
+    return TicketAttachement._meta.get_field('attachement').storage
+
+
+def find_stored_attachment(sha256, company_id):
+    """Name of stored content with this hash already attached within the company, or None."""
+    if not sha256:
+        return None
+    name = TicketAttachement.all_objects.filter(
+        content_hash=sha256, ticket__project__attached_to_company_id=company_id,
+    ).exclude(attachement='').order_by('pk').values_list('attachement', flat=True).first()
+    return name if name and attachment_storage().exists(name) else None
+
+
+def start_upload(user, kind, filename, size, sha256='', ticket_update=None):
+    """
+    Open an upload session. For attachments whose `sha256` matches stored
+    content the session is completed on the spot.
+    """
+    if size < 0 or size > settings.UPLOAD_MAX_SIZE:
+        raise UploadError(f'size must be between 0 and {settings.UPLOAD_MAX_SIZE} bytes.')
+    if kind == UploadSession.KIND_ATTACHMENT and ticket_update is None:
+        raise UploadError('Attachments need a ticket update.')
+    session = UploadSession.objects.create(
+        user=user, kind=kind, filename=os.path.basename(filename), size=size,
+        sha256=(sha256 or '').lower(), ticket_update=ticket_update,
+    )
+    if kind == UploadSession.KIND_ATTACHMENT:
+        # Claiming content by hash alone is only allowed within the company
+        # that already holds it; otherwise the bytes must be sent.
+        company_id = ticket_update.ticket.project.attached_to_company_id
+        name = find_stored_attachment(session.sha256, company_id)
+        if name is not None:
+            with transaction.atomic():
+                _attach(session, name, session.sha256)
+                _mark_complete(session, session.sha256)
+    return session
+
+
+def append_chunk(session_id, offset, stream, length):
+    """
+    Append `length` bytes read from `stream` at `offset`; once the last byte
+    lands the upload is finished in the background. Returns the updated session.
+    """
+    if length > settings.UPLOAD_MAX_CHUNK_SIZE:
+        raise UploadError(f'Chunks are limited to {settings.UPLOAD_MAX_CHUNK_SIZE} bytes.')
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(pk=session_id)
+        if session.status != UploadSession.STATUS_PENDING:
+            raise UploadError(f'Upload is {session.status.lower()}.')
+        if offset != session.offset:
+            raise OffsetMismatch(session.offset)
+        if session.offset + length > session.size:
+            raise UploadError('Chunk runs past the declared size.')
+
+        path = part_path(session)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        written = 0
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') as part:
+            part.seek(offset)
+            part.truncate()
+            while written < length:
+                block = stream.read(min(COPY_BLOCK_SIZE, length - written))
+                if not block:
+                    break
+                part.write(block)
+                written += len(block)
+        session.offset += written
+        if session.offset == session.size:
+            session.status = UploadSession.STATUS_PROCESSING
+            defer(finish_upload, session.pk)
+        session.save(update_fields=['offset', 'status', 'updated_at'])
+    return session
+
+
+def _fail(session, error):
+    session.status = UploadSession.STATUS_FAILED
+    session.error = error
+    session.save(update_fields=['status', 'error', 'updated_at'])
+
+
+def finish_upload(session_id):
+    """Hash, verify and store a fully received upload, then complete its session."""
+    session = UploadSession.objects.select_related('ticket_update', 'user').get(pk=session_id)
+    if session.status != UploadSession.STATUS_PROCESSING:
+        return
+    try:
+        _store(session)
+    except Exception:
+        logger.exception('Could not store upload %s', session.pk)
+        _fail(session, 'The upload could not be stored.')
+
+
+def resume_stalled_uploads(stalled_after=STALLED_AFTER):
+    """Run `finish_upload` for sessions PROCESSING for longer than `stalled_after`. Returns the count."""
+    cutoff = timezone.now() - stalled_after
+    stalled = UploadSession.objects.filter(status=UploadSession.STATUS_PROCESSING, updated_at__lt=cutoff)
+    resumed = 0
+    for pk in list(stalled.values_list('pk', flat=True)):
+        # Touching the session claims it, so an overlapping sweep skips it.
+        if stalled.filter(pk=pk).update(updated_at=timezone.now()):
+            finish_upload(pk)
+            resumed += 1
+    return resumed
+
+
+def _store(session):
+    path = part_path(session)
+    if not os.path.exists(path):
+        if session.size:
+            # Moved into storage by a run that died before attaching it.
+            _fail(session, 'The upload was interrupted; please upload the file again.')
+            return
+        open(path, 'wb').close()
+    digest = file_sha256(path)
+    if session.sha256 and session.sha256 != digest:
+        os.remove(path)
+        _fail(session, 'Content does not match the declared sha256.')
+        return
+    with open(path, 'rb') as handle:
+        content = PartFile(handle, sha256=digest)
+        if session.kind == UploadSession.KIND_ATTACHMENT:
+            # Keeps blob garbage collection off this content until the
+            # attachment row below references it.
+            blobs.hold(digest)
+            name = attachment_storage().save(session.filename, content)
+        else:
+            upload_to = Profile._meta.get_field('profile_picture').upload_to
+            name = default_storage.save(os.path.join(upload_to, session.filename), content)
+    if os.path.exists(path):
+        os.remove(path)
+    with transaction.atomic():
+        if session.kind == UploadSession.KIND_ATTACHMENT:
+            _attach(session, name, digest)
+        else:
+            _set_profile_picture(session, name)
+        _mark_complete(session, digest)
+
+
+def _attach(session, name, digest):
+    update = session.ticket_update
+    session.attachment = TicketAttachement.objects.create(
+        ticket_id=update.ticket_id,
+        for_ticket_update=update,
+        attachement=name,
+        filename=session.filename,
+        created_by=session.user,
+        content_hash=digest,
+        size=session.size,
+    )
+
+
+def _set_profile_picture(session, name):
+    profile, _ = Profile.objects.get_or_create(user=session.user)
+    profile.profile_picture = name
+    profile.profile_picture_thumbnail = ''
+    profile.save(update_fields=['profile_picture', 'profile_picture_thumbnail', 'updated_at'])
+    defer(generate_thumbnail, profile.pk, name)
+
+
+def _mark_complete(session, digest):
+    session.offset = session.size
+    session.sha256 = digest
+    session.status = UploadSession.STATUS_COMPLETE
+    session.save(update_fields=['attachment', 'offset', 'sha256', 'status', 'updated_at'])
+
+
+def generate_thumbnail(profile_id, picture_name):
+    """Render the thumbnail for `picture_name` unless the picture changed meanwhile."""
+    with default_storage.open(picture_name, 'rb') as source:
+        image = Image.open(source)
+        image.thumbnail(settings.THUMBNAIL_SIZE)
+        if image.mode not in ('RGB', 'RGBA', 'L'):
+            image = image.convert('RGBA')
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG')
+    upload_to = Profile._meta.get_field('profile_picture_thumbnail').upload_to
+    stem = os.path.splitext(os.path.basename(picture_name))[0]
+    thumbnail = default_storage.save(os.path.join(upload_to, f'{stem}.png'), ContentFile(buffer.getvalue()))
+    updated = Profile.objects.filter(pk=profile_id, profile_picture=picture_name).update(
+        profile_picture_thumbnail=thumbnail,
+    )
+    if not updated:
+        default_storage.delete(thumbnail)
+    return bool(updated)
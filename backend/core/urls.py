@@ -1,11 +1,26 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import UserViewSet, CompanyViewSet
+from .views import (
+    UserViewSet, CompanyViewSet, NotificationViewSet, ProjectViewSet, TicketViewSet, PunchIngestView, AttendanceReportView,
+    AttendanceExportView, SearchView, UploadSessionCreateView, UploadSessionView, AttachmentDownloadView, ProfilePictureView, event_stream,
+)
 
 router = DefaultRouter()
 router.register(r'users', UserViewSet)
 router.register(r'companies', CompanyViewSet)
+router.register(r'projects', ProjectViewSet)
+router.register(r'tickets', TicketViewSet)
+router.register(r'notifications', NotificationViewSet, basename='notification')
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('attendance/punches/', PunchIngestView.as_view(), name='attendance-punches'),
+    path('reports/attendance/', AttendanceReportView.as_view(), name='attendance-report'),
+    path('exports/attendance/', AttendanceExportView.as_view(), name='attendance-export'),
+    path('search/', SearchView.as_view(), name='search'),
+    path('uploads/', UploadSessionCreateView.as_view(), name='upload-create'),
+    path('uploads/<uuid:pk>/', UploadSessionView.as_view(), name='upload-detail'),
+    path('attachments/<int:pk>/download/', AttachmentDownloadView.as_view(), name='attachment-download'),
+    path('users/<int:pk>/picture/', ProfilePictureView.as_view(), name='user-picture'),
+    path('events/', event_stream, name='events'),
 ]
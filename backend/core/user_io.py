@@ -0,0 +1,325 @@
+"""
+Bulk user import and export.
+
+Imports read CSV or XLSX row by row (never the whole file), validate a chunk
+of IMPORT_CHUNK_SIZE rows against the file and the database with one query
+per kind of lookup, hash the chunk's passwords on the core.passwords pool (or
+take a `password_hash` migrated from another system, wrapping legacy ones) and
+write its User, Profile, Employee and CompanyMembership rows with one
+bulk_create each in a transaction of its own. A bad row is reported and
+skipped; it never rolls back the rows around it. Managers are resolved by
+email once every chunk is in, so a manager may appear after their reports.
+
+Uploads through the API are queued as UserImport rows and run by a worker
+process (`manage.py import_users --queued`, see `run_queued_import()`), so a
+large file never holds a web request or puts a process pool in a web worker.
+
+Exports stream CSV from a server-side cursor, a chunk of rows at a time.
+"""
+import csv
+import datetime
+import io
+import logging
+import os
+from dataclasses import dataclass, field
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.hashers import identify_hasher
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery
+from django.utils import timezone
+
+from .models import CompanyMembership, Designation, Employee, Profile, User, UserImport
+from .passwords import bulk_create_users, wrap_legacy_hashes
+
+logger = logging.getLogger(__name__)
+
+IMPORT_CHUNK_SIZE = 500
+EXPORT_CHUNK_SIZE = 2000
+MAX_ERRORS = 1000
+
+COLUMNS = [
+    'email', 'username', 'first_name', 'last_name', 'password', 'password_hash', 'is_admin', 'is_employee',
+    'manager_email', 'designation', 'role', 'phone', 'address', 'personal_email',
+]
+REQUIRED = ('email',)
+PROFILE_FIELDS = ('phone', 'address', 'personal_email')
+EXPORT_COLUMNS = [column for column in COLUMNS if column not in ('password', 'password_hash')] + ['is_active', 'date_joined']
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'x'}
+
+
+class ImportFormatError(Exception):
+    pass
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    errors: list = field(default_factory=list)
+    managers_linked: int = 0
+
+    def error(self, line, message):
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+
+def _clean(value):
+    return '' if value is None else str(value).strip()
+
+
+def _csv_rows(file):
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    try:
+        for row in csv.DictReader(text):
+            yield {(key or '').strip().lower(): _clean(value) for key, value in row.items()}
+    finally:
+        text.detach()
+
+
+def _xlsx_rows(file):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportFormatError('XLSX import needs openpyxl installed.')
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [_clean(cell).lower() for cell in next(rows, ())]
+        for values in rows:
+            if any(value is not None for value in values):
+                yield {key: _clean(value) for key, value in zip(header, values) if key}
+    finally:
+        workbook.close()
+
+
+READERS = {'.csv': _csv_rows, '.xlsx': _xlsx_rows}
+
+
+def check_format(filename):
+    """The row reader for `filename`, or ImportFormatError for an unsupported file."""
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension not in READERS:
+        raise ImportFormatError('Upload a .csv or .xlsx file.')
+    return READERS[extension]
+
+
+def read_rows(file, filename):
+    """Rows of the uploaded file as dicts keyed by lower-cased header."""
+    return check_format(filename)(file)
+
+
+def _flag(value):
+    return value.lower() in TRUE_VALUES
+
+
+def _known_hash(encoded):
+    try:
+        identify_hasher(encoded)
+    except ValueError:
+        return False
+    return True
+
+
+def _validate(chunk, result, seen):
+    """Rows of the chunk that may be created, as (line, row) pairs."""
+    candidates = []
+    for line, row in chunk:
+        row['email'] = row.get('email', '').lower()
+        row['username'] = row.get('username') or row['email']
+        missing = [column for column in REQUIRED if not row.get(column)]
+        if missing:
+            result.error(line, f"Missing {', '.join(missing)}.")
+            continue
+        try:
+            validate_email(row['email'])
+        except ValidationError:
+            result.error(line, f"Invalid email {row['email']}.")
+            continue
+        role = (row.get('role') or CompanyMembership.ROLE_MEMBER).upper()
+        if role not in dict(CompanyMembership.ROLE_CHOICES):
+            result.error(line, f"Unknown role {row['role']}.")
+            continue
+        row['role'] = role
+        if row['email'] in seen['email'] or row['username'] in seen['username']:
+            result.error(line, 'Duplicate email or username in file.')
+            continue
+        seen['email'].add(row['email'])
+        seen['username'].add(row['username'])
+        candidates.append((line, row))
+
+    taken = list(User.all_objects.filter(
+        Q(email__in=[row['email'] for _, row in candidates]) | Q(username__in=[row['username'] for _, row in candidates])
+    ).values_list('email', 'username'))
+    taken_emails = {email.lower() for email, _ in taken}
+    taken_usernames = {username for _, username in taken}
+    designations = dict(
+        Designation.objects.filter(
+            name__in={row['designation'] for _, row in candidates if row.get('designation')}, is_deleted=False,
+        ).values_list('name', 'pk')
+    )
+
+    valid = []
+    for line, row in candidates:
+        if row['email'] in taken_emails or row['username'] in taken_usernames:
+            result.error(line, 'A user with this email or username already exists.')
+        elif row.get('designation') and row['designation'] not in designations:
+            result.error(line, f"Unknown designation {row['designation']}.")
+        elif row.get('password_hash') and not _known_hash(row['password_hash']):
+            result.error(line, 'Unrecognised password_hash format.')
+        else:
+            row['designation_id'] = designations.get(row.get('designation'))
+            valid.append((line, row))
+    # Migrated hashes are kept, legacy ones wrapped in PBKDF2 (core.passwords).
+    hashes = wrap_legacy_hashes(row.get('password_hash', '') for _, row in valid)
+    for (_, row), encoded in zip(valid, hashes):
+        row['encoded_password'] = encoded
+    return valid
+
+
+def _create_chunk(rows, company, created_by):
+    users = [
+        User(
+            email=row['email'], username=row['username'], password=row['encoded_password'],
+            first_name=row.get('first_name', ''), last_name=row.get('last_name', ''),
+            is_admin=_flag(row.get('is_admin', '')),
+            is_employee=_flag(row.get('is_employee', '')) or bool(row['designation_id']),
+            company=company, created_by=created_by,
+        )
+        for _, row in rows
+    ]
+    with transaction.atomic():
+        users = bulk_create_users(users, [row.get('password') for _, row in rows])
+        Profile.objects.bulk_create([
+            Profile(user=user, **{name: row.get(name, '') for name in PROFILE_FIELDS})
+            for user, (_, row) in zip(users, rows)
+        ])
+        Employee.objects.bulk_create([
+            Employee(user=user, designation_id=row['designation_id'])
+            for user, (_, row) in zip(users, rows) if row['designation_id']
+        ])
+        # Audited and invalidated by PermissionStateQuerySet.bulk_create.
+        CompanyMembership.objects.bulk_create([
+            CompanyMembership(user=user, company=company, role=row['role'])
+            for user, (_, row) in zip(users, rows)
+        ])
+    return users
+
+
+def _link_managers(pending, company, result):
+    """Set manager_id from manager emails: [(line, user_id, manager_email)]."""
+    for start in range(0, len(pending), IMPORT_CHUNK_SIZE):
+        batch = pending[start:start + IMPORT_CHUNK_SIZE]
+        managers = dict(
+            User.all_objects.filter(
+                company=company, email__in={email for _, _, email in batch}, is_deleted=False,
+            ).values_list('email', 'pk')
+        )
+        updates = []
+        for line, user_id, email in batch:
+            if email in managers:
+                updates.append(User(pk=user_id, manager_id_id=managers[email]))
+            else:
+                result.error(line, f'Unknown manager {email}; user created without one.')
+        User.all_objects.bulk_update(updates, ['manager_id'])
+        result.managers_linked += len(updates)
+
+
+def import_users(rows, company, created_by=None, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    """
+    Create users for `company` from an iterable of row dicts. Returns an
+    ImportResult; `progress`, if given, is called with it after each chunk.
+    """
+    result = ImportResult()
+    seen = {'email': set(), 'username': set()}
+    pending_managers = []
+    # Line 1 is the header.
+    numbered = enumerate(rows, start=2)
+    while True:
+        chunk = list(islice(numbered, chunk_size))
+        if not chunk:
+            break
+        valid = _validate(chunk, result, seen)
+        if valid:
+            users = _create_chunk(valid, company, created_by)
+            result.created += len(users)
+            pending_managers += [
+                (line, user.pk, row['manager_email'].lower())
+                for user, (line, row) in zip(users, valid) if row.get('manager_email')
+            ]
+        if progress is not None:
+            progress(result)
+    _link_managers(pending_managers, company, result)
+    return result
+
+
+def run_queued_import():
+    """
+    Claim the oldest pending UserImport, or a RUNNING one whose worker has made
+    no progress for USER_IMPORT_STALE_AFTER seconds, and run it. Rows a dead
+    worker already created are reported as existing. Returns the job, or None
+    when there is nothing to claim.
+    """
+    stale = timezone.now() - datetime.timedelta(seconds=settings.USER_IMPORT_STALE_AFTER)
+    with transaction.atomic():
+        job = UserImport.objects.select_for_update(skip_locked=True).filter(
+            Q(status=UserImport.STATUS_PENDING) | Q(status=UserImport.STATUS_RUNNING, updated_at__lt=stale),
+        ).order_by('pk').first()
+        if job is None:
+            return None
+        if job.status == UserImport.STATUS_RUNNING:
+            logger.warning('Re-claiming stale user import %s', job.pk)
+        job.status = UserImport.STATUS_RUNNING
+        job.started_at = timezone.now()
+        job.save(update_fields=['status', 'started_at', 'updated_at'])
+
+    def heartbeat(result):
+        UserImport.objects.filter(pk=job.pk).update(created=result.created, updated_at=timezone.now())
+
+    try:
+        with job.file.open('rb') as handle:
+            result = import_users(
+                read_rows(handle, job.filename), job.company, created_by=job.created_by, progress=heartbeat,
+            )
+    except ImportFormatError as exc:
+        job.status, job.error = UserImport.STATUS_FAILED, str(exc)
+    except Exception:
+        logger.exception('User import %s failed', job.pk)
+        job.status, job.error = UserImport.STATUS_FAILED, 'The import failed; rows before the failure were created.'
+    else:
+        job.status = UserImport.STATUS_COMPLETE
+        job.created, job.managers_linked, job.errors = result.created, result.managers_linked, result.errors
+    # The file may hold passwords; it is not kept once the job is done.
+    job.file.delete(save=False)
+    job.finished_at = timezone.now()
+    job.save()
+    return job
+
+
+def export_rows(company):
+    """Rows of EXPORT_COLUMNS for the company's users, streamed from the database."""
+    role = CompanyMembership.objects.filter(user=OuterRef('pk'), company=company).values('role')[:1]
+    users = User.all_objects.filter(company=company, is_deleted=False).annotate(role=Subquery(role)).order_by('pk')
+    return users.values_list(
+        'email', 'username', 'first_name', 'last_name', 'is_admin', 'is_employee',
+        'manager_id__email', 'employee__designation__name', 'role',
+        'profile__phone', 'profile__address', 'profile__personal_email', 'is_active', 'date_joined',
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def export_csv(company):
+    """CSV for the company's users, header first, EXPORT_CHUNK_SIZE rows per chunk."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    rows = export_rows(company)
+    while True:
+        chunk = list(islice(rows, EXPORT_CHUNK_SIZE))
+        writer.writerows(['' if value is None else value for value in row] for row in chunk)
+        yield buffer.getvalue()
+        if len(chunk) < EXPORT_CHUNK_SIZE:
+            return
+        buffer.seek(0)
+        buffer.truncate()
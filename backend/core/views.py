@@ -1,21 +1,377 @@
-from rest_framework import viewsets
-from .models import User, Company
+import asyncio
+import datetime
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from .models import User, Company, ArchivedNotification, Notification, Profile, Project, Ticket, TicketActivity, TicketAttachement, UploadSession, UserImport
 from rest_framework.serializers import ModelSerializer
+from . import boards, events, exports, notifications, rbac, serializers, uploads, user_io
+from .attendance import ingest_punches
+from .compiled_serializers import CompiledListMixin
+from .fieldsets import SparseFieldsMixin
+from .files import serve_file
+from .filters import ProjectPermissionFilter
+from .pagination import KeysetPagination, NotificationPagination, TimelinePagination
+from .reporting import GROUPINGS, attendance_report
+from .search import DEFAULT_LIMIT, KINDS, search
+from .security import HasCompanyPermission, HasProjectPermission, IsCompanyAdmin
+from .streaming import StreamingResponse
+from .serializers import (
+    ArchivedNotificationSerializer, NotificationSerializer, ProjectSerializer, TicketActivitySerializer,
+    TicketSerializer, UploadSessionSerializer, UserImportSerializer,
+)
+from .tenancy import TenantScopedMixin
 
-class UserSerializer(ModelSerializer):
-    class Meta:
-        model = User
+class UserSerializer(serializers.UserSerializer):
+    class Meta(serializers.UserSerializer.Meta):
         fields = ['id', 'email', 'username', 'first_name', 'last_name', 'company']
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(SparseFieldsMixin, CompiledListMixin, TenantScopedMixin, viewsets.ModelViewSet):
+    """
+    Users of the current company. Company admins can POST a CSV or XLSX
+    `file` to `import` (see core.user_io for the columns), which queues it
+    for the import worker and answers 202 with the job to poll at
+    `import/<id>/`, and stream the directory as CSV from `export`. Changing
+    users needs `company.users.manage` on the company.
+    """
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    permission_classes = [IsAuthenticated, HasCompanyPermission]
+    required_company_permission = 'company.users.manage'
+
+    @action(detail=False, methods=['post'], url_path='import', permission_classes=[IsCompanyAdmin],
+            parser_classes=[MultiPartParser])
+    def bulk_import(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'file': ['No file was submitted.']}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            user_io.check_format(upload.name)
+        except user_io.ImportFormatError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        job = UserImport.objects.create(
+            company=request.user.company, created_by=request.user, file=upload, filename=upload.name,
+        )
+        location = request.build_absolute_uri(f'{job.pk}/')
+        return Response(UserImportSerializer(job).data, status=status.HTTP_202_ACCEPTED, headers={'Location': location})
+
+    @action(detail=False, url_path=r'import/(?P<import_id>[0-9]+)', permission_classes=[IsCompanyAdmin])
+    def import_status(self, request, import_id=None):
+        job = get_object_or_404(UserImport, pk=import_id, company=request.user.company)
+        return Response(UserImportSerializer(job).data)
+
+    @action(detail=False, url_path='export', permission_classes=[IsCompanyAdmin])
+    def export(self, request):
+        response = StreamingResponse(user_io.export_csv(request.user.company), content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="users.csv"'
+        return response
 
 class CompanySerializer(ModelSerializer):
     class Meta:
         model = Company
         fields = '__all__'
 
-class CompanyViewSet(viewsets.ModelViewSet):
+class CompanyViewSet(SparseFieldsMixin, TenantScopedMixin, viewsets.ModelViewSet):
+    """The user's company. Changing it needs `company.manage`."""
     queryset = Company.objects.all()
     serializer_class = CompanySerializer
+    permission_classes = [IsAuthenticated, HasCompanyPermission]
+    required_company_permission = 'company.manage'
+
+class ProjectViewSet(SparseFieldsMixin, CompiledListMixin, TenantScopedMixin, viewsets.ReadOnlyModelViewSet):
+    """Projects the user may view, filtered by the RBAC tables in SQL."""
+    queryset = Project.objects.select_related('client').order_by('id')
+    serializer_class = ProjectSerializer
+    permission_classes = [IsAuthenticated, HasProjectPermission]
+    filter_backends = [ProjectPermissionFilter]
+    required_project_permission = 'project.view'
+
+class TicketViewSet(SparseFieldsMixin, CompiledListMixin, TenantScopedMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Tickets on projects the user may view, newest activity first. Each page
+    costs a fixed number of queries (see TicketQuerySet.for_list) and is
+    addressed by keyset cursor, so deep pages cost the same as the first.
+    Filter with ?project=<id>. /tickets/<id>/timeline/ pages through the
+    ticket's activity, newest first. ?fields= and ?expand= trim the columns
+    and joins (see core.fieldsets).
+    """
+    queryset = Ticket.objects.all()
+    serializer_class = TicketSerializer
+    permission_classes = [IsAuthenticated, HasProjectPermission]
+    filter_backends = [ProjectPermissionFilter]
+    pagination_class = KeysetPagination
+    required_project_permission = 'project.view'
+    project_field = 'project'
+    sparse_prefetches = {'assigned_to': 'with_assignees'}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            queryset = queryset.for_list()
+        project = self.request.query_params.get('project')
+        if project is not None:
+            queryset = queryset.filter(project_id=project) if project.isdigit() else queryset.none()
+        return queryset
+
+    @action(detail=False)
+    def board(self, request):
+        """Status, priority and assignee counts for ?project=<id>, or every visible project."""
+        project = request.query_params.get('project')
+        if project is None:
+            project_ids = boards.visible_project_ids(request.user)
+        elif project.isdigit() and Project.objects.filter(pk=project).exists() and rbac.has_project_perm(
+            request.user, boards.BOARD_PERMISSION, int(project),
+        ):
+            project_ids = [int(project)]
+        else:
+            return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(boards.board_counts(project_ids))
+
+    @action(detail=True, pagination_class=TimelinePagination)
+    def timeline(self, request, pk=None):
+        ticket = self.get_object()
+        page = self.paginate_queryset(TicketActivity.all_objects.filter(ticket_id=ticket.pk))
+        return self.get_paginated_response(TicketActivitySerializer(page, many=True).data)
+
+class PunchIngestView(APIView):
+    """
+    Bulk check-in/check-out ingestion for badge readers and kiosks. Accepts a
+    list of punches (or {"punches": [...]}) and reports per-row errors.
+    """
+    permission_classes = [IsCompanyAdmin]
+
+    def post(self, request):
+        punches = request.data.get('punches') if isinstance(request.data, dict) else request.data
+        if not isinstance(punches, list):
+            return Response({'detail': 'Expected a list of punches.'}, status=status.HTTP_400_BAD_REQUEST)
+        report = ingest_punches(punches, company=request.user.company)
+        code = status.HTTP_201_CREATED if report['created'] or not punches else status.HTTP_400_BAD_REQUEST
+        return Response(report, status=code)
+
+def month_range(request):
+    """The `from` and `to` query params (YYYY-MM, default this month) as first-of-month dates."""
+    this_month = datetime.date.today().strftime('%Y-%m')
+    start = datetime.date.fromisoformat(f"{request.query_params.get('from', this_month)}-01")
+    end = datetime.date.fromisoformat(f"{request.query_params.get('to', this_month)}-01")
+    return start, end
+
+class AttendanceReportView(APIView):
+    """
+    Attendance totals from the monthly rollups.
+    Query params: from, to (YYYY-MM, default this month), group_by
+    (user, department or company) and by_month=1 for a per-month breakdown.
+    """
+    permission_classes = [IsCompanyAdmin]
+
+    def get(self, request):
+        try:
+            start, end = month_range(request)
+        except ValueError:
+            return Response({'detail': 'from and to must be months (YYYY-MM).'}, status=status.HTTP_400_BAD_REQUEST)
+        group_by = request.query_params.get('group_by', 'user')
+        if group_by not in GROUPINGS:
+            return Response(
+                {'detail': f'group_by must be one of {", ".join(GROUPINGS)}.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        by_month = request.query_params.get('by_month') in ('1', 'true')
+        rows = attendance_report(request.user.company, start, end, group_by=group_by, by_month=by_month)
+        return Response({'from': start, 'to': end, 'group_by': group_by, 'results': rows})
+
+class AttendanceExportView(APIView):
+    """
+    Streams the company's attendance, one row per time log, for payroll.
+    Query params: from, to (YYYY-MM, default this month) and as (csv, jsonl
+    or parquet).
+    """
+    permission_classes = [IsCompanyAdmin]
+
+    def get(self, request):
+        try:
+            start, end = month_range(request)
+        except ValueError:
+            return Response({'detail': 'from and to must be months (YYYY-MM).'}, status=status.HTTP_400_BAD_REQUEST)
+        export_format = request.query_params.get('as', 'csv')
+        try:
+            chunks = exports.export_attendance(request.user.company, start, end, export_format)
+        except exports.ExportError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        response = StreamingResponse(chunks, content_type=exports.FORMATS[export_format])
+        filename = f"attendance-{start:%Y-%m}-{end:%Y-%m}.{export_format}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+class SearchView(APIView):
+    """
+    Keyword search across projects, tickets, updates and comments the user
+    may view. Query params: q, type (comma-separated subset of
+    project, ticket, update, comment) and limit.
+    """
+    def get(self, request):
+        kinds = [kind for kind in request.query_params.get('type', '').split(',') if kind]
+        unknown = set(kinds) - set(KINDS)
+        if unknown:
+            return Response(
+                {'detail': f'Unknown type: {", ".join(sorted(unknown))}.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            limit = int(request.query_params.get('limit', DEFAULT_LIMIT))
+        except ValueError:
+            return Response({'detail': 'limit must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+        query = request.query_params.get('q', '')
+        return Response({'q': query, 'results': search(request.user, query, kinds=kinds, limit=limit)})
+
+class UploadSessionCreateView(APIView):
+    """
+    Opens a resumable upload: POST kind, filename, size, optional sha256 and,
+    for attachments, ticket_update. Content already stored for the company
+    completes immediately.
+    """
+    def post(self, request):
+        serializer = UploadSessionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        update = data.get('ticket_update')
+        if update is not None and not (
+            Ticket.objects.filter(pk=update.ticket_id).exists()
+            and rbac.has_project_perm(request.user, 'project.view', update.ticket.project_id)
+        ):
+            return Response({'ticket_update': ['Not found.']}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            session = uploads.start_upload(
+                request.user, data['kind'], data['filename'], data['size'],
+                sha256=data.get('sha256', ''), ticket_update=update,
+            )
+        except uploads.UploadError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+
+class UploadSessionView(APIView):
+    """
+    GET reports the offset to resume from, and once the last chunk is in,
+    whether the upload is still PROCESSING, COMPLETE or FAILED. PUT appends
+    the raw request body at the `Upload-Offset` header; a stale offset gets
+    409 with the current one.
+    """
+    def get_session(self, request, pk):
+        return get_object_or_404(UploadSession, pk=pk, user=request.user)
+
+    def get(self, request, pk):
+        return Response(UploadSessionSerializer(self.get_session(request, pk)).data)
+
+    def put(self, request, pk):
+        session = self.get_session(request, pk)
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            length = int(request.headers.get('Content-Length') or 0)
+        except ValueError:
+            return Response({'detail': 'Upload-Offset header is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            session = uploads.append_chunk(session.pk, offset, request.stream, length)
+        except uploads.OffsetMismatch as exc:
+            return Response({'detail': str(exc), 'offset': exc.offset}, status=status.HTTP_409_CONFLICT)
+        except uploads.UploadError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(UploadSessionSerializer(session).data)
+
+class AttachmentDownloadView(APIView):
+    def get(self, request, pk):
+        attachment = get_object_or_404(TicketAttachement.objects.select_related('ticket'), pk=pk)
+        if not rbac.has_project_perm(request.user, 'project.view', attachment.ticket.project_id):
+            return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        return serve_file(request, attachment.attachement, filename=attachment.filename or None)
+
+class ProfilePictureView(APIView):
+    """A user's profile picture; ?size=thumbnail for the generated thumbnail."""
+    def get(self, request, pk):
+        user = get_object_or_404(User.objects.all(), pk=pk)
+        profile = Profile.objects.filter(user=user).first()
+        picture = profile and profile.profile_picture
+        if request.query_params.get('size') == 'thumbnail' and profile and profile.profile_picture_thumbnail:
+            picture = profile.profile_picture_thumbnail
+        if not picture:
+            return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        return serve_file(request, picture, as_attachment=False)
+
+class NotificationViewSet(SparseFieldsMixin, CompiledListMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    The user's notifications, newest first. `unread-count` reads the
+    maintained counter; `mark-read` takes `ids` and/or a `first_id`..`last_id`
+    range and returns the new unread count; `archive` pages through read
+    notifications moved out by core.retention.
+    """
+    serializer_class = NotificationSerializer
+    pagination_class = NotificationPagination
+
+    def get_queryset(self):
+        queryset = Notification.objects.filter(user=self.request.user)
+        if self.request.query_params.get('unread') in ('1', 'true'):
+            queryset = queryset.filter(is_read=False)
+        return queryset
+
+    @action(detail=False, url_path='unread-count')
+    def unread_count(self, request):
+        return Response({'unread': notifications.unread_count(request.user)})
+
+    @action(detail=False, methods=['post'], url_path='mark-read')
+    def mark_read(self, request):
+        ids = request.data.get('ids')
+        bounds = {key: request.data.get(key) for key in ('first_id', 'last_id')}
+        if ids is None and all(value is None for value in bounds.values()):
+            return Response({'detail': 'Give ids, first_id or last_id.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            ids = None if ids is None else [int(pk) for pk in ids]
+            bounds = {key: None if value is None else int(value) for key, value in bounds.items()}
+        except (TypeError, ValueError):
+            return Response({'detail': 'Ids must be integers.'}, status=status.HTTP_400_BAD_REQUEST)
+        marked = notifications.mark_read(request.user, ids=ids, **bounds)
+        return Response({'marked': marked, 'unread': notifications.unread_count(request.user)})
+
+    @action(detail=False)
+    def archive(self, request):
+        queryset = ArchivedNotification.objects.filter(user=request.user)
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(ArchivedNotificationSerializer(page, many=True).data)
+
+async def event_stream(request):
+    """
+    Server-sent events for the signed-in user (session auth): notifications,
+    ticket updates and attendance changes, with a heartbeat comment to keep
+    proxies from closing idle connections. Serve under ASGI so each open
+    connection is a coroutine rather than a worker thread.
+    """
+    # The tenant-scoped User manager reads request.user synchronously, so load it in a thread.
+    user = await sync_to_async(lambda: request.user if request.user.is_authenticated else None)()
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=403)
+    broker = events.get_broker()
+    heartbeat = settings.EVENTS_HEARTBEAT_SECONDS
+
+    async def stream():
+        # Subscribed only once streaming starts, so the finally always runs.
+        subscription = broker.subscribe(user.pk)
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    event = await subscription.get(heartbeat)
+                except asyncio.TimeoutError:
+                    yield ': ping\n\n'
+                    continue
+                yield events.format_sse(event)
+        finally:
+            broker.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response